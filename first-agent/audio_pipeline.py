@@ -0,0 +1,240 @@
+"""
+Server-side audio stage for Gemini Live input.
+
+The browser posts very small capture blocks (128 samples per AudioWorklet call),
+and forwarding each one as its own `send_realtime_input` call costs SDK and
+framing overhead hundreds of times a second. `AudioFrameAssembler` accepts PCM
+in the client's native format, resamples it to 16 kHz int16 with NumPy and
+emits fixed-duration frames. `EnergyVAD` optionally gates those frames so long
+stretches of silence are not streamed upstream.
+"""
+import numpy as np
+
+TARGET_RATE = 16000
+# 16 kHz mono int16
+TARGET_BYTES_PER_MS = TARGET_RATE * 2 // 1000
+MIN_FRAME_MS = 20
+MAX_FRAME_MS = 100
+
+SAMPLE_FORMATS = {"s16le": np.dtype("<i2"), "f32le": np.dtype("<f4")}
+
+
+class AudioFrameAssembler:
+    """Resample client PCM to 16 kHz int16 and cut it into `frame_ms` frames.
+
+    Resampling is linear interpolation with the fractional read position and
+    last input sample carried across calls, so block boundaries do not click.
+    Raw input is buffered until it covers a whole frame and then resampled in
+    one vectorized call, so NumPy runs once per frame rather than once per tiny
+    client message. When the client already sends 16 kHz int16 the bytes are
+    only sliced.
+    """
+
+    def __init__(self, sample_rate: int = TARGET_RATE, sample_format: str = "s16le", channels: int = 1, frame_ms: int = 40):
+        if sample_format not in SAMPLE_FORMATS:
+            raise ValueError(f"Unsupported sample format: {sample_format}")
+        if sample_rate <= 0 or channels <= 0:
+            raise ValueError("sample_rate and channels must be positive")
+        self.sample_rate = int(sample_rate)
+        self.sample_format = sample_format
+        self.channels = int(channels)
+        self.frame_ms = max(MIN_FRAME_MS, min(MAX_FRAME_MS, int(frame_ms)))
+        self.frame_bytes = self.frame_ms * TARGET_BYTES_PER_MS
+
+        self._dtype = SAMPLE_FORMATS[sample_format]
+        self._input_frame_bytes = self._dtype.itemsize * self.channels
+        self._passthrough = sample_format == "s16le" and self.sample_rate == TARGET_RATE and self.channels == 1
+        self._step = self.sample_rate / TARGET_RATE
+        self._input_batch_bytes = -(-self.frame_ms * self.sample_rate // 1000) * self._input_frame_bytes
+        self._pending = bytearray()
+        self._raw = bytearray()
+        self._carry = np.zeros(0, dtype=np.float32)
+        self._position = 0.0
+
+        self.messages_in = 0
+        self.bytes_in = 0
+        self.frames_out = 0
+
+    def _to_float(self, data) -> np.ndarray:
+        samples = np.frombuffer(data, dtype=self._dtype)
+        if self.channels > 1:
+            samples = samples.reshape(-1, self.channels).mean(axis=1)
+        if self._dtype.kind == "i":
+            return samples.astype(np.float32) / 32768.0
+        return samples.astype(np.float32, copy=False)
+
+    def _resample(self, samples: np.ndarray) -> np.ndarray:
+        x = np.concatenate((self._carry, samples)) if self._carry.size else samples
+        last = x.size - 1
+        if last < 1 or self._position > last:
+            self._carry = x[-1:].copy() if x.size else self._carry
+            self._position -= max(last, 0)
+            return np.zeros(0, dtype=np.int16)
+        count = int((last - self._position) // self._step) + 1
+        positions = self._position + self._step * np.arange(count)
+        y = np.interp(positions, np.arange(x.size), x)
+        self._position = self._position + count * self._step - last
+        # copy: x may be a view into the raw input buffer, which is resized afterwards
+        self._carry = x[-1:].copy()
+        return (np.clip(y, -1.0, 1.0) * 32767.0).astype("<i2")
+
+    def push(self, data) -> list[bytes]:
+        """Feed one client message; return the complete 16 kHz frames it produced."""
+        self.messages_in += 1
+        self.bytes_in += len(data)
+        if self._passthrough:
+            self._pending += data
+        else:
+            self._raw += data
+            if len(self._raw) >= self._input_batch_bytes:
+                self._convert_raw()
+        return self._drain()
+
+    def _convert_raw(self) -> None:
+        usable = len(self._raw) - len(self._raw) % self._input_frame_bytes
+        if not usable:
+            return
+        with memoryview(self._raw) as view:
+            self._pending += self._resample(self._to_float(view[:usable])).tobytes()
+        del self._raw[:usable]
+
+    def _drain(self) -> list[bytes]:
+        frame_bytes = self.frame_bytes
+        ready = len(self._pending) // frame_bytes
+        if not ready:
+            return []
+        view = memoryview(self._pending)
+        frames = [bytes(view[i * frame_bytes:(i + 1) * frame_bytes]) for i in range(ready)]
+        view.release()
+        del self._pending[:ready * frame_bytes]
+        self.frames_out += ready
+        return frames
+
+    def flush(self) -> bytes | None:
+        """Return the buffered partial frame, if any (e.g. before audio_stream_end)."""
+        if self._raw:
+            self._convert_raw()
+        if not self._pending:
+            return None
+        frame = bytes(self._pending)
+        self._pending.clear()
+        self.frames_out += 1
+        return frame
+
+    def reset(self) -> None:
+        """Drop buffered audio and resampler state."""
+        self._pending.clear()
+        self._raw.clear()
+        self._carry = np.zeros(0, dtype=np.float32)
+        self._position = 0.0
+
+    def stats(self) -> dict:
+        return {
+            "sample_rate": self.sample_rate,
+            "sample_format": self.sample_format,
+            "channels": self.channels,
+            "frame_ms": self.frame_ms,
+            "messages_in": self.messages_in,
+            "bytes_in": self.bytes_in,
+            "frames_out": self.frames_out,
+            "buffered_bytes": len(self._pending) + len(self._raw),
+        }
+
+
+class EnergyVAD:
+    """Energy-based voice activity gate for 16 kHz int16 frames.
+
+    A frame is speech when its RMS level (dBFS) is above both `threshold_dbfs`
+    and the tracked noise floor plus `margin_db`. Silent frames are held in a
+    pre-roll buffer so the start of an utterance is not clipped, and forwarding
+    continues for `hangover_ms` after the last speech frame so word endings and
+    short pauses are kept.
+    """
+
+    def __init__(self, frame_ms: int = 40, threshold_dbfs: float = -45.0, margin_db: float = 10.0,
+                 hangover_ms: int = 400, preroll_ms: int = 200):
+        self.frame_ms = frame_ms
+        self.threshold_dbfs = threshold_dbfs
+        self.margin_db = margin_db
+        self.hangover_frames = max(0, -(-hangover_ms // frame_ms))
+        self.preroll_frames = max(0, -(-preroll_ms // frame_ms))
+
+        self._preroll: list[bytes] = []
+        self._speaking = False
+        self._hangover_left = 0
+        self.noise_floor_dbfs = -90.0
+
+        self.forwarded_frames = 0
+        self.suppressed_frames = 0
+        self.utterances = 0
+
+    @staticmethod
+    def level_dbfs(frame: bytes) -> float:
+        samples = np.frombuffer(frame, dtype="<i2").astype(np.float32)
+        if not samples.size:
+            return -120.0
+        rms = float(np.sqrt(np.mean(samples * samples))) / 32768.0
+        return float(20.0 * np.log10(rms)) if rms > 1e-6 else -120.0
+
+    def process(self, frame: bytes) -> tuple[list[bytes], bool]:
+        """Return (frames to forward, whether the utterance just ended)."""
+        level = self.level_dbfs(frame)
+        is_speech = level > max(self.threshold_dbfs, self.noise_floor_dbfs + self.margin_db)
+
+        if is_speech:
+            self._hangover_left = self.hangover_frames
+            frames = [frame]
+            if not self._speaking:
+                self._speaking = True
+                self.utterances += 1
+                frames = self._preroll + frames
+                self._preroll = []
+            self.forwarded_frames += len(frames)
+            return frames, False
+
+        # Track the background level on non-speech frames only
+        self.noise_floor_dbfs += 0.05 * (level - self.noise_floor_dbfs)
+
+        if self._speaking:
+            if self._hangover_left > 0:
+                self._hangover_left -= 1
+                self.forwarded_frames += 1
+                return [frame], False
+            self._speaking = False
+            self._hold(frame)
+            return [], True
+
+        self._hold(frame)
+        return [], False
+
+    def _hold(self, frame: bytes) -> None:
+        if not self.preroll_frames:
+            self.suppressed_frames += 1
+            return
+        self._preroll.append(frame)
+        if len(self._preroll) > self.preroll_frames:
+            self._preroll.pop(0)
+            self.suppressed_frames += 1
+
+    def reset(self) -> None:
+        """Forget the current utterance and pre-roll (e.g. when realtime audio is paused)."""
+        self.suppressed_frames += len(self._preroll)
+        self._preroll = []
+        self._speaking = False
+        self._hangover_left = 0
+
+    @property
+    def speaking(self) -> bool:
+        return self._speaking
+
+    def stats(self) -> dict:
+        total = self.forwarded_frames + self.suppressed_frames
+        return {
+            "speaking": self._speaking,
+            "utterances": self.utterances,
+            "forwarded_ms": self.forwarded_frames * self.frame_ms,
+            "suppressed_ms": self.suppressed_frames * self.frame_ms,
+            "suppressed_to_forwarded": round(self.suppressed_frames / self.forwarded_frames, 3) if self.forwarded_frames else None,
+            "suppressed_ratio": round(self.suppressed_frames / total, 4) if total else None,
+            "noise_floor_dbfs": round(self.noise_floor_dbfs, 1),
+        }
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the server-side audio stage (audio_pipeline.py).
+
+Simulates one microphone session as the browser sends it (128-sample AudioWorklet
+blocks) and compares forwarding every WebSocket message upstream against
+resampling + coalescing into fixed frames. Each upstream send is modelled by the
+JSON/base64 message the SDK builds for `send_realtime_input`, so the CPU figure
+includes per-message framing cost.
+
+    python bench_audio_pipeline.py
+    python bench_audio_pipeline.py --seconds 30 --input-rate 44100 --frame-ms 20,40,100
+"""
+import argparse
+import base64
+import json
+import time
+
+import numpy as np
+
+from audio_pipeline import AudioFrameAssembler
+
+WORKLET_BLOCK = 128
+
+
+def upstream_send(chunk: bytes) -> int:
+    """Serialize one realtime_input message like the Live SDK does; return its size."""
+    message = {"realtime_input": {"audio": {"data": base64.b64encode(chunk).decode(), "mime_type": "audio/pcm;rate=16000"}}}
+    return len(json.dumps(message))
+
+
+def capture_blocks(seconds: float, input_rate: int) -> list[np.ndarray]:
+    t = np.arange(int(seconds * input_rate)) / input_rate
+    signal = (0.3 * np.sin(2 * np.pi * 220 * t) + 0.05 * np.random.default_rng(0).standard_normal(t.size)).astype("<f4")
+    return [signal[i:i + WORKLET_BLOCK] for i in range(0, signal.size, WORKLET_BLOCK)]
+
+
+def legacy_client_block(block: np.ndarray, input_rate: int) -> bytes:
+    """What the browser used to send: each block resampled to 16 kHz int16 on its own."""
+    out_len = int(block.size * 16000 / input_rate)
+    positions = np.arange(out_len) * (input_rate / 16000)
+    resampled = np.interp(positions, np.arange(block.size), block)
+    return (np.clip(resampled, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+
+
+def run_legacy(blocks: list[np.ndarray], input_rate: int) -> dict:
+    messages = [legacy_client_block(block, input_rate) for block in blocks]
+    started = time.process_time()
+    upstream_bytes = sum(upstream_send(chunk) for chunk in messages)
+    return {"cpu": time.process_time() - started, "sends": len(messages), "upstream_bytes": upstream_bytes}
+
+
+def run_pipeline(blocks: list[np.ndarray], input_rate: int, frame_ms: int) -> dict:
+    messages = [block.tobytes() for block in blocks]
+    assembler = AudioFrameAssembler(sample_rate=input_rate, sample_format="f32le", frame_ms=frame_ms)
+    started = time.process_time()
+    sends = upstream_bytes = 0
+    for message in messages:
+        for frame in assembler.push(message):
+            upstream_bytes += upstream_send(frame)
+            sends += 1
+    tail = assembler.flush()
+    if tail:
+        upstream_bytes += upstream_send(tail)
+        sends += 1
+    return {"cpu": time.process_time() - started, "sends": sends, "upstream_bytes": upstream_bytes}
+
+
+def report(label: str, result: dict, seconds: float) -> dict:
+    return {
+        "path": label,
+        "upstream_msgs_per_s": round(result["sends"] / seconds, 1),
+        "cpu_ms_per_session_s": round(result["cpu"] * 1000 / seconds, 3),
+        "cpu_pct_of_one_core": round(result["cpu"] * 100 / seconds, 3),
+        "upstream_kib_per_s": round(result["upstream_bytes"] / 1024 / seconds, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark audio frame coalescing and resampling")
+    parser.add_argument("--seconds", type=float, default=20, help="simulated session length")
+    parser.add_argument("--input-rate", type=int, default=48000, help="browser capture sample rate")
+    parser.add_argument("--frame-ms", default="20,40,100", help="comma-separated frame durations")
+    args = parser.parse_args()
+
+    blocks = capture_blocks(args.seconds, args.input_rate)
+    rows = [report("per-message (legacy)", run_legacy(blocks, args.input_rate), args.seconds)]
+    for frame_ms in (int(v) for v in args.frame_ms.split(",") if v.strip()):
+        rows.append(report(f"pipeline {frame_ms}ms", run_pipeline(blocks, args.input_rate, frame_ms), args.seconds))
+
+    print(json.dumps({"input_rate": args.input_rate, "client_msgs_per_s": round(len(blocks) / args.seconds, 1), "results": rows}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -7,12 +7,34 @@ import base64
 import json
 import logging
 import os
+import re
+import time
+import uuid
+from contextlib import asynccontextmanager
+
 import httpx
 
 from dotenv import load_dotenv
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import Response
+from fastapi.responses import JSONResponse, Response
+
+from audio_pipeline import AudioFrameAssembler, EnergyVAD
+from live_pool import LiveSessionPool
+from metrics import (
+    ACTIVE_SESSIONS,
+    QUEUE_DROPPED,
+    QUEUE_WAIT_SECONDS,
+    SESSIONS_TOTAL,
+    STREAM_BYTES,
+    TOOL_CALL_SECONDS,
+    TTFB_SECONDS,
+    collect as collect_metrics,
+    render as render_metrics,
+)
+from shared_state import SharedState
+from video_pipeline import AdaptiveFrameController
+from ws_framing import KIND_IMAGE, KIND_UPLOAD_AUDIO, FrameError, parse_frame
 
 # Load environment variables
 load_dotenv()
@@ -27,8 +49,553 @@ LOCATION = os.getenv("LOCATION", "us-central1")
 MODEL = os.getenv("MODEL", "gemini-live-2.5-flash-native-audio")
 MCP_PROXY_URL = os.getenv("MCP_PROXY_URL", "http://localhost:3001")
 
+# MCP proxy HTTP pool
+MCP_HTTP_MAX_CONNECTIONS = int(os.getenv("MCP_HTTP_MAX_CONNECTIONS", "20"))
+MCP_HTTP_MAX_KEEPALIVE = int(os.getenv("MCP_HTTP_MAX_KEEPALIVE", "10"))
+MCP_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("MCP_HTTP_KEEPALIVE_EXPIRY", "30"))
+MCP_TOOL_TIMEOUT = float(os.getenv("MCP_TOOL_TIMEOUT", "30"))
+# Per-tool timeout overrides in seconds, e.g. MCP_TOOL_TIMEOUTS='{"send_email": 20}'
+MCP_TOOL_TIMEOUTS = json.loads(os.getenv("MCP_TOOL_TIMEOUTS", "{}") or "{}")
+
+EMAIL_TOOLS = ("send_email", "send_halloween_invitation", "send_system_alert")
+# Max tool calls running in parallel per Live session
+TOOL_CALL_CONCURRENCY = int(os.getenv("TOOL_CALL_CONCURRENCY", "4"))
+
+# Per-connection stream queues; incoming audio is resampled to 16 kHz and cut into AUDIO_FRAME_MS frames (20-100)
+AUDIO_FRAME_MS = int(os.getenv("AUDIO_FRAME_MS", "40"))
+AUDIO_QUEUE_MAX_FRAMES = int(os.getenv("AUDIO_QUEUE_MAX_FRAMES", "25"))
+VIDEO_QUEUE_MAX_FRAMES = int(os.getenv("VIDEO_QUEUE_MAX_FRAMES", "2"))
+TEXT_QUEUE_MAX = int(os.getenv("TEXT_QUEUE_MAX", "64"))
+EVENT_QUEUE_MAX = int(os.getenv("EVENT_QUEUE_MAX", "256"))
+
+# Optional server-side VAD: only speech (plus pre-roll/hangover) is streamed to Gemini Live
+VAD_ENABLED = os.getenv("VAD_ENABLED", "false").lower() in ("1", "true", "yes")
+VAD_THRESHOLD_DBFS = float(os.getenv("VAD_THRESHOLD_DBFS", "-45"))
+VAD_MARGIN_DB = float(os.getenv("VAD_MARGIN_DB", "10"))
+VAD_HANGOVER_MS = int(os.getenv("VAD_HANGOVER_MS", "400"))
+VAD_PREROLL_MS = int(os.getenv("VAD_PREROLL_MS", "200"))
+
+# Camera frames: rate limit, near-duplicate skipping (dHash) and downscaling while upstream lags
+VIDEO_MAX_FPS = float(os.getenv("VIDEO_MAX_FPS", "2"))
+VIDEO_SIMILARITY_BITS = int(os.getenv("VIDEO_SIMILARITY_BITS", "5"))
+VIDEO_KEYFRAME_SECONDS = float(os.getenv("VIDEO_KEYFRAME_SECONDS", "5"))
+VIDEO_LAG_MS = float(os.getenv("VIDEO_LAG_MS", "400"))
+VIDEO_LAG_MAX_SIDE = int(os.getenv("VIDEO_LAG_MAX_SIDE", "384"))
+
+# Pool of pre-connected Live sessions taken over by new /ws connections (0 = disabled)
+LIVE_POOL_SIZE = int(os.getenv("LIVE_POOL_SIZE", "0"))
+LIVE_POOL_IDLE_SECONDS = float(os.getenv("LIVE_POOL_IDLE_SECONDS", "300"))
+LIVE_POOL_REFILL = os.getenv("LIVE_POOL_REFILL", "true").lower() in ("1", "true", "yes")
+
+# Multi-worker mode: uvicorn worker processes sharing state through SQLite (see README)
+WORKERS = int(os.getenv("WORKERS", "1"))
+SHARED_STATE_PATH = os.getenv("SHARED_STATE_PATH", "")
+HEARTBEAT_SECONDS = float(os.getenv("HEARTBEAT_SECONDS", "2"))
+# /api/ready reports not-ready at this many sessions on a worker (0 = no limit)
+MAX_SESSIONS_PER_WORKER = int(os.getenv("MAX_SESSIONS_PER_WORKER", "0"))
+# Replace Gemini Live with a local loopback session (load testing without credentials)
+LIVE_LOOPBACK = os.getenv("LIVE_LOOPBACK", "false").lower() in ("1", "true", "yes")
+
+# Optional per-turn JSON-lines trace (timings, tool calls, bytes)
+TRACE_LOG = os.getenv("TRACE_LOG", "")
+
+# Chunked audio uploads (audio_upload_start / binary chunks / audio_upload_end)
+UPLOAD_QUEUE_CHUNKS = int(os.getenv("UPLOAD_QUEUE_CHUNKS", "8"))
+UPLOAD_MAX_CHUNK_BYTES = int(os.getenv("UPLOAD_MAX_CHUNK_BYTES", "65536"))
+# Upstream pace as a multiple of real time for PCM uploads (0 = unpaced)
+UPLOAD_PACE_REALTIME = float(os.getenv("UPLOAD_PACE_REALTIME", "4"))
+
+trace_logger = None
+if TRACE_LOG:
+    trace_logger = logging.getLogger("gemini_trace")
+    trace_logger.propagate = False
+    trace_logger.setLevel(logging.INFO)
+    _trace_handler = logging.FileHandler(TRACE_LOG, encoding="utf-8")
+    _trace_handler.setFormatter(logging.Formatter("%(message)s"))
+    trace_logger.addHandler(_trace_handler)
+
+try:
+    import h2  # noqa: F401  (enables HTTP/2 in httpx)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# App-lifetime pooled client for MCP proxy tool calls (created on startup, closed on shutdown)
+mcp_http_client: httpx.AsyncClient | None = None
+mcp_http_stats = {"requests": 0, "in_flight": 0, "errors": 0, "total_seconds": 0.0}
+
+# This worker's state; counters shared across workers are buffered and flushed on heartbeat
+shared_state: SharedState | None = None
+worker_state = {"ready": False, "total_sessions": 0}
+shared_counter_deltas = {}
+
+
+def count_shared(name: str, amount: float = 1.0) -> None:
+    shared_counter_deltas[name] = shared_counter_deltas.get(name, 0.0) + amount
+
+
+def _publish_worker_state(deltas: dict, samples: dict | None = None) -> None:
+    # Drop each delta once written, so a failure part-way leaves only the unpublished ones
+    for name in list(deltas):
+        shared_state.incr(name, deltas[name])
+        del deltas[name]
+    shared_state.heartbeat(len(active_connections), worker_state["total_sessions"], worker_ready())
+    if samples is not None:
+        shared_state.publish_metrics(samples)
+
+
+async def heartbeat_loop():
+    global shared_counter_deltas
+    while True:
+        # Swap the buffer on the loop thread so count_shared() never writes to a dict the thread is draining
+        deltas, shared_counter_deltas = shared_counter_deltas, {}
+        # Metric children are mutated on the loop, so snapshot them here as well
+        samples = collect_metrics({"worker": os.getpid()}) if WORKERS > 1 else None
+        try:
+            await asyncio.to_thread(_publish_worker_state, deltas, samples)
+        except Exception as e:
+            logger.warning(f"Shared state heartbeat failed: {e}")
+            # Keep the unpublished increments for the next heartbeat
+            for name, amount in deltas.items():
+                count_shared(name, amount)
+        await asyncio.sleep(HEARTBEAT_SECONDS)
+
+
+def worker_ready() -> bool:
+    if not worker_state["ready"]:
+        return False
+    return MAX_SESSIONS_PER_WORKER <= 0 or len(active_connections) < MAX_SESSIONS_PER_WORKER
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global mcp_http_client
+    mcp_http_client = httpx.AsyncClient(
+        base_url=MCP_PROXY_URL,
+        http2=HTTP2_AVAILABLE,
+        timeout=MCP_TOOL_TIMEOUT,
+        limits=httpx.Limits(
+            max_connections=MCP_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=MCP_HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=MCP_HTTP_KEEPALIVE_EXPIRY,
+        ),
+    )
+    logger.info(f"MCP proxy HTTP pool ready ({MCP_PROXY_URL}, http2={HTTP2_AVAILABLE})")
+    global live_pool, shared_state
+    if PROJECT_ID and not LIVE_LOOPBACK:
+        try:
+            # Build the client and Live config once up front instead of on the first connection
+            get_genai_client()
+            get_live_config()
+            if LIVE_POOL_SIZE > 0:
+                live_pool = LiveSessionPool(
+                    connect_live_session,
+                    size=LIVE_POOL_SIZE,
+                    idle_seconds=LIVE_POOL_IDLE_SECONDS,
+                    refill=LIVE_POOL_REFILL,
+                )
+                live_pool.start()
+                logger.info(f"Live session pool started (size={LIVE_POOL_SIZE})")
+        except ImportError:
+            logger.warning("google-genai package not installed; Live sessions unavailable")
+        except Exception as e:
+            # e.g. missing credentials; connections will report the error when they connect
+            logger.warning(f"Could not prepare Gemini client: {e}")
+    shared_state = SharedState(SHARED_STATE_PATH or None, stale_seconds=HEARTBEAT_SECONDS * 5)
+    shared_state.register_worker()
+    heartbeat_task = asyncio.create_task(heartbeat_loop())
+    worker_state["ready"] = True
+    logger.info(f"Worker {os.getpid()} ready (shared state: {shared_state.path})")
+    try:
+        yield
+    finally:
+        worker_state["ready"] = False
+        heartbeat_task.cancel()
+        try:
+            _publish_worker_state(shared_counter_deltas)
+            shared_state.unregister_worker()
+            shared_state.close()
+        except Exception as e:
+            logger.warning(f"Could not unregister worker: {e}")
+        shared_state = None
+        if live_pool is not None:
+            await live_pool.close()
+            live_pool = None
+        await mcp_http_client.aclose()
+        mcp_http_client = None
+
+
+async def call_mcp_tool(name: str, args: dict) -> dict:
+    """Call an MCP tool through the proxy and return the function response payload."""
+    mcp_http_stats["requests"] += 1
+    mcp_http_stats["in_flight"] += 1
+    started = time.perf_counter()
+    try:
+        http_response = await mcp_http_client.post(
+            "/api/mcp/tools/call",
+            json={"name": name, "arguments": args},
+            timeout=MCP_TOOL_TIMEOUTS.get(name, MCP_TOOL_TIMEOUT),
+        )
+        http_response.raise_for_status()
+        result = http_response.json()
+
+        if result.get("success"):
+            logger.info(f"Email tool {name} succeeded")
+            return result.get("result", {})
+        error_msg = result.get("error", "Unknown error")
+        logger.error(f"Email tool {name} failed: {error_msg}")
+        mcp_http_stats["errors"] += 1
+        return {"success": False, "error": error_msg}
+    except httpx.HTTPError as e:
+        logger.error(f"HTTP error calling email tool {name}: {e}")
+        mcp_http_stats["errors"] += 1
+        return {"success": False, "error": f"Network error: {str(e)}"}
+    except Exception as e:
+        logger.error(f"Error calling email tool {name}: {e}", exc_info=True)
+        mcp_http_stats["errors"] += 1
+        return {"success": False, "error": str(e)}
+    finally:
+        mcp_http_stats["in_flight"] -= 1
+        mcp_http_stats["total_seconds"] += time.perf_counter() - started
+
+
+def _mcp_pool_connections() -> tuple[int, int] | None:
+    """(open, idle) connection counts of the MCP client pool, or None when unavailable.
+
+    httpx does not expose its pool publicly, so this peeks at httpcore internals
+    defensively; any change there just stops the pool counts from being reported.
+    """
+    pool = getattr(getattr(mcp_http_client, "_transport", None), "_pool", None)
+    connections = getattr(pool, "connections", None)
+    if connections is None:
+        return None
+    try:
+        connections = list(connections)
+        idle = sum(1 for c in connections if getattr(c, "is_idle", lambda: False)())
+    except Exception:
+        return None
+    return len(connections), idle
+
+
+def mcp_pool_metrics() -> dict:
+    requests = mcp_http_stats["requests"]
+    metrics = {
+        "http2": HTTP2_AVAILABLE,
+        "max_connections": MCP_HTTP_MAX_CONNECTIONS,
+        "max_keepalive_connections": MCP_HTTP_MAX_KEEPALIVE,
+        "requests": requests,
+        "in_flight": mcp_http_stats["in_flight"],
+        "errors": mcp_http_stats["errors"],
+        "avg_seconds": round(mcp_http_stats["total_seconds"] / requests, 4) if requests else None,
+    }
+    connections = _mcp_pool_connections()
+    if connections is not None:
+        metrics["open_connections"], metrics["idle_connections"] = connections
+    return metrics
+
+
+def _build_live_config():
+    """Build the LiveConnectConfig shared by every session (system instruction + tools)."""
+    from google.genai import types
+
+    # Define email tools (FunctionDeclaration format)
+    email_tools = [
+        types.Tool(
+            function_declarations=[
+                types.FunctionDeclaration(
+                    name="send_email",
+                    description="Send an email to a recipient with a custom subject and body",
+                    parameters={
+                        "type": "object",
+                        "properties": {
+                            "receiver_email": {
+                                "type": "string",
+                                "description": "The recipient's email address"
+                            },
+                            "subject": {
+                                "type": "string",
+                                "description": "The email subject line"
+                            },
+                            "body": {
+                                "type": "string",
+                                "description": "The email body content"
+                            }
+                        },
+                        "required": ["receiver_email", "subject", "body"]
+                    }
+                ),
+                types.FunctionDeclaration(
+                    name="send_halloween_invitation",
+                    description="Send a Halloween party invitation email",
+                    parameters={
+                        "type": "object",
+                        "properties": {
+                            "receiver_email": {
+                                "type": "string",
+                                "description": "The recipient's email address"
+                            }
+                        },
+                        "required": ["receiver_email"]
+                    }
+                ),
+                types.FunctionDeclaration(
+                    name="send_system_alert",
+                    description="Send a system alert notification email",
+                    parameters={
+                        "type": "object",
+                        "properties": {
+                            "receiver_email": {
+                                "type": "string",
+                                "description": "The recipient's email address"
+                            }
+                        },
+                        "required": ["receiver_email"]
+                    }
+                )
+            ]
+        )
+    ]
+
+    # Enable Google Search grounding (same as GPT Realtime grounded_search tool)
+    tools = [types.Tool(google_search=types.GoogleSearch())] + email_tools
+
+    return types.LiveConnectConfig(
+        response_modalities=[types.Modality.AUDIO],
+        speech_config=types.SpeechConfig(
+            voice_config=types.VoiceConfig(
+                prebuilt_voice_config=types.PrebuiltVoiceConfig(
+                    voice_name="Puck"
+                )
+            )
+        ),
+        system_instruction=types.Content(parts=[types.Part(
+            text="You are a helpful AI assistant. Keep responses concise and friendly. Respond in Traditional Chinese (繁體中文) when the user speaks Chinese. "
+            "When the user asks about time, answer in Taiwan time.\n\n"
+            "CRITICAL - Avoid hallucination:\n"
+            "- NEVER invent names, statistics, roster/lineup details, or specific facts. If you are not certain, say so and use Google Search to verify.\n"
+            "- You have Google Search grounding. You MUST use it when: the user asks about rosters/lineups (e.g. national team 30-man list), current events, sports, specific people, or when the user says 查證/確認/去查.\n"
+            "- When the user asks you to verify something (e.g. 去查證、這是誰), always search first, then answer only based on search results. Do not guess or correct with another name you are unsure about.\n"
+            "- If search does not clearly support a name or fact, say you could not verify it or that it may be incorrect; do not substitute with another unverified name.\n\n"
+            "EMAIL TOOLS - CRITICAL: You MUST use email tools when the user asks to send emails. DO NOT pretend to send emails without actually calling the tool.\n"
+            "- send_email: Send a custom email. REQUIRED parameters: receiver_email (recipient's email address), subject (email subject line), body (email content/body). \n"
+            "  * When the user asks to send an email (e.g. '幫我寄送郵件給xxx@example.com', 'send email to...', '寄送一個笑話給...'), you MUST IMMEDIATELY call send_email with all required parameters.\n"
+            "  * Extract the email address from the user's message. If subject is not provided, create an appropriate one. If body is not provided, create appropriate content based on the user's request.\n"
+            "  * Example: User says '寄送一個笑話給 poirotw66@gmail.com' -> Call send_email with receiver_email='poirotw66@gmail.com', subject='一個有趣的笑話', body='[the joke content]'\n"
+            "- send_halloween_invitation: Send a Halloween party invitation email. Required parameter: receiver_email. Use ONLY when the user specifically asks for a Halloween invitation.\n"
+            "- send_system_alert: Send a system alert notification email. Required parameter: receiver_email. Use ONLY when the user asks for a system alert or notification.\n"
+            "IMPORTANT: When you call an email tool, wait for the tool response before telling the user the email was sent. Do NOT say '已經寄出' or 'sent' until you have actually called the tool and received a success response."
+        )]),
+        tools=tools,
+        input_audio_transcription=types.AudioTranscriptionConfig(),
+        output_audio_transcription=types.AudioTranscriptionConfig(),
+    )
+
+
+_genai_client = None
+_live_config = None
+live_pool: LiveSessionPool | None = None
+
+
+def get_genai_client():
+    """Process-wide genai client; reused by every Live session."""
+    global _genai_client
+    if _genai_client is None:
+        from google import genai
+        _genai_client = genai.Client(vertexai=True, project=PROJECT_ID, location=LOCATION)
+    return _genai_client
+
+
+def get_live_config():
+    global _live_config
+    if _live_config is None:
+        _live_config = _build_live_config()
+    return _live_config
+
+
+def connect_live_session():
+    return get_genai_client().aio.live.connect(model=MODEL, config=get_live_config())
+
+
+def open_live_session():
+    """Take a pre-connected session from the pool if enabled, else connect a new one."""
+    if LIVE_LOOPBACK:
+        # Test-only stand-in; kept out of the import path of normal deployments
+        from loopback_live import connect_loopback
+        return connect_loopback()
+    if live_pool is not None:
+        return live_pool.session()
+    return connect_live_session()
+
+
+class StreamQueue:
+    """Bounded asyncio queue with an overflow policy and per-stream stats.
+
+    policy "drop_oldest" discards the oldest item when full (stale media is
+    useless); policy "block" makes the producer wait (text/events are never
+    dropped). Wait time is enqueue -> dequeue; lag is enqueue -> `mark_delivered()`,
+    which the single consumer calls after forwarding the item upstream.
+    """
+
+    def __init__(self, maxsize: int, policy: str = "block", name: str = "default"):
+        self._queue = asyncio.Queue(maxsize)
+        self._wait_metric = QUEUE_WAIT_SECONDS.labels(name)
+        self._dropped_metric = QUEUE_DROPPED.labels(name)
+        self.policy = policy
+        self.maxsize = maxsize
+        self.enqueued = 0
+        self.dropped = 0
+        self.last_enqueued_at = 0.0
+        self.wait_ms_avg = 0.0
+        self.wait_ms_max = 0.0
+        self.lag_ms_avg = 0.0
+        self.lag_ms_max = 0.0
+
+    async def put(self, item) -> None:
+        if self.policy == "drop_oldest":
+            while self._queue.full():
+                try:
+                    self._queue.get_nowait()
+                    self.dropped += 1
+                    self._dropped_metric.inc()
+                except asyncio.QueueEmpty:
+                    break
+            self._queue.put_nowait((time.monotonic(), item))
+        else:
+            await self._queue.put((time.monotonic(), item))
+        self.enqueued += 1
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    async def get(self):
+        enqueued_at, item = await self._queue.get()
+        self.last_enqueued_at = enqueued_at
+        wait = time.monotonic() - enqueued_at
+        self._wait_metric.observe(wait)
+        wait_ms = wait * 1000
+        self.wait_ms_avg += 0.1 * (wait_ms - self.wait_ms_avg)
+        if wait_ms > self.wait_ms_max:
+            self.wait_ms_max = wait_ms
+        return item
+
+    def mark_delivered(self) -> None:
+        lag_ms = (time.monotonic() - self.last_enqueued_at) * 1000
+        self.lag_ms_avg += 0.1 * (lag_ms - self.lag_ms_avg)
+        if lag_ms > self.lag_ms_max:
+            self.lag_ms_max = lag_ms
+
+    def clear(self) -> int:
+        cleared = 0
+        while True:
+            try:
+                self._queue.get_nowait()
+                cleared += 1
+            except asyncio.QueueEmpty:
+                return cleared
+
+    def stats(self) -> dict:
+        return {
+            "policy": self.policy,
+            "depth": self.depth,
+            "maxsize": self.maxsize,
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "wait_ms_avg": round(self.wait_ms_avg, 2),
+            "wait_ms_max": round(self.wait_ms_max, 2),
+            "lag_ms_avg": round(self.lag_ms_avg, 2),
+            "lag_ms_max": round(self.lag_ms_max, 2),
+        }
+
+
+def pcm_bytes_per_second(mime_type: str) -> int | None:
+    """Byte rate of 16-bit mono PCM described by e.g. "audio/pcm;rate=16000"."""
+    if not mime_type.startswith("audio/pcm"):
+        return None
+    match = re.search(r"rate=(\d+)", mime_type)
+    return int(match.group(1)) * 2 if match else None
+
+
+class TurnTracker:
+    """Per-connection turn timing: time to first model audio, plus an optional trace record per turn.
+
+    A turn's input ends when VAD detects the end of speech, a text message is
+    sent, or an uploaded file's audio stream ends.
+    """
+
+    def __init__(self, connection_id: str):
+        self.connection_id = connection_id
+        self.turn = 0
+        self._ttfb = {trigger: TTFB_SECONDS.labels(trigger) for trigger in ("vad", "text", "upload")}
+        self._reset()
+
+    def _reset(self, pending_input_end=None, pending_trigger=None):
+        self.input_end_at = pending_input_end
+        self.trigger = pending_trigger
+        self.started_at = pending_input_end
+        self.first_audio_at = None
+        self.ttfb_dropped = False
+        self.model_audio_bytes = 0
+        self.tool_calls = []
+
+    def input_ended(self, trigger: str, ended_at: float | None = None) -> None:
+        """Mark the end of the turn's input; `ended_at` backdates it (e.g. to the last voiced frame)."""
+        ended_at = time.monotonic() if ended_at is None else ended_at
+        if self.first_audio_at is not None and self.first_audio_at >= ended_at:
+            # Model audio came before the end was detected (inside the VAD hangover):
+            # this input belongs to the current turn, but its time to first audio is unknown
+            self.ttfb_dropped = True
+        self.input_end_at = ended_at
+        self.trigger = trigger
+        if self.started_at is None:
+            self.started_at = self.input_end_at
+
+    def model_audio(self, size: int) -> None:
+        self.model_audio_bytes += size
+        if self.first_audio_at is None:
+            self.first_audio_at = time.monotonic()
+            if self.started_at is None:
+                self.started_at = self.first_audio_at
+            if self.input_end_at is not None:
+                self._ttfb[self.trigger].observe(self.first_audio_at - self.input_end_at)
+
+    def tool_call(self, name: str, seconds: float, ok: bool) -> None:
+        if trace_logger is not None:
+            self.tool_calls.append({"name": name, "ms": round(seconds * 1000, 1), "ok": ok})
+
+    def finish(self, interrupted: bool = False) -> None:
+        if self.started_at is None:
+            return
+        self.turn += 1
+        now = time.monotonic()
+        if trace_logger is not None:
+            trace_logger.info(json.dumps({
+                "ts": time.time(),
+                "connection_id": self.connection_id,
+                "turn": self.turn,
+                "trigger": self.trigger,
+                "ttfb_ms": round((self.first_audio_at - self.input_end_at) * 1000, 1)
+                if self.first_audio_at is not None and self.input_end_at is not None
+                and self.first_audio_at >= self.input_end_at and not self.ttfb_dropped
+                else None,
+                "duration_ms": round((now - self.started_at) * 1000, 1),
+                "model_audio_bytes": self.model_audio_bytes,
+                "tool_calls": self.tool_calls,
+                "interrupted": interrupted,
+            }, ensure_ascii=False))
+        # Input that ended while the model was still answering (barge-in) belongs to the next turn
+        if self.input_end_at is not None and self.first_audio_at is not None and self.input_end_at > self.first_audio_at:
+            self._reset(self.input_end_at, self.trigger)
+        else:
+            self._reset()
+
+
+# Stream queues of each open /ws connection, for /api/connections
+active_connections = {}
+
+
 # Initialize FastAPI
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -44,6 +611,71 @@ async def health():
     return {"status": "ok"}
 
 
+@app.get("/api/ready")
+async def ready():
+    """Readiness for the load balancer: 503 while starting, stopping or at MAX_SESSIONS_PER_WORKER."""
+    body = {
+        "ready": worker_ready(),
+        "pid": os.getpid(),
+        "active_sessions": len(active_connections),
+        "max_sessions": MAX_SESSIONS_PER_WORKER or None,
+    }
+    return JSONResponse(body, status_code=200 if body["ready"] else 503)
+
+
+@app.get("/api/load")
+async def load():
+    """Session counts of this worker and of every worker sharing SHARED_STATE_PATH."""
+    workers = await asyncio.to_thread(shared_state.workers) if shared_state is not None else []
+    counters = await asyncio.to_thread(shared_state.counters) if shared_state is not None else {}
+    return {
+        "worker": {
+            "pid": os.getpid(),
+            "active_sessions": len(active_connections),
+            "total_sessions": worker_state["total_sessions"],
+            "ready": worker_ready(),
+        },
+        "workers": workers,
+        "total_active_sessions": sum(w["active_sessions"] for w in workers),
+        "counters": counters,
+    }
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus metrics; with WORKERS > 1 every series has a `worker` label and all live workers are included."""
+    if WORKERS > 1 and shared_state is not None:
+        # The scrape lands on any worker: answer with its live values plus the others' last heartbeat snapshot
+        peers = await asyncio.to_thread(shared_state.peer_metrics)
+        content = render_metrics({"worker": os.getpid()}, peers)
+    else:
+        content = render_metrics()
+    return Response(content=content, media_type="text/plain; version=0.0.4")
+
+
+@app.get("/api/metrics")
+async def metrics():
+    return {
+        "mcp_http_pool": mcp_pool_metrics(),
+        "live_session_pool": live_pool.stats() if live_pool is not None else {"enabled": False},
+    }
+
+
+@app.get("/api/connections")
+async def connections():
+    now = time.time()
+    return {
+        connection_id: {
+            "age_seconds": round(now - conn["started_at"], 1),
+            "queues": {name: queue.stats() for name, queue in conn["queues"].items()},
+            "audio_pipeline": conn["audio"]["assembler"].stats(),
+            "vad": conn["audio"]["vad"].stats() if conn["audio"]["vad"] else None,
+            "video": conn["video"].stats(),
+        }
+        for connection_id, conn in active_connections.items()
+    }
+
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     """WebSocket endpoint for Gemini Live."""
@@ -53,25 +685,110 @@ async def websocket_endpoint(websocket: WebSocket):
 
     # Import here to avoid issues if google-genai is not installed
     try:
-        from google import genai
         from google.genai import types
     except ImportError:
         await websocket.send_json({"type": "error", "error": "google-genai package not installed"})
         await websocket.close()
         return
 
-    if not PROJECT_ID:
+    if not PROJECT_ID and not LIVE_LOOPBACK:
         await websocket.send_json({"type": "error", "error": "GOOGLE_CLOUD_PROJECT not set"})
         await websocket.close()
         return
 
-    audio_input_queue = asyncio.Queue()
-    video_input_queue = asyncio.Queue()
-    text_input_queue = asyncio.Queue()
+    # Audio is coalesced into fixed-duration frames; stale audio/video frames are dropped, text never is
+    audio_input_queue = StreamQueue(AUDIO_QUEUE_MAX_FRAMES, policy="drop_oldest", name="audio")
+    video_input_queue = StreamQueue(VIDEO_QUEUE_MAX_FRAMES, policy="drop_oldest", name="video")
+    text_input_queue = StreamQueue(TEXT_QUEUE_MAX, policy="block", name="text")
+    event_queue = StreamQueue(EVENT_QUEUE_MAX, policy="block", name="events")
+    # Binary audio defaults to 16 kHz int16 mono until the client sends an audio_config message
+    audio_state = {"assembler": AudioFrameAssembler(frame_ms=AUDIO_FRAME_MS), "vad": None}
+    if VAD_ENABLED:
+        audio_state["vad"] = EnergyVAD(
+            frame_ms=audio_state["assembler"].frame_ms,
+            threshold_dbfs=VAD_THRESHOLD_DBFS,
+            margin_db=VAD_MARGIN_DB,
+            hangover_ms=VAD_HANGOVER_MS,
+            preroll_ms=VAD_PREROLL_MS,
+        )
+    video_controller = AdaptiveFrameController(
+        max_fps=VIDEO_MAX_FPS,
+        similarity_bits=VIDEO_SIMILARITY_BITS,
+        keyframe_seconds=VIDEO_KEYFRAME_SECONDS,
+        lag_ms=VIDEO_LAG_MS,
+        lag_max_side=VIDEO_LAG_MAX_SIDE,
+    )
+    connection_id = uuid.uuid4().hex[:12]
+    turns = TurnTracker(connection_id)
+    # Metric children looked up once so the per-chunk path only does float adds
+    audio_in_bytes = STREAM_BYTES.labels("audio", "in")
+    audio_upstream_bytes = STREAM_BYTES.labels("audio", "upstream")
+    audio_out_bytes = STREAM_BYTES.labels("audio", "out")
+    video_in_bytes = STREAM_BYTES.labels("video", "in")
+    video_upstream_bytes = STREAM_BYTES.labels("video", "upstream")
+    upload_in_bytes = STREAM_BYTES.labels("upload", "in")
+    text_in_bytes = STREAM_BYTES.labels("text", "in")
+    SESSIONS_TOTAL.inc()
+    ACTIVE_SESSIONS.inc()
+    worker_state["total_sessions"] += 1
+    count_shared("sessions_total")
+    active_connections[connection_id] = {
+        "started_at": time.time(),
+        "queues": {
+            "audio": audio_input_queue,
+            "video": video_input_queue,
+            "text": text_input_queue,
+            "events": event_queue,
+        },
+        "audio": audio_state,
+        "video": video_controller,
+    }
     is_processing_file = {"value": False, "timer": None}  # Track if currently processing uploaded file
     pause_realtime_audio = {"value": False}  # Flag to pause realtime audio during file upload
+    audio_uploads = {}  # upload id -> chunked upload in progress
+
+    def pause_realtime_for_file():
+        # Pause realtime audio input during file upload
+        pause_realtime_audio["value"] = True
+
+        # Clear any queued realtime audio chunks
+        audio_input_queue.clear()
+        audio_state["assembler"].reset()
+        if audio_state["vad"]:
+            audio_state["vad"].reset()
+
+        # Set flag to indicate we're processing an uploaded file
+        is_processing_file["value"] = True
+        logger.info("Processing audio file upload (realtime audio paused)")
+
+    async def receive_video_frame(jpeg):
+        video_in_bytes.inc(len(jpeg))
+        # JPEG hashing/downscaling runs off the event loop
+        frame = await asyncio.to_thread(
+            video_controller.offer,
+            jpeg,
+            upstream_lag_ms=video_input_queue.lag_ms_avg,
+            upstream_backlog=video_input_queue.depth,
+        )
+        if frame is not None:
+            await video_input_queue.put(frame)
+
+    async def receive_upload_chunk(upload_id, payload):
+        upload = audio_uploads.get(upload_id)
+        if upload is None:
+            logger.warning(f"Chunk for unknown audio upload {upload_id!r} ignored")
+            return
+        if upload["failed"]:
+            return
+        upload["bytes"] += len(payload)
+        upload_in_bytes.inc(len(payload))
+        # Blocking put: a full queue stops reading the socket until the session catches up
+        for start in range(0, len(payload), UPLOAD_MAX_CHUNK_BYTES):
+            await upload["queue"].put(bytes(payload[start:start + UPLOAD_MAX_CHUNK_BYTES]))
 
     async def audio_output_callback(data):
+        turns.model_audio(len(data))
+        audio_out_bytes.inc(len(data))
         await websocket.send_bytes(data)
 
     async def receive_from_client():
@@ -80,34 +797,52 @@ async def websocket_endpoint(websocket: WebSocket):
                 message = await websocket.receive()
 
                 if message.get("bytes"):
-                    await audio_input_queue.put(message["bytes"])
+                    data = message["bytes"]
+                    try:
+                        frame = parse_frame(data)
+                    except FrameError as e:
+                        logger.warning(f"Invalid binary frame: {e}")
+                        continue
+                    if frame is None:
+                        audio_in_bytes.inc(len(data))
+                        for audio_frame in audio_state["assembler"].push(data):
+                            await audio_input_queue.put(audio_frame)
+                        continue
+                    kind, stream_id, frame_payload = frame
+                    if kind == KIND_UPLOAD_AUDIO:
+                        await receive_upload_chunk(stream_id, frame_payload)
+                    elif kind == KIND_IMAGE:
+                        await receive_video_frame(bytes(frame_payload))
+                    else:
+                        logger.warning(f"Unknown binary frame kind {kind}")
                 elif message.get("text"):
                     raw_text = message["text"]
+                    text_in_bytes.inc(len(raw_text))
                     try:
                         payload = json.loads(raw_text)
                         if isinstance(payload, dict):
+                            # Client declares its capture format, e.g. {"type": "audio_config", "sample_rate": 48000, "format": "f32le"}
+                            if payload.get("type") == "audio_config":
+                                try:
+                                    audio_state["assembler"] = AudioFrameAssembler(
+                                        sample_rate=int(payload.get("sample_rate", 16000)),
+                                        sample_format=payload.get("format", "s16le"),
+                                        channels=int(payload.get("channels", 1)),
+                                        frame_ms=AUDIO_FRAME_MS,
+                                    )
+                                    logger.info(f"Audio input format: {audio_state['assembler'].stats()}")
+                                except (TypeError, ValueError) as e:
+                                    # Not fatal: keep the current input format and the session
+                                    await event_queue.put({"type": "audio_config_error", "error": f"Invalid audio_config: {e}"})
+                                continue
                             if payload.get("type") == "image":
-                                image_data = base64.b64decode(payload["data"])
-                                await video_input_queue.put(image_data)
+                                await receive_video_frame(base64.b64decode(payload["data"]))
                                 continue
                             # Handle audio file upload (complete file, not streaming)
                             if payload.get("type") == "audio_file":
                                 audio_data = base64.b64decode(payload["data"])
                                 mime_type = payload.get("mime_type", "audio/pcm;rate=16000")
-                                
-                                # Pause realtime audio input during file upload
-                                pause_realtime_audio["value"] = True
-                                
-                                # Clear any queued realtime audio chunks
-                                while not audio_input_queue.empty():
-                                    try:
-                                        audio_input_queue.get_nowait()
-                                    except asyncio.QueueEmpty:
-                                        break
-                                
-                                # Set flag to indicate we're processing an uploaded file
-                                is_processing_file["value"] = True
-                                logger.info("Processing audio file upload (realtime audio paused)")
+                                pause_realtime_for_file()
                                 
                                 # Put the entire audio into text queue so it's sent via session.send() with end_of_turn
                                 await text_input_queue.put({
@@ -115,6 +850,39 @@ async def websocket_endpoint(websocket: WebSocket):
                                     "mime_type": mime_type
                                 })
                                 continue
+                            # Streaming upload: audio_upload_start, binary KIND_UPLOAD_AUDIO chunks, audio_upload_end
+                            if payload.get("type") == "audio_upload_start":
+                                upload_id = str(payload.get("upload_id", ""))
+                                # upload_error events are reported without ending the session
+                                if not upload_id or upload_id in audio_uploads:
+                                    await event_queue.put({"type": "upload_error", "upload_id": upload_id, "error": f"Invalid audio upload id: {upload_id!r}"})
+                                    continue
+                                # Uploads stream one at a time: chunks of a second upload would fill its
+                                # queue and stop the socket reader before the first one's end arrives.
+                                # Its chunks are then ignored as an unknown upload.
+                                if audio_uploads:
+                                    await event_queue.put({
+                                        "type": "upload_error",
+                                        "upload_id": upload_id,
+                                        "error": f"Audio upload {upload_id!r} rejected: {next(iter(audio_uploads))!r} is still in progress",
+                                    })
+                                    continue
+                                pause_realtime_for_file()
+                                upload = {
+                                    "id": upload_id,
+                                    "mime_type": payload.get("mime_type", "audio/pcm;rate=16000"),
+                                    "queue": asyncio.Queue(UPLOAD_QUEUE_CHUNKS),
+                                    "bytes": 0,
+                                    "failed": False,
+                                }
+                                audio_uploads[upload_id] = upload
+                                await text_input_queue.put({"upload": upload})
+                                continue
+                            if payload.get("type") == "audio_upload_end":
+                                upload = audio_uploads.pop(str(payload.get("upload_id", "")), None)
+                                if upload is not None and not upload["failed"]:
+                                    await upload["queue"].put(None)
+                                continue
                             # Client sends user text as {"text": "..."}
                             if "text" in payload:
                                 raw_text = payload["text"]
@@ -131,111 +899,29 @@ async def websocket_endpoint(websocket: WebSocket):
     receive_task = asyncio.create_task(receive_from_client())
 
     async def run_session():
-        client = genai.Client(vertexai=True, project=PROJECT_ID, location=LOCATION)
-        
-        # Define email tools (FunctionDeclaration format)
-        email_tools = [
-            types.Tool(
-                function_declarations=[
-                    types.FunctionDeclaration(
-                        name="send_email",
-                        description="Send an email to a recipient with a custom subject and body",
-                        parameters={
-                            "type": "object",
-                            "properties": {
-                                "receiver_email": {
-                                    "type": "string",
-                                    "description": "The recipient's email address"
-                                },
-                                "subject": {
-                                    "type": "string",
-                                    "description": "The email subject line"
-                                },
-                                "body": {
-                                    "type": "string",
-                                    "description": "The email body content"
-                                }
-                            },
-                            "required": ["receiver_email", "subject", "body"]
-                        }
-                    ),
-                    types.FunctionDeclaration(
-                        name="send_halloween_invitation",
-                        description="Send a Halloween party invitation email",
-                        parameters={
-                            "type": "object",
-                            "properties": {
-                                "receiver_email": {
-                                    "type": "string",
-                                    "description": "The recipient's email address"
-                                }
-                            },
-                            "required": ["receiver_email"]
-                        }
-                    ),
-                    types.FunctionDeclaration(
-                        name="send_system_alert",
-                        description="Send a system alert notification email",
-                        parameters={
-                            "type": "object",
-                            "properties": {
-                                "receiver_email": {
-                                    "type": "string",
-                                    "description": "The recipient's email address"
-                                }
-                            },
-                            "required": ["receiver_email"]
-                        }
-                    )
-                ]
-            )
-        ]
-        
-        # Enable Google Search grounding (same as GPT Realtime grounded_search tool)
-        tools = [types.Tool(google_search=types.GoogleSearch())] + email_tools
-        
-        config = types.LiveConnectConfig(
-            response_modalities=[types.Modality.AUDIO],
-            speech_config=types.SpeechConfig(
-                voice_config=types.VoiceConfig(
-                    prebuilt_voice_config=types.PrebuiltVoiceConfig(
-                        voice_name="Puck"
-                    )
-                )
-            ),
-            system_instruction=types.Content(parts=[types.Part(
-                text="You are a helpful AI assistant. Keep responses concise and friendly. Respond in Traditional Chinese (繁體中文) when the user speaks Chinese. "
-                "When the user asks about time, answer in Taiwan time.\n\n"
-                "CRITICAL - Avoid hallucination:\n"
-                "- NEVER invent names, statistics, roster/lineup details, or specific facts. If you are not certain, say so and use Google Search to verify.\n"
-                "- You have Google Search grounding. You MUST use it when: the user asks about rosters/lineups (e.g. national team 30-man list), current events, sports, specific people, or when the user says 查證/確認/去查.\n"
-                "- When the user asks you to verify something (e.g. 去查證、這是誰), always search first, then answer only based on search results. Do not guess or correct with another name you are unsure about.\n"
-                "- If search does not clearly support a name or fact, say you could not verify it or that it may be incorrect; do not substitute with another unverified name.\n\n"
-                "EMAIL TOOLS - CRITICAL: You MUST use email tools when the user asks to send emails. DO NOT pretend to send emails without actually calling the tool.\n"
-                "- send_email: Send a custom email. REQUIRED parameters: receiver_email (recipient's email address), subject (email subject line), body (email content/body). \n"
-                "  * When the user asks to send an email (e.g. '幫我寄送郵件給xxx@example.com', 'send email to...', '寄送一個笑話給...'), you MUST IMMEDIATELY call send_email with all required parameters.\n"
-                "  * Extract the email address from the user's message. If subject is not provided, create an appropriate one. If body is not provided, create appropriate content based on the user's request.\n"
-                "  * Example: User says '寄送一個笑話給 poirotw66@gmail.com' -> Call send_email with receiver_email='poirotw66@gmail.com', subject='一個有趣的笑話', body='[the joke content]'\n"
-                "- send_halloween_invitation: Send a Halloween party invitation email. Required parameter: receiver_email. Use ONLY when the user specifically asks for a Halloween invitation.\n"
-                "- send_system_alert: Send a system alert notification email. Required parameter: receiver_email. Use ONLY when the user asks for a system alert or notification.\n"
-                "IMPORTANT: When you call an email tool, wait for the tool response before telling the user the email was sent. Do NOT say '已經寄出' or 'sent' until you have actually called the tool and received a success response."
-            )]),
-            tools=tools,
-            input_audio_transcription=types.AudioTranscriptionConfig(),
-            output_audio_transcription=types.AudioTranscriptionConfig(),
-        )
-        
-        async with client.aio.live.connect(model=MODEL, config=config) as session:
+        async with open_live_session() as session:
             
             async def send_audio():
                 try:
                     while True:
                         chunk = await audio_input_queue.get()
                         # Skip sending if realtime audio is paused (during file upload)
-                        if not pause_realtime_audio["value"]:
+                        if pause_realtime_audio["value"]:
+                            continue
+                        vad = audio_state["vad"]
+                        frames, speech_ended = vad.process(chunk) if vad else ([chunk], False)
+                        for frame in frames:
                             await session.send_realtime_input(
-                                audio=types.Blob(data=chunk, mime_type="audio/pcm;rate=16000")
+                                audio=types.Blob(data=frame, mime_type="audio/pcm;rate=16000")
                             )
+                            audio_upstream_bytes.inc(len(frame))
+                        if speech_ended:
+                            # Audio stops flowing during silence; tell the model the stream paused
+                            await session.send_realtime_input(audio_stream_end=True)
+                            # Speech ended at the last voiced frame, one hangover window ago
+                            turns.input_ended("vad", time.monotonic() - vad.hangover_frames * vad.frame_ms / 1000)
+                        if frames:
+                            audio_input_queue.mark_delivered()
                 except asyncio.CancelledError:
                     pass
 
@@ -246,15 +932,54 @@ async def websocket_endpoint(websocket: WebSocket):
                         await session.send_realtime_input(
                             video=types.Blob(data=chunk, mime_type="image/jpeg")
                         )
+                        video_input_queue.mark_delivered()
+                        video_upstream_bytes.inc(len(chunk))
                 except asyncio.CancelledError:
                     pass
 
+            async def stream_upload(upload):
+                """Forward a chunked upload to the session at a bounded pace, then end the audio stream."""
+                mime_type = upload["mime_type"]
+                bytes_per_second = pcm_bytes_per_second(mime_type)
+                pace = bytes_per_second * UPLOAD_PACE_REALTIME if bytes_per_second and UPLOAD_PACE_REALTIME > 0 else None
+                started = time.monotonic()
+                sent = 0
+                try:
+                    while True:
+                        chunk = await upload["queue"].get()
+                        if chunk is None:
+                            break
+                        await session.send_realtime_input(audio=types.Blob(data=chunk, mime_type=mime_type))
+                        sent += len(chunk)
+                        if pace:
+                            ahead = sent / pace - (time.monotonic() - started)
+                            if ahead > 0:
+                                await asyncio.sleep(ahead)
+                    await session.send_realtime_input(audio_stream_end=True)
+                    turns.input_ended("upload")
+                    logger.info(f"Audio upload {upload['id']} streamed: {sent} bytes in {time.monotonic() - started:.1f}s")
+                except Exception as e:
+                    logger.error(f"Error streaming audio upload {upload['id']}: {e}", exc_info=True)
+                    upload["failed"] = True
+                    audio_uploads.pop(upload["id"], None)
+                    # Unblock a reader waiting on the full queue
+                    while not upload["queue"].empty():
+                        upload["queue"].get_nowait()
+                    # No turn will complete for this upload, so resume realtime audio now
+                    if not audio_uploads:
+                        pause_realtime_audio["value"] = False
+                        is_processing_file["value"] = False
+                    await event_queue.put({"type": "upload_error", "upload_id": upload["id"], "error": f"Audio upload failed: {e}"})
+
             async def send_text():
                 try:
                     while True:
                         text_or_audio = await text_input_queue.get()
+                        # Handle chunked audio upload
+                        if isinstance(text_or_audio, dict) and "upload" in text_or_audio:
+                            await stream_upload(text_or_audio["upload"])
                         # Handle audio file upload
-                        if isinstance(text_or_audio, dict) and "audio" in text_or_audio:
+                        elif isinstance(text_or_audio, dict) and "audio" in text_or_audio:
                             audio_data = text_or_audio["audio"]
                             mime_type = text_or_audio["mime_type"]
                             try:
@@ -268,6 +993,7 @@ async def websocket_endpoint(websocket: WebSocket):
                                 
                                 # Signal end of audio stream - tells Gemini the audio is complete
                                 await session.send_realtime_input(audio_stream_end=True)
+                                turns.input_ended("upload")
                                 
                                 logger.info("Audio file sent successfully with audio_stream_end")
                             except Exception as e:
@@ -282,12 +1008,48 @@ async def websocket_endpoint(websocket: WebSocket):
                                     turns={"role": "user", "parts": [{"text": text_to_send}]},
                                     turn_complete=True
                                 )
+                                turns.input_ended("text")
                             except Exception as e:
                                 logger.error(f"Error sending text: {e}", exc_info=True)
                 except asyncio.CancelledError:
                     pass
 
-            event_queue = asyncio.Queue()
+            # Tool calls run as background tasks so the receive loop keeps streaming
+            tool_semaphore = asyncio.Semaphore(TOOL_CALL_CONCURRENCY)
+            tool_call_tasks = {}  # function call id -> task
+            tool_batches = set()
+
+            async def run_function_call(fc):
+                name = getattr(fc, "name", None) or "(unknown)"
+                args = getattr(fc, "args", None) or {}
+                async with tool_semaphore:
+                    logger.info(f"Processing email tool: {name}")
+                    started = time.perf_counter()
+                    tool_result = await call_mcp_tool(name, args)
+                    elapsed = time.perf_counter() - started
+                TOOL_CALL_SECONDS.labels(name if name in EMAIL_TOOLS else "other").observe(elapsed)
+                count_shared("tool_calls_total")
+                turns.tool_call(name, elapsed, not (isinstance(tool_result, dict) and tool_result.get("success") is False))
+                return types.FunctionResponse(id=getattr(fc, "id", None), name=name, response=tool_result)
+
+            async def handle_tool_call(function_calls):
+                """Run one tool_call's function calls in parallel and answer them in a single response."""
+                tasks = []
+                for fc in function_calls:
+                    task = asyncio.create_task(run_function_call(fc))
+                    fc_id = getattr(fc, "id", None)
+                    if fc_id:
+                        tool_call_tasks[fc_id] = task
+                    tasks.append(task)
+                try:
+                    results = await asyncio.gather(*tasks, return_exceptions=True)
+                finally:
+                    for fc in function_calls:
+                        tool_call_tasks.pop(getattr(fc, "id", None), None)
+                # Cancelled calls (model interrupted) get no response
+                function_responses = [r for r in results if isinstance(r, types.FunctionResponse)]
+                if function_responses:
+                    await session.send_tool_response(function_responses=function_responses)
 
             async def receive_loop():
                 try:
@@ -299,58 +1061,24 @@ async def websocket_endpoint(websocket: WebSocket):
                                 function_calls = getattr(tool_call, "function_calls", None) or []
                                 logger.info(f"Tool call detected: {len(function_calls)} function(s)")
                                 
-                                for fc in function_calls:
-                                    name = getattr(fc, "name", None) or "(unknown)"
-                                    args = getattr(fc, "args", None) or {}
-                                    
-                                    # Handle email tool calls via MCP proxy
-                                    if name in ["send_email", "send_halloween_invitation", "send_system_alert"]:
-                                        try:
-                                            logger.info(f"Processing email tool: {name}")
-                                            async with httpx.AsyncClient(timeout=30.0) as http_client:
-                                                http_response = await http_client.post(
-                                                    f"{MCP_PROXY_URL}/api/mcp/tools/call",
-                                                    json={
-                                                        "name": name,
-                                                        "arguments": args
-                                                    }
-                                                )
-                                                http_response.raise_for_status()
-                                                result = http_response.json()
-                                                
-                                                if result.get("success"):
-                                                    tool_result = result.get("result", {})
-                                                    logger.info(f"Email tool {name} succeeded")
-                                                    
-                                                    function_response = types.FunctionResponse(
-                                                        name=name,
-                                                        response=tool_result
-                                                    )
-                                                    await session.send_tool_response(function_responses=[function_response])
-                                                else:
-                                                    error_msg = result.get("error", "Unknown error")
-                                                    logger.error(f"Email tool {name} failed: {error_msg}")
-                                                    function_response = types.FunctionResponse(
-                                                        name=name,
-                                                        response={"success": False, "error": error_msg}
-                                                    )
-                                                    await session.send_tool_response(function_responses=[function_response])
-                                        except httpx.HTTPError as e:
-                                            logger.error(f"HTTP error calling email tool {name}: {e}")
-                                            function_response = types.FunctionResponse(
-                                                name=name,
-                                                response={"success": False, "error": f"Network error: {str(e)}"}
-                                            )
-                                            await session.send_tool_response(function_responses=[function_response])
-                                        except Exception as e:
-                                            logger.error(f"Error calling email tool {name}: {e}", exc_info=True)
-                                            function_response = types.FunctionResponse(
-                                                name=name,
-                                                response={"success": False, "error": str(e)}
-                                            )
-                                            await session.send_tool_response(function_responses=[function_response])
+                                # Handle email tool calls via MCP proxy, without blocking this loop
+                                email_calls = [fc for fc in function_calls if getattr(fc, "name", None) in EMAIL_TOOLS]
+                                if email_calls:
+                                    batch = asyncio.create_task(handle_tool_call(email_calls))
+                                    tool_batches.add(batch)
+                                    batch.add_done_callback(tool_batches.discard)
                                 continue  # Skip processing server_content when we have tool_call
                             
+                            # Model was interrupted: cancel the tool calls it no longer wants
+                            cancellation = getattr(response, "tool_call_cancellation", None)
+                            if cancellation:
+                                for fc_id in getattr(cancellation, "ids", None) or []:
+                                    task = tool_call_tasks.get(fc_id)
+                                    if task:
+                                        logger.info(f"Cancelling tool call {fc_id}")
+                                        task.cancel()
+                                continue
+                            
                             server_content = response.server_content
                             
                             if server_content:
@@ -411,9 +1139,11 @@ async def websocket_endpoint(websocket: WebSocket):
                                                 await event_queue.put({"server_content": {"file_upload_complete": True}})
                                         is_processing_file["timer"] = asyncio.create_task(reset_file_flag())
                                     await event_queue.put({"server_content": {"turn_complete": True}})
+                                    turns.finish()
                                 
                                 if server_content.interrupted:
                                     await event_queue.put({"server_content": {"interrupted": True}})
+                                    turns.finish(interrupted=True)
 
                 except Exception as e:
                     await event_queue.put({"type": "error", "error": str(e)})
@@ -432,6 +1162,7 @@ async def websocket_endpoint(websocket: WebSocket):
                         break
                     if isinstance(event, dict):
                         await websocket.send_json(event)
+                        event_queue.mark_delivered()
                         if event.get("type") == "error":
                             break
             finally:
@@ -439,6 +1170,8 @@ async def websocket_endpoint(websocket: WebSocket):
                 send_video_task.cancel()
                 send_text_task.cancel()
                 receive_task_inner.cancel()
+                for batch in list(tool_batches):
+                    batch.cancel()
 
     try:
         await run_session()
@@ -450,6 +1183,10 @@ async def websocket_endpoint(websocket: WebSocket):
             pass
     finally:
         receive_task.cancel()
+        active_connections.pop(connection_id, None)
+        ACTIVE_SESSIONS.dec()
+        if audio_state["vad"]:
+            logger.info(f"VAD stats for connection {connection_id}: {audio_state['vad'].stats()}")
         try:
             await websocket.close()
         except:
@@ -460,4 +1197,14 @@ if __name__ == "__main__":
     import uvicorn
 
     port = int(os.getenv("PORT", 8001))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    if WORKERS > 1:
+        # Workers are separate processes, so uvicorn needs an import string instead of the app object
+        uvicorn.run(
+            "gemini_backend:app",
+            host="0.0.0.0",
+            port=port,
+            workers=WORKERS,
+            app_dir=os.path.dirname(os.path.abspath(__file__)),
+        )
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=port)
@@ -0,0 +1,156 @@
+"""
+Pool of pre-connected Gemini Live sessions.
+
+Opening a Live session (WebSocket connect + setup handshake) is the delay users
+notice before the first greeting. The pool keeps up to `size` sessions connected
+and idle; a new /ws connection takes one over immediately and falls back to a
+fresh connect when the pool is empty. Idle sessions are closed after
+`idle_seconds` so the pool never hands out a session close to the server's
+lifetime limit, and taken or expired slots are refilled in the background.
+"""
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+
+logger = logging.getLogger(__name__)
+
+# Delay before retrying after a failed pre-connect
+RETRY_SECONDS = 5.0
+
+
+class _PooledSession:
+    __slots__ = ("session", "created_at", "taken", "released")
+
+    def __init__(self, session):
+        self.session = session
+        self.created_at = time.monotonic()
+        self.taken = asyncio.Event()
+        self.released = asyncio.Event()
+
+
+class LiveSessionPool:
+    """Keep pre-connected Live sessions ready for new WebSocket connections.
+
+    `connect` is a zero-argument callable returning an async context manager
+    that yields a session, e.g. `lambda: client.aio.live.connect(model=..., config=...)`.
+    """
+
+    def __init__(self, connect, size: int = 2, idle_seconds: float = 300.0, refill: bool = True):
+        self._connect = connect
+        self.size = size
+        self.idle_seconds = idle_seconds
+        self.refill = refill
+
+        self._idle: list[_PooledSession] = []
+        self._holders: set[asyncio.Task] = set()
+        self._warming = 0  # holders connecting or idle, i.e. not yet taken
+        self._closed = False
+
+        self.hits = 0
+        self.misses = 0
+        self.connected = 0
+        self.expired = 0
+        self.failures = 0
+        self._acquire_seconds = {"hit": 0.0, "miss": 0.0}
+
+    def start(self) -> None:
+        self._fill()
+
+    def _fill(self) -> None:
+        while not self._closed and self._warming < self.size:
+            self._warming += 1
+            task = asyncio.create_task(self._hold())
+            self._holders.add(task)
+            task.add_done_callback(self._holders.discard)
+
+    def _leave_pool(self) -> None:
+        self._warming -= 1
+        if self.refill:
+            self._fill()
+
+    async def _hold(self) -> None:
+        """Own one pooled session: connect, wait to be taken or expire, close when released."""
+        taken = False
+        try:
+            async with self._connect() as session:
+                entry = _PooledSession(session)
+                self.connected += 1
+                self._idle.append(entry)
+                try:
+                    await asyncio.wait_for(entry.taken.wait(), self.idle_seconds)
+                except asyncio.TimeoutError:
+                    if entry in self._idle:
+                        self._idle.remove(entry)
+                        self.expired += 1
+                        return
+                taken = True
+                self._leave_pool()
+                # Keep the connection open until the WebSocket handler is done with it
+                await entry.released.wait()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.failures += 1
+            logger.warning(f"Live session pre-connect failed: {e}")
+            await asyncio.sleep(RETRY_SECONDS)
+        finally:
+            if not taken:
+                self._leave_pool()
+
+    def _take(self) -> _PooledSession | None:
+        while self._idle:
+            entry = self._idle.pop(0)
+            if time.monotonic() - entry.created_at < self.idle_seconds:
+                entry.taken.set()
+                return entry
+            # About to expire; let its holder close it
+            entry.released.set()
+            self.expired += 1
+        return None
+
+    @asynccontextmanager
+    async def session(self):
+        """Yield a pooled session if one is idle, else a freshly connected one."""
+        started = time.perf_counter()
+        entry = self._take()
+        if entry is not None:
+            self.hits += 1
+            self._acquire_seconds["hit"] += time.perf_counter() - started
+            try:
+                yield entry.session
+            finally:
+                entry.released.set()
+            return
+
+        self.misses += 1
+        async with self._connect() as session:
+            self._acquire_seconds["miss"] += time.perf_counter() - started
+            yield session
+
+    async def close(self) -> None:
+        self._closed = True
+        for entry in self._idle:
+            entry.released.set()
+        self._idle.clear()
+        for task in list(self._holders):
+            task.cancel()
+        await asyncio.gather(*self._holders, return_exceptions=True)
+
+    def stats(self) -> dict:
+        acquires = self.hits + self.misses
+        return {
+            "enabled": True,
+            "size": self.size,
+            "idle": len(self._idle),
+            "idle_seconds": self.idle_seconds,
+            "refill": self.refill,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / acquires, 4) if acquires else None,
+            "avg_acquire_ms_hit": round(self._acquire_seconds["hit"] * 1000 / self.hits, 2) if self.hits else None,
+            "avg_acquire_ms_miss": round(self._acquire_seconds["miss"] * 1000 / self.misses, 2) if self.misses else None,
+            "connected": self.connected,
+            "expired": self.expired,
+            "failures": self.failures,
+        }
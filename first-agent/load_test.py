@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+"""
+Load test for gemini_backend.py in single- and multi-worker mode.
+
+Starts the backend with LIVE_LOOPBACK=true (no Google credentials needed) for
+each worker count, then opens N concurrent /ws sessions that stream microphone
+audio in real time the way the browser does (Float32 at 48 kHz + audio_config).
+The loopback model answers every second of audio, so the reply latency shows
+when the backend runs out of CPU. Reports p50/p95 reply latency, completed
+turns and server CPU per worker count and session count.
+
+    python load_test.py
+    python load_test.py --workers 1,2,4 --sessions 25,50,100,200 --duration 20
+    python load_test.py --checks
+
+`--checks` runs protocol checks against a one-worker loopback backend instead
+of the load levels.
+"""
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+INPUT_RATE = 48000
+# Loopback replies once per second of 16 kHz audio
+TURN_SECONDS = 1.0
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def get_json(url: str):
+    with urllib.request.urlopen(url, timeout=2) as response:
+        return json.loads(response.read())
+
+
+def process_tree_cpu_seconds(root_pid: int) -> float | None:
+    """utime+stime of a process and its descendants (Linux /proc only)."""
+    if not os.path.isdir("/proc"):
+        return None
+    ticks = os.sysconf("SC_CLK_TCK")
+    stats = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        # fields[1] = ppid, fields[11] = utime, fields[12] = stime
+        stats[int(entry)] = (int(fields[1]), int(fields[11]) + int(fields[12]))
+    tree, frontier = {root_pid}, [root_pid]
+    while frontier:
+        parent = frontier.pop()
+        for pid, (ppid, _) in stats.items():
+            if ppid == parent and pid not in tree:
+                tree.add(pid)
+                frontier.append(pid)
+    return sum(stats[pid][1] for pid in tree if pid in stats) / ticks
+
+
+def start_backend(workers: int, port: int, state_path: str) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        PORT=str(port),
+        WORKERS=str(workers),
+        LIVE_LOOPBACK="true",
+        SHARED_STATE_PATH=state_path,
+        HEARTBEAT_SECONDS="0.5",
+    )
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(BASE_DIR, "gemini_backend.py")],
+        cwd=BASE_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            if len(get_json(f"http://127.0.0.1:{port}/api/load")["workers"]) >= workers:
+                return process
+        except OSError:
+            pass
+        time.sleep(0.3)
+    process.kill()
+    raise RuntimeError(f"backend with {workers} worker(s) did not become ready")
+
+
+async def run_session(url: str, duration: float, block_ms: int, started_at: float) -> dict:
+    import websockets
+
+    block_samples = INPUT_RATE * block_ms // 1000
+    t = np.arange(block_samples) / INPUT_RATE
+    block = (0.2 * np.sin(2 * np.pi * 220 * t)).astype("<f4").tobytes()
+    turn_sent_at = []
+    latencies = []
+    received = {"bytes": 0, "turns": 0, "awaiting_audio": True}
+
+    async with websockets.connect(url, max_size=None) as ws:
+        await ws.send(json.dumps({"type": "audio_config", "sample_rate": INPUT_RATE, "format": "f32le", "channels": 1}))
+
+        async def receive():
+            async for message in ws:
+                if isinstance(message, bytes):
+                    received["bytes"] += len(message)
+                    if received["awaiting_audio"] and turn_sent_at:
+                        latencies.append(time.perf_counter() - turn_sent_at.pop(0))
+                        received["awaiting_audio"] = False
+                elif '"turn_complete"' in message:
+                    received["turns"] += 1
+                    received["awaiting_audio"] = True
+
+        receiver = asyncio.create_task(receive())
+        blocks = int(duration * 1000 / block_ms)
+        blocks_per_turn = int(TURN_SECONDS * 1000 / block_ms)
+        lateness = 0.0
+        for i in range(blocks):
+            target = started_at + i * block_ms / 1000
+            delay = target - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                lateness = max(lateness, -delay)
+            await ws.send(block)
+            if (i + 1) % blocks_per_turn == 0:
+                turn_sent_at.append(time.perf_counter())
+        # Let the last replies arrive
+        await asyncio.sleep(1.0)
+        receiver.cancel()
+
+    return {
+        "latencies": latencies,
+        "turns": received["turns"],
+        "expected_turns": blocks // blocks_per_turn,
+        "bytes": received["bytes"],
+        "max_send_lateness": lateness,
+    }
+
+
+def client_process(args: tuple) -> list[dict]:
+    url, sessions, duration, block_ms, start_at_wall = args
+
+    async def main():
+        # Sessions start staggered over the first second so turn boundaries do not all align
+        base = time.perf_counter() + max(0.0, start_at_wall - time.time())
+        return await asyncio.gather(
+            *(run_session(url, duration, block_ms, base + i / max(1, sessions)) for i in range(sessions)),
+            return_exceptions=True,
+        )
+
+    return [r if isinstance(r, dict) else {"error": repr(r)} for r in asyncio.run(main())]
+
+
+def percentile(values: list[float], pct: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(1, math.ceil(pct / 100 * len(ordered))) - 1]
+
+
+def run_level(port: int, backend_pid: int, sessions: int, args) -> dict:
+    url = f"ws://127.0.0.1:{port}/ws"
+    procs = max(1, min(args.client_procs, sessions))
+    shares = [sessions // procs + (1 if i < sessions % procs else 0) for i in range(procs)]
+    start_at = time.time() + 1.0
+    cpu_before = process_tree_cpu_seconds(backend_pid)
+    wall_before = time.time()
+    with multiprocessing.Pool(procs) as pool:
+        results = [r for chunk in pool.map(client_process, [(url, n, args.duration, args.block_ms, start_at) for n in shares]) for r in chunk]
+    cpu_after = process_tree_cpu_seconds(backend_pid)
+    wall = time.time() - wall_before
+
+    ok = [r for r in results if "error" not in r]
+    latencies = [lat for r in ok for lat in r["latencies"]]
+    turns = sum(r["turns"] for r in ok)
+    expected = sum(r["expected_turns"] for r in ok)
+    p95 = percentile(latencies, 95)
+    return {
+        "sessions": sessions,
+        "failed_sessions": len(results) - len(ok),
+        "p50_reply_ms": round(percentile(latencies, 50) * 1000, 1) if latencies else None,
+        "p95_reply_ms": round(p95 * 1000, 1) if p95 is not None else None,
+        "turn_completion": round(turns / expected, 3) if expected else None,
+        "server_cpu_cores": round((cpu_after - cpu_before) / wall, 2) if cpu_before is not None else None,
+        "sustained": bool(ok) and len(ok) == len(results) and p95 is not None
+        and p95 * 1000 <= args.max_p95_ms and expected and turns / expected >= 0.95,
+    }
+
+def check(name: str, ok: bool, detail: str = "") -> bool:
+    print(f"[load_test] {'PASS' if ok else 'FAIL'} {name}{': ' + detail if detail else ''}", file=sys.stderr)
+    return ok
+
+
+async def upload_session(url: str, steps: list, turns: int = 2, timeout: float = 10.0) -> dict:
+    """Send `steps` (JSON dicts or (upload id, bytes) chunks) and collect replies until `turns` turns, close or timeout."""
+    import websockets
+
+    from ws_framing import KIND_UPLOAD_AUDIO, encode_frame
+
+    seen = {"turns": 0, "errors": [], "upload_errors": [], "config_errors": [], "timed_out": False, "open": False}
+    async with websockets.connect(url, max_size=None) as ws:
+        for step in steps:
+            if isinstance(step, dict):
+                await ws.send(json.dumps(step))
+            else:
+                await ws.send(encode_frame(KIND_UPLOAD_AUDIO, step[0], step[1]))
+        try:
+            async with asyncio.timeout(timeout):
+                async for message in ws:
+                    if isinstance(message, bytes):
+                        continue
+                    event = json.loads(message)
+                    if event.get("type") == "error":
+                        seen["errors"].append(event["error"])
+                    elif event.get("type") == "upload_error":
+                        seen["upload_errors"].append(event["error"])
+                    elif event.get("type") == "audio_config_error":
+                        seen["config_errors"].append(event["error"])
+                    elif '"turn_complete"' in message:
+                        seen["turns"] += 1
+                        if seen["turns"] >= turns:
+                            break
+        except TimeoutError:
+            seen["timed_out"] = True
+        except websockets.ConnectionClosed:
+            pass
+        # The session must still be usable after the replies
+        try:
+            await asyncio.wait_for(await ws.ping(), 2)
+            seen["open"] = True
+        except (websockets.ConnectionClosed, TimeoutError):
+            pass
+    return seen
+
+
+def upload_steps(upload_id: str, chunks: int, chunk_bytes: int = 4000, start: bool = True, end: bool = True) -> list:
+    steps = [{"type": "audio_upload_start", "upload_id": upload_id, "mime_type": "audio/pcm;rate=16000"}] if start else []
+    steps += [(upload_id, bytes(chunk_bytes))] * chunks
+    if end:
+        steps.append({"type": "audio_upload_end", "upload_id": upload_id})
+    return steps
+
+
+def run_checks(port: int) -> bool:
+    url = f"ws://127.0.0.1:{port}/ws"
+    ok = True
+
+    # A second upload started before the first one ends is rejected instead of filling its
+    # queue and stalling the socket reader (which would never see A's end); A still gets its turn
+    steps = (upload_steps("a", 2, end=False) + upload_steps("b", 20)
+             + upload_steps("a", 2, start=False))
+    seen = asyncio.run(upload_session(url, steps, turns=1))
+    ok &= check(
+        "interleaved uploads",
+        seen["turns"] == 1 and seen["open"] and not seen["errors"]
+        and any("rejected" in error for error in seen["upload_errors"]),
+        json.dumps(seen),
+    )
+
+    # Back-to-back uploads (the second starts after the first one's end) are both answered
+    seen = asyncio.run(upload_session(url, upload_steps("a", 2) + upload_steps("b", 2)))
+    ok &= check(
+        "sequential uploads",
+        seen["turns"] >= 2 and seen["open"] and not seen["errors"] and not seen["upload_errors"],
+        json.dumps(seen),
+    )
+
+    # A malformed audio_config is reported and the session keeps working
+    steps = [{"type": "audio_config", "sample_rate": "fast", "format": "f32le"}] + upload_steps("a", 2)
+    seen = asyncio.run(upload_session(url, steps, turns=1))
+    ok &= check(
+        "invalid audio_config",
+        seen["turns"] == 1 and seen["open"] and not seen["errors"] and len(seen["config_errors"]) == 1,
+        json.dumps(seen),
+    )
+    return ok
+
+
+def check_worker_metrics(workers: int = 2) -> bool:
+    """Every /metrics scrape, whichever worker answers, has one labelled series per worker."""
+    port = free_port()
+    backend = start_backend(workers, port, os.path.join(tempfile.mkdtemp(prefix="gemini_load_"), "state.sqlite3"))
+    try:
+        pids = {str(worker["pid"]) for worker in get_json(f"http://127.0.0.1:{port}/api/load")["workers"]}
+        # One heartbeat so every worker has published a snapshot
+        time.sleep(1.5)
+        scrapes = []
+        for _ in range(10):
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=2) as response:
+                text = response.read().decode()
+            scrapes.append({
+                line.split('worker="', 1)[1].split('"', 1)[0]
+                for line in text.splitlines()
+                if line.startswith("gemini_active_sessions{")
+            })
+            if text.count("# TYPE gemini_active_sessions ") != 1:
+                scrapes[-1] = {"duplicate TYPE line"}
+    finally:
+        backend.terminate()
+        try:
+            backend.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            backend.kill()
+    return check(
+        "per-worker metrics",
+        len(pids) == workers and all(seen == pids for seen in scrapes),
+        f"workers={sorted(pids)} scrapes={[sorted(seen) for seen in scrapes]}",
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent-session load test for gemini_backend.py")
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated worker counts")
+    parser.add_argument("--sessions", default="10,25,50,100", help="comma-separated concurrent session counts")
+    parser.add_argument("--duration", type=float, default=15, help="seconds of audio per session")
+    parser.add_argument("--block-ms", type=int, default=20, help="client audio message size in ms")
+    parser.add_argument("--client-procs", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help="load generator processes")
+    parser.add_argument("--max-p95-ms", type=float, default=500, help="p95 reply latency for a level to count as sustained")
+    parser.add_argument("--json", dest="json_path", default=None, help="also write the report to this file")
+    parser.add_argument("--checks", action="store_true", help="run the protocol checks instead of the load levels")
+    args = parser.parse_args()
+
+    if args.checks:
+        port = free_port()
+        backend = start_backend(1, port, os.path.join(tempfile.mkdtemp(prefix="gemini_load_"), "state.sqlite3"))
+        try:
+            ok = run_checks(port)
+        finally:
+            backend.terminate()
+            try:
+                backend.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                backend.kill()
+        ok &= check_worker_metrics()
+        sys.exit(0 if ok else 1)
+
+    report = {"cpu_count": os.cpu_count(), "block_ms": args.block_ms, "duration_s": args.duration, "results": []}
+    for workers in (int(v) for v in args.workers.split(",") if v.strip()):
+        port = free_port()
+        state_path = os.path.join(tempfile.mkdtemp(prefix="gemini_load_"), "state.sqlite3")
+        backend = start_backend(workers, port, state_path)
+        try:
+            levels = []
+            for sessions in (int(v) for v in args.sessions.split(",") if v.strip()):
+                level = run_level(port, backend.pid, sessions, args)
+                levels.append(level)
+                print(f"[load_test] workers={workers} {json.dumps(level)}", file=sys.stderr)
+            sustained = [level["sessions"] for level in levels if level["sustained"]]
+            report["results"].append({
+                "workers": workers,
+                "max_sustained_sessions": max(sustained) if sustained else 0,
+                "levels": levels,
+            })
+        finally:
+            backend.terminate()
+            try:
+                backend.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                backend.kill()
+
+    print(json.dumps(report, indent=2))
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Loopback stand-in for a Gemini Live session (LIVE_LOOPBACK=true).
+
+Lets load tests exercise the whole /ws path (framing, resampling, queues,
+event forwarding) without Google credentials or model cost. After each second
+of user audio, end of audio stream or text turn, it "answers" with
+`reply_seconds` of 24 kHz PCM audio followed by turn_complete, mimicking the
+shape of real Live responses.
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+
+# 16 kHz int16 input; one reply per second of user audio
+TURN_INPUT_BYTES = 32000
+# 24 kHz int16 output, sent in 40 ms chunks
+REPLY_CHUNK_BYTES = 1920
+
+
+def _server_content(**fields):
+    content = dict(
+        model_turn=None,
+        input_transcription=None,
+        output_transcription=None,
+        turn_complete=False,
+        interrupted=False,
+        grounding_metadata=None,
+    )
+    content.update(fields)
+    return SimpleNamespace(
+        tool_call=None,
+        tool_call_cancellation=None,
+        setup_complete=None,
+        server_content=SimpleNamespace(**content),
+    )
+
+
+class LoopbackSession:
+    def __init__(self, reply_seconds: float = 0.5, reply_delay_seconds: float = 0.05):
+        self.reply_seconds = reply_seconds
+        self.reply_delay_seconds = reply_delay_seconds
+        self._turns: asyncio.Queue = asyncio.Queue()
+        self._input_bytes = 0
+
+    async def send_realtime_input(self, audio=None, video=None, audio_stream_end=None, **_):
+        if audio is not None:
+            self._input_bytes += len(audio.data)
+            if self._input_bytes >= TURN_INPUT_BYTES:
+                self._input_bytes = 0
+                self._turns.put_nowait("audio")
+        if audio_stream_end:
+            self._input_bytes = 0
+            self._turns.put_nowait("audio_stream_end")
+
+    async def send_client_content(self, turns=None, turn_complete=True, **_):
+        if turn_complete:
+            self._turns.put_nowait("text")
+
+    async def send_tool_response(self, function_responses=None, **_):
+        pass
+
+    async def receive(self):
+        """Yield one turn's responses, ending after turn_complete like the SDK does."""
+        trigger = await self._turns.get()
+        await asyncio.sleep(self.reply_delay_seconds)
+        yield _server_content(input_transcription=SimpleNamespace(text=f"[loopback {trigger}]"))
+        chunk = bytes(REPLY_CHUNK_BYTES)
+        chunks = max(1, int(self.reply_seconds * 48000 / REPLY_CHUNK_BYTES))
+        for _ in range(chunks):
+            part = SimpleNamespace(inline_data=SimpleNamespace(data=chunk, mime_type="audio/pcm;rate=24000"))
+            yield _server_content(model_turn=SimpleNamespace(parts=[part]))
+        yield _server_content(output_transcription=SimpleNamespace(text="ok", finished=True))
+        yield _server_content(turn_complete=True)
+
+
+@asynccontextmanager
+async def connect_loopback():
+    yield LoopbackSession()
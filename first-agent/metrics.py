@@ -0,0 +1,185 @@
+"""
+Minimal Prometheus metrics for the Gemini Live backend.
+
+Metric children are created once per label set and are meant to be looked up
+when a connection starts and kept in local variables, so recording a value on
+the audio hot path is a float add (plus a bucket search for histograms) with
+no per-chunk objects. `render()` produces the Prometheus text exposition format.
+
+In multi-worker mode each process only sees its own values, so workers publish
+`collect()` output (sample lines labelled with their pid) to shared state and
+any worker can `render()` its own samples together with its peers'.
+"""
+import bisect
+import math
+
+_registry = []
+
+# Latency buckets in seconds, from sub-millisecond queue waits to slow tool calls
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(labelnames, labelvalues, extra=()) -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, labelvalues)]
+    pairs.extend(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ()
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class _HistogramChild:
+    __slots__ = ("_bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds):
+        self._bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self._bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+        _registry.append(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *labelvalues):
+        """Return the child for these label values (look it up once, outside hot loops)."""
+        key = tuple(str(v) for v in labelvalues)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            child = self._children[key] = self._new_child()
+        return child
+
+    def _samples(self, const=()):
+        for key, child in list(self._children.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key, const)} {_format_value(child.value)}"
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._children[()].inc(amount)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._children[()].inc(amount)
+
+    def dec(self, amount: float = 1.0) -> None:
+        self._children[()].dec(amount)
+
+    def set(self, value: float) -> None:
+        self._children[()].set(value)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self._children[()].observe(value)
+
+    def _samples(self, const=()):
+        for key, child in list(self._children.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), child.counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, (*const, le))} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key, const)} {_format_value(child.sum)}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key, const)} {child.count}"
+
+
+def _const_pairs(const_labels) -> tuple:
+    return tuple(f'{name}="{value}"' for name, value in (const_labels or {}).items())
+
+
+def collect(const_labels: dict | None = None) -> dict[str, list[str]]:
+    """Sample lines per metric name, with `const_labels` (e.g. {"worker": pid}) added to every series."""
+    const = _const_pairs(const_labels)
+    return {metric.name: list(metric._samples(const)) for metric in _registry}
+
+
+def render(const_labels: dict | None = None, peers=()) -> str:
+    """Text exposition of this process's metrics, followed per metric by the samples in `peers` (collect() output)."""
+    const = _const_pairs(const_labels)
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.header())
+        lines.extend(metric._samples(const))
+        for peer in peers:
+            lines.extend(peer.get(metric.name, ()))
+    return "\n".join(lines) + "\n"
+
+
+# Gemini Live backend metrics
+ACTIVE_SESSIONS = Gauge("gemini_active_sessions", "Open /ws connections")
+SESSIONS_TOTAL = Counter("gemini_sessions_total", "Accepted /ws connections")
+TTFB_SECONDS = Histogram(
+    "gemini_time_to_first_audio_seconds",
+    "Time from end of user input to the first model audio byte",
+    labelnames=("trigger",),
+)
+TOOL_CALL_SECONDS = Histogram("gemini_tool_call_seconds", "Tool call round-trip time", labelnames=("tool",))
+QUEUE_WAIT_SECONDS = Histogram("gemini_queue_wait_seconds", "Time items wait in per-connection queues", labelnames=("queue",))
+QUEUE_DROPPED = Counter("gemini_queue_dropped_total", "Items dropped from per-connection queues", labelnames=("queue",))
+STREAM_BYTES = Counter("gemini_stream_bytes_total", "Bytes per stream and direction", labelnames=("stream", "direction"))
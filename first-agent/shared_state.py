@@ -0,0 +1,121 @@
+"""
+Process-safe shared state for multi-worker deployments of gemini_backend.py.
+
+Each uvicorn worker is a separate process, so in-memory counters only describe
+one worker. Workers share a small SQLite database (WAL mode) on the local disk:
+a heartbeat row per worker with its session counts, and named counters that
+any worker can increment. /api/load reads it to report load for all workers.
+Workers also publish a snapshot of their Prometheus samples so /metrics can
+report every worker whichever one answers the scrape.
+"""
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+
+def default_state_path() -> str:
+    return os.path.join(tempfile.gettempdir(), "gemini_backend_state.sqlite3")
+
+
+class SharedState:
+    """Worker registry and counters stored in one SQLite file shared by all workers."""
+
+    def __init__(self, path: str | None = None, stale_seconds: float = 10.0):
+        self.path = path or default_state_path()
+        self.stale_seconds = stale_seconds
+        self.pid = os.getpid()
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS workers ("
+            " pid INTEGER PRIMARY KEY,"
+            " started_at REAL NOT NULL,"
+            " heartbeat REAL NOT NULL,"
+            " active_sessions INTEGER NOT NULL DEFAULT 0,"
+            " total_sessions INTEGER NOT NULL DEFAULT 0,"
+            " ready INTEGER NOT NULL DEFAULT 1)"
+        )
+        self._db.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value REAL NOT NULL)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS metrics (pid INTEGER PRIMARY KEY, samples TEXT NOT NULL)")
+
+    def register_worker(self) -> None:
+        now = time.time()
+        with self._lock:
+            # Rows of workers that stopped without unregistering (crash, kill -9)
+            self._db.execute("DELETE FROM workers WHERE heartbeat < ?", (now - self.stale_seconds,))
+            self._db.execute("DELETE FROM metrics WHERE pid NOT IN (SELECT pid FROM workers)")
+            self._db.execute(
+                "INSERT OR REPLACE INTO workers (pid, started_at, heartbeat) VALUES (?, ?, ?)",
+                (self.pid, now, now),
+            )
+
+    def heartbeat(self, active_sessions: int, total_sessions: int, ready: bool = True) -> None:
+        with self._lock:
+            self._db.execute(
+                "UPDATE workers SET heartbeat = ?, active_sessions = ?, total_sessions = ?, ready = ? WHERE pid = ?",
+                (time.time(), active_sessions, total_sessions, int(ready), self.pid),
+            )
+
+    def unregister_worker(self) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM workers WHERE pid = ?", (self.pid,))
+            self._db.execute("DELETE FROM metrics WHERE pid = ?", (self.pid,))
+
+    def workers(self) -> list[dict]:
+        """Live workers (recent heartbeat), least loaded first."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT pid, started_at, heartbeat, active_sessions, total_sessions, ready FROM workers"
+                " WHERE heartbeat >= ? ORDER BY active_sessions, pid",
+                (time.time() - self.stale_seconds,),
+            ).fetchall()
+        return [
+            {
+                "pid": pid,
+                "uptime_seconds": round(time.time() - started_at, 1),
+                "heartbeat_age_seconds": round(time.time() - heartbeat, 2),
+                "active_sessions": active,
+                "total_sessions": total,
+                "ready": bool(ready),
+            }
+            for pid, started_at, heartbeat, active, total, ready in rows
+        ]
+
+    def incr(self, name: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO counters (name, value) VALUES (?, ?)"
+                " ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                (name, amount),
+            )
+
+    def counters(self) -> dict:
+        with self._lock:
+            return dict(self._db.execute("SELECT name, value FROM counters ORDER BY name").fetchall())
+
+    def publish_metrics(self, samples: dict) -> None:
+        """Store this worker's metrics.collect() output for the other workers' /metrics."""
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO metrics (pid, samples) VALUES (?, ?)",
+                (self.pid, json.dumps(samples)),
+            )
+
+    def peer_metrics(self) -> list[dict]:
+        """Last published samples of the other live workers."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT metrics.samples FROM metrics JOIN workers ON workers.pid = metrics.pid"
+                " WHERE metrics.pid != ? AND workers.heartbeat >= ? ORDER BY metrics.pid",
+                (self.pid, time.time() - self.stale_seconds),
+            ).fetchall()
+        return [json.loads(samples) for (samples,) in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
@@ -102,6 +102,12 @@ function handleServerMessage(data: any): void {
     return;
   }
 
+  // Non-fatal backend errors: the session stays open
+  if (data?.type === 'upload_error' || data?.type === 'audio_config_error') {
+    console.warn(`⚠️ Gemini Live: ${data.error}`);
+    return;
+  }
+
   // File upload complete - reset file upload session
   if (sc?.file_upload_complete) {
     console.log('✅ Gemini Live: File upload complete, resetting session state');
@@ -395,43 +401,21 @@ export function disconnectGeminiSession(): void {
   scheduledSources = [];
 }
 
-const GEMINI_MIC_TARGET_RATE = 16000;
 const GEMINI_MIC_BUFFER_SIZE = 1024;
 
-/** Resample Float32 from context sample rate to 16kHz (simple linear downsampling). */
-function resampleTo16k(float32: Float32Array, sourceRate: number): Float32Array {
-  if (sourceRate === GEMINI_MIC_TARGET_RATE) return float32;
-  const ratio = sourceRate / GEMINI_MIC_TARGET_RATE;
-  const outLen = Math.floor(float32.length / ratio);
-  const out = new Float32Array(outLen);
-  for (let i = 0; i < outLen; i++) {
-    const srcIdx = i * ratio;
-    const j = Math.floor(srcIdx);
-    const t = srcIdx - j;
-    out[i] = float32[j] * (1 - t) + (float32[j + 1] ?? float32[j]) * t;
-  }
-  return out;
-}
-
-/** Convert Float32 to PCM16 base64 for Gemini (16kHz). */
-function float32ToPcm16Base64(float32: Float32Array): string {
-  const pcm16 = new Int16Array(float32.length);
-  for (let i = 0; i < float32.length; i++) {
-    const s = Math.max(-1, Math.min(1, float32[i]));
-    pcm16[i] = s < 0 ? s * 0x8000 : s * 0x7fff;
-  }
-  let binary = '';
-  for (let i = 0; i < pcm16.length; i++) {
-    binary += String.fromCharCode(pcm16[i] & 0xff, (pcm16[i] >> 8) & 0xff);
-  }
-  return btoa(binary);
+/**
+ * Tell the backend the PCM format of subsequent binary audio messages.
+ * The backend resamples to 16kHz int16 and coalesces small blocks into frames.
+ */
+function sendAudioConfig(sampleRate: number, format: 'f32le' | 's16le'): void {
+  if (!ws || ws.readyState !== WebSocket.OPEN) return;
+  ws.send(JSON.stringify({ type: 'audio_config', sample_rate: sampleRate, format, channels: 1 }));
 }
 
-function sendMicChunk(float32: Float32Array, sampleRate: number): void {
+function sendMicChunk(float32: Float32Array): void {
   if (!ws || ws.readyState !== WebSocket.OPEN || isMicMuted) return;
-  const resampled = resampleTo16k(float32, sampleRate);
-  const base64 = float32ToPcm16Base64(resampled);
-  sendGeminiAudioBase64(base64);
+  // Raw Float32 at the capture rate; copy since ScriptProcessor reuses its buffer
+  ws.send(float32.slice().buffer);
 }
 
 /**
@@ -455,7 +439,7 @@ export async function startGeminiMicrophone(): Promise<void> {
   micContext = new (window.AudioContext || (window as any).webkitAudioContext)();
   if (micContext.state === 'suspended') await micContext.resume();
   const source = micContext.createMediaStreamSource(micStream);
-  const sampleRate = micContext.sampleRate;
+  sendAudioConfig(micContext.sampleRate, 'f32le');
 
   try {
     await micContext.audioWorklet.addModule('/gemini-capture-processor.js');
@@ -465,7 +449,7 @@ export async function startGeminiMicrophone(): Promise<void> {
     });
     workletNode.port.onmessage = (ev: MessageEvent) => {
       if (ev.data?.type === 'audio' && ev.data.data) {
-        sendMicChunk(ev.data.data as Float32Array, sampleRate);
+        sendMicChunk(ev.data.data as Float32Array);
       }
     };
     source.connect(workletNode);
@@ -475,7 +459,7 @@ export async function startGeminiMicrophone(): Promise<void> {
     const scriptNode = micContext.createScriptProcessor(GEMINI_MIC_BUFFER_SIZE, 1, 1);
     scriptNode.onaudioprocess = (e) => {
       const input = e.inputBuffer.getChannelData(0);
-      sendMicChunk(input, e.inputBuffer.sampleRate);
+      sendMicChunk(input);
     };
     source.connect(scriptNode);
     scriptNode.connect(micContext.destination);
@@ -488,6 +472,8 @@ export async function startGeminiMicrophone(): Promise<void> {
  */
 export function stopGeminiMicrophone(): void {
   isMicMuted = false;
+  // Binary audio sent outside the mic (e.g. sendGeminiAudioBase64) is 16kHz int16
+  sendAudioConfig(16000, 's16le');
   if (micNode) {
     try {
       micNode.disconnect();
@@ -542,34 +528,91 @@ export function sendGeminiText(text: string): void {
   ws.send(JSON.stringify({ text: text }));
 }
 
-/** Chunk size for file upload: ~100ms at 16kHz 16-bit mono. */
-const GEMINI_AUDIO_CHUNK_BYTES = 3200;
+/** Chunk size for file upload: ~1s at 16kHz 16-bit mono. */
+const GEMINI_AUDIO_CHUNK_BYTES = 32000;
+/** Pause sending upload chunks while this much data is still queued on the socket. */
+const GEMINI_UPLOAD_MAX_BUFFERED_BYTES = 256 * 1024;
+
+/** Binary envelope understood by gemini_backend.py (see ws_framing.py). */
+const FRAME_MAGIC = [0x47, 0x4c, 0x46, 0x31]; // "GLF1"
+const FRAME_KIND_UPLOAD_AUDIO = 1;
+const FRAME_KIND_IMAGE = 2;
+
+function encodeFrame(kind: number, streamId: string, payload: Uint8Array): ArrayBuffer {
+  const id = new TextEncoder().encode(streamId);
+  const frame = new Uint8Array(FRAME_MAGIC.length + 2 + id.length + payload.length);
+  frame.set(FRAME_MAGIC, 0);
+  frame[FRAME_MAGIC.length] = kind;
+  frame[FRAME_MAGIC.length + 1] = id.length;
+  frame.set(id, FRAME_MAGIC.length + 2);
+  frame.set(payload, FRAME_MAGIC.length + 2 + id.length);
+  return frame.buffer;
+}
+
+async function waitForSocketDrain(socket: WebSocket): Promise<void> {
+  while (socket.readyState === WebSocket.OPEN && socket.bufferedAmount > GEMINI_UPLOAD_MAX_BUFFERED_BYTES) {
+    await new Promise((resolve) => setTimeout(resolve, 20));
+  }
+}
+
+// The backend accepts one chunked upload per connection at a time
+let audioUploadInFlight: Promise<void> | null = null;
 
 /**
  * Send audio file as user input.
- * Sends the entire audio file at once (not streaming) so Gemini will process it completely before responding.
+ * Streams the file as chunked binary frames; the backend forwards them to Gemini at a
+ * controlled pace and ends the audio stream so Gemini processes it before responding.
+ * Uploads started while another is still sending wait for it to finish.
  */
 export async function sendGeminiAudioFromFile(file: File): Promise<void> {
+  while (audioUploadInFlight) {
+    await audioUploadInFlight.catch(() => undefined);
+  }
+  const upload = streamAudioUpload(file);
+  audioUploadInFlight = upload;
+  try {
+    await upload;
+  } finally {
+    if (audioUploadInFlight === upload) {
+      audioUploadInFlight = null;
+    }
+  }
+}
+
+async function streamAudioUpload(file: File): Promise<void> {
   if (!ws || ws.readyState !== WebSocket.OPEN) {
     throw new Error('WebSocket not connected');
   }
-  
+  const socket = ws;
+
   const pcmBuffer = await fileToPcm16k(file);
   const bytes = new Uint8Array(pcmBuffer);
-  
-  // Convert entire audio to base64
-  let binary = '';
-  for (let i = 0; i < bytes.length; i++) {
-    binary += String.fromCharCode(bytes[i]);
-  }
-  const base64Audio = btoa(binary);
-  
-  // Send as a special audio upload message (not realtime streaming)
-  ws.send(JSON.stringify({
-    type: 'audio_file',
-    data: base64Audio,
+  const uploadId = `upload-${Date.now()}-${Math.random().toString(36).slice(2, 8)}`;
+
+  socket.send(JSON.stringify({
+    type: 'audio_upload_start',
+    upload_id: uploadId,
     mime_type: 'audio/pcm;rate=16000'
   }));
+  for (let offset = 0; offset < bytes.length; offset += GEMINI_AUDIO_CHUNK_BYTES) {
+    await waitForSocketDrain(socket);
+    if (socket.readyState !== WebSocket.OPEN) {
+      throw new Error('WebSocket closed during audio upload');
+    }
+    const chunk = bytes.subarray(offset, offset + GEMINI_AUDIO_CHUNK_BYTES);
+    socket.send(encodeFrame(FRAME_KIND_UPLOAD_AUDIO, uploadId, chunk));
+  }
+  socket.send(JSON.stringify({ type: 'audio_upload_end', upload_id: uploadId }));
+}
+
+/**
+ * Send one camera frame (JPEG) as a binary frame, avoiding base64/JSON overhead.
+ * The backend drops near-duplicate frames and throttles when the session lags.
+ */
+export async function sendGeminiImageFrame(jpeg: Blob | ArrayBuffer): Promise<void> {
+  if (!ws || ws.readyState !== WebSocket.OPEN) return;
+  const buffer = jpeg instanceof Blob ? await jpeg.arrayBuffer() : jpeg;
+  ws.send(encodeFrame(FRAME_KIND_IMAGE, 'camera', new Uint8Array(buffer)));
 }
 
 /** Gemini Live supports mute by controlling microphone input. */
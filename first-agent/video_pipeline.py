@@ -0,0 +1,135 @@
+"""
+Adaptive frame-rate control for camera frames sent to Gemini Live.
+
+Each JPEG frame gets a cheap 64-bit difference hash (dHash). The decoder is
+asked for a reduced-size draft, so hashing does not decode the full image.
+Frames are skipped when they arrive faster than the allowed rate, or when they
+are nearly identical to the last frame sent. When the upstream session lags,
+the allowed rate backs off and frames are downscaled before sending.
+
+Pillow is optional: without it only rate-based skipping is done.
+"""
+import io
+import logging
+import time
+
+import numpy as np
+
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+MAX_INTERVAL_SCALE = 8.0
+
+
+def dhash(image) -> int:
+    """64-bit difference hash of a PIL image (horizontal gradient signs of a 9x8 thumbnail)."""
+    gray = np.asarray(image.convert("L").resize((9, 8), Image.BILINEAR), dtype=np.int16)
+    bits = (gray[:, 1:] > gray[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+class AdaptiveFrameController:
+    """Decide which camera frames to forward upstream, and at what size."""
+
+    def __init__(self, max_fps: float = 2.0, similarity_bits: int = 5, keyframe_seconds: float = 5.0,
+                 lag_ms: float = 400.0, lag_max_side: int = 384, jpeg_quality: int = 70):
+        self.max_fps = max_fps
+        self.similarity_bits = similarity_bits
+        self.keyframe_seconds = keyframe_seconds
+        self.lag_ms = lag_ms
+        self.lag_max_side = lag_max_side
+        self.jpeg_quality = jpeg_quality
+
+        self._interval_scale = 1.0
+        self._last_sent_at = None
+        self._last_hash = None
+
+        self.frames_in = 0
+        self.frames_sent = 0
+        self.skipped_rate = 0
+        self.skipped_similar = 0
+        self.downscaled = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def offer(self, jpeg: bytes, upstream_lag_ms: float = 0.0, upstream_backlog: int = 0, now: float | None = None) -> bytes | None:
+        """Return the frame (possibly downscaled) to forward, or None to skip it."""
+        now = time.monotonic() if now is None else now
+        self.frames_in += 1
+        self.bytes_in += len(jpeg)
+
+        lagging = upstream_lag_ms > self.lag_ms or upstream_backlog > 0
+        if lagging:
+            self._interval_scale = min(MAX_INTERVAL_SCALE, self._interval_scale * 2)
+        else:
+            self._interval_scale = max(1.0, self._interval_scale * 0.8)
+
+        since_last = None if self._last_sent_at is None else now - self._last_sent_at
+        if since_last is not None and self.max_fps > 0 and since_last < self._interval_scale / self.max_fps:
+            self.skipped_rate += 1
+            return None
+
+        image = None
+        frame_hash = None
+        if PIL_AVAILABLE:
+            try:
+                image = Image.open(io.BytesIO(jpeg))
+                # JPEG draft mode decodes at 1/2..1/8 scale, enough for a 9x8 hash
+                image.draft("L", (64, 64))
+                frame_hash = dhash(image)
+            except Exception as e:
+                logger.debug(f"Could not hash video frame: {e}")
+                image = None
+
+        if (
+            frame_hash is not None
+            and self._last_hash is not None
+            and (frame_hash ^ self._last_hash).bit_count() <= self.similarity_bits
+            and since_last is not None
+            and since_last < self.keyframe_seconds
+        ):
+            self.skipped_similar += 1
+            return None
+
+        if lagging and image is not None:
+            jpeg = self._downscale(jpeg)
+
+        self._last_sent_at = now
+        self._last_hash = frame_hash
+        self.frames_sent += 1
+        self.bytes_out += len(jpeg)
+        return jpeg
+
+    def _downscale(self, jpeg: bytes) -> bytes:
+        try:
+            image = Image.open(io.BytesIO(jpeg))
+            if max(image.size) <= self.lag_max_side:
+                return jpeg
+            image.draft("RGB", (self.lag_max_side, self.lag_max_side))
+            image = image.convert("RGB")
+            image.thumbnail((self.lag_max_side, self.lag_max_side))
+            out = io.BytesIO()
+            image.save(out, format="JPEG", quality=self.jpeg_quality)
+        except Exception as e:
+            logger.debug(f"Could not downscale video frame: {e}")
+            return jpeg
+        self.downscaled += 1
+        return out.getvalue()
+
+    def stats(self) -> dict:
+        return {
+            "perceptual_hash": PIL_AVAILABLE,
+            "frames_in": self.frames_in,
+            "frames_sent": self.frames_sent,
+            "skipped_rate": self.skipped_rate,
+            "skipped_similar": self.skipped_similar,
+            "downscaled": self.downscaled,
+            "interval_scale": round(self._interval_scale, 2),
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+        }
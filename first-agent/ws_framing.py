@@ -0,0 +1,44 @@
+"""
+Binary message envelope for the Gemini Live /ws endpoint.
+
+Plain binary WebSocket messages are realtime microphone audio. Binary messages
+that start with `MAGIC` carry a typed payload for a named stream instead:
+
+    MAGIC (4 bytes) | kind (1 byte) | id length (1 byte) | id (utf-8) | payload
+
+The same layout is built by `encodeFrame` in src/geminiLive.ts.
+"""
+MAGIC = b"GLF1"
+KIND_UPLOAD_AUDIO = 1
+KIND_IMAGE = 2
+
+_HEADER_BYTES = len(MAGIC) + 2
+
+
+class FrameError(ValueError):
+    pass
+
+
+def encode_frame(kind: int, stream_id: str, payload: bytes) -> bytes:
+    encoded_id = stream_id.encode("utf-8")
+    if len(encoded_id) > 255:
+        raise FrameError("stream id too long")
+    return MAGIC + bytes((kind, len(encoded_id))) + encoded_id + payload
+
+
+def parse_frame(data: bytes) -> tuple[int, str, memoryview] | None:
+    """Return (kind, stream id, payload view), or None for a plain audio message."""
+    if not data.startswith(MAGIC):
+        return None
+    if len(data) < _HEADER_BYTES:
+        raise FrameError("truncated frame header")
+    view = memoryview(data)
+    kind = view[len(MAGIC)]
+    id_end = _HEADER_BYTES + view[len(MAGIC) + 1]
+    if len(data) < id_end:
+        raise FrameError("truncated frame id")
+    try:
+        stream_id = bytes(view[_HEADER_BYTES:id_end]).decode("utf-8")
+    except UnicodeDecodeError as e:
+        raise FrameError(f"invalid frame id: {e}") from e
+    return kind, stream_id, view[id_end:]
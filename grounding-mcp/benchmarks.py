@@ -0,0 +1,481 @@
+#!/usr/bin/env python3
+"""
+Offline benchmarks for the grounding MCP server.
+
+Uses a fake GenAI client (no API key or network), injected through
+`GroundingSearchServer(client=...)`, and fails with a non-zero exit code when a
+check does not hold.
+
+    python benchmarks.py concurrency --searches 8 --latency 0.5
+    python benchmarks.py cache --repeats 20 --latency 0.5
+    python benchmarks.py citations --sentences 2000
+    python benchmarks.py stream --latency 2.0 --chunks 20
+    python benchmarks.py batch --queries 6 --latency 0.5
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+from grounding_mcp.citations import build_citations
+from grounding_mcp.result_cache import GroundingResultCache, cache_key
+from grounding_mcp.server import GROUNDING_BATCH_MAX_QUERIES, GROUNDING_MAX_CONCURRENCY, GroundingSearchServer
+
+
+def fake_response(query: str) -> SimpleNamespace:
+    """A generate_content response with one grounding support per sentence."""
+    text = f"Answer about {query}. It has two sentences."
+    first_end = len(f"Answer about {query}.".encode("utf-8"))
+    metadata = SimpleNamespace(
+        grounding_chunks=[
+            SimpleNamespace(web=SimpleNamespace(uri="https://example.com/a", title="a")),
+            SimpleNamespace(web=SimpleNamespace(uri="https://example.com/b", title="b")),
+        ],
+        grounding_supports=[
+            SimpleNamespace(segment=SimpleNamespace(start_index=0, end_index=first_end), grounding_chunk_indices=[0]),
+            SimpleNamespace(segment=SimpleNamespace(start_index=first_end + 1, end_index=len(text.encode("utf-8"))), grounding_chunk_indices=[0, 1]),
+        ],
+    )
+    return SimpleNamespace(text=text, candidates=[SimpleNamespace(grounding_metadata=metadata)])
+
+
+class FakeModels:
+    def __init__(self, latency: float, chunks: int = 10):
+        self.latency = latency
+        self.chunks = chunks
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def generate_content(self, model, contents, config=None):
+        """Queries containing "[fail]" raise, "[slow]" take ten times the latency."""
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency * (10 if "[slow]" in contents else 1))
+        finally:
+            self.in_flight -= 1
+        if "[fail]" in contents:
+            raise RuntimeError("upstream error")
+        return fake_response(contents)
+
+    async def generate_content_stream(self, model, contents, config=None):
+        """Yields the answer in `chunks` pieces spread over `latency`; grounding metadata comes last."""
+        self.calls += 1
+        response = fake_response(contents)
+        step = max(1, math.ceil(len(response.text) / self.chunks))
+        pieces = [response.text[i:i + step] for i in range(0, len(response.text), step)]
+        self.last_stream_chunks = len(pieces)
+        no_metadata = [SimpleNamespace(grounding_metadata=None)]
+
+        async def stream():
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            try:
+                for i, piece in enumerate(pieces):
+                    await asyncio.sleep(self.latency / len(pieces))
+                    last = i == len(pieces) - 1
+                    yield SimpleNamespace(text=piece, candidates=response.candidates if last else no_metadata)
+            finally:
+                self.in_flight -= 1
+        return stream()
+
+
+class FakeClient:
+    """Stands in for genai.Client: only the `client.aio.models` surface is used."""
+
+    def __init__(self, latency: float = 0.5, chunks: int = 10):
+        self.models = FakeModels(latency, chunks)
+        self.aio = SimpleNamespace(models=self.models)
+
+
+def check(condition: bool, message: str, failures: list) -> None:
+    print(f"[{'ok' if condition else 'FAIL'}] {message}")
+    if not condition:
+        failures.append(message)
+
+
+async def bench_concurrency(args) -> list:
+    """N concurrent searches should take about as long as one upstream call."""
+    failures = []
+    client = FakeClient(latency=args.latency)
+    server = GroundingSearchServer(client=client)
+    limit = args.max_concurrency or GROUNDING_MAX_CONCURRENCY
+    server._semaphore = asyncio.Semaphore(limit)
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(
+        server._grounded_search({"query": f"question {i}"}) for i in range(args.searches)
+    ))
+    elapsed = time.perf_counter() - started
+    # Searches run in waves of `limit`; sequential execution would take searches x latency
+    expected = args.latency * math.ceil(args.searches / limit)
+    print(f"{args.searches} searches, {args.latency:.2f}s upstream latency, limit {limit}: {elapsed:.2f}s wall "
+          f"(sequential would be {args.searches * args.latency:.2f}s), max {client.models.max_in_flight} in flight")
+    check(all("Answer about" in r[0].text for r in results), "every search returned an answer", failures)
+    check(elapsed < expected * 1.5, f"wall time {elapsed:.2f}s ~ {expected:.2f}s expected", failures)
+    check(client.models.max_in_flight <= limit, f"at most {limit} upstream calls in flight", failures)
+
+    # Timeout: a slow upstream call is abandoned with an error message
+    server.timeout = args.latency / 5
+    result = await server._grounded_search({"query": "slow"})
+    check("timed out" in result[0].text, "slow call returns a timeout error", failures)
+    server.timeout = 30
+
+    # Cancellation: cancelling the tool call cancels the upstream request
+    task = asyncio.create_task(server._grounded_search({"query": "cancelled"}))
+    await asyncio.sleep(args.latency / 5)
+    task.cancel()
+    try:
+        await task
+        cancelled = False
+    except asyncio.CancelledError:
+        cancelled = True
+    await asyncio.sleep(0)
+    check(cancelled and client.models.in_flight == 0, "cancellation propagates and frees the upstream call", failures)
+    return failures
+
+
+async def bench_cache(args) -> list:
+    """Repeated and concurrent identical queries should cost one upstream call."""
+    failures = []
+    client = FakeClient(latency=args.latency)
+    server = GroundingSearchServer(client=client)
+    server.cache = GroundingResultCache(ttl_seconds=60, max_entries=args.max_entries)
+
+    # Rephrasings that only differ in case, spacing or trailing punctuation share an entry
+    variants = ["Who won the match?", "who won the match", "  Who  won the MATCH？", "who won the match."]
+    started = time.perf_counter()
+    first = await server._grounded_search({"query": variants[0]})
+    miss_time = time.perf_counter() - started
+    started = time.perf_counter()
+    for i in range(args.repeats):
+        await server._grounded_search({"query": variants[i % len(variants)]})
+    hit_time = (time.perf_counter() - started) / args.repeats
+    print(f"miss {miss_time * 1000:.1f}ms, hit {hit_time * 1000:.3f}ms avg over {args.repeats} repeats")
+    check(client.models.calls == 1, f"{args.repeats + 1} repeated queries made {client.models.calls} upstream call(s)", failures)
+    check(hit_time < miss_time / 10, "cache hits are much faster than the upstream call", failures)
+
+    # include_citations is part of the key
+    await server._grounded_search({"query": variants[0], "include_citations": False})
+    check(client.models.calls == 2, "include_citations=false is cached separately", failures)
+
+    # Concurrent identical queries share one in-flight request
+    calls = client.models.calls
+    results = await asyncio.gather(*(
+        server._grounded_search({"query": "breaking news"}) for _ in range(args.concurrent)
+    ))
+    check(client.models.calls == calls + 1, f"{args.concurrent} concurrent identical queries made "
+          f"{client.models.calls - calls} upstream call(s) (coalesced {server.coalesced})", failures)
+    check(len({r[0].text for r in results}) == 1, "coalesced callers all got the same answer", failures)
+
+    # Cancelling one coalesced caller does not cancel the shared request
+    a = asyncio.create_task(server._grounded_search({"query": "shared"}))
+    b = asyncio.create_task(server._grounded_search({"query": "shared"}))
+    await asyncio.sleep(args.latency / 5)
+    a.cancel()
+    result = await b
+    check(a.cancelled() and "Answer about" in result[0].text, "other caller still gets the answer after one cancels", failures)
+
+    # A caller that joins right as the last other caller is cancelled starts a fresh request
+    # instead of inheriting the cancellation
+    a = asyncio.create_task(server._grounded_search({"query": "handover"}))
+    await asyncio.sleep(args.latency / 5)
+    a.cancel()
+    b = asyncio.create_task(server._grounded_search({"query": "handover"}))
+    try:
+        result = await b
+    except asyncio.CancelledError:
+        result = None
+    check(a.cancelled() and result is not None and "Answer about" in result[0].text,
+          "joining as the owner is cancelled still returns an answer", failures)
+
+    # A caller whose shared request is cancelled under it restarts the request
+    b = asyncio.create_task(server._grounded_search({"query": "restarted"}))
+    await asyncio.sleep(args.latency / 5)
+    server._inflight[cache_key("restarted", True)].cancel()
+    try:
+        result = await b
+    except asyncio.CancelledError:
+        result = None
+    check(result is not None and "Answer about" in result[0].text, "a cancelled shared request is restarted for its waiters", failures)
+
+    # Failures are not cached
+    server.timeout = args.latency / 5
+    await server._grounded_search({"query": "flaky"})
+    server.timeout = 30
+    calls = client.models.calls
+    result = await server._grounded_search({"query": "flaky"})
+    check(client.models.calls == calls + 1 and "Answer about" in result[0].text, "errors are retried, not cached", failures)
+
+    # TTL expiry
+    server.cache.ttl_seconds = args.latency / 5
+    await server._grounded_search({"query": "score"})
+    await asyncio.sleep(args.latency / 4)
+    calls = client.models.calls
+    await server._grounded_search({"query": "score"})
+    check(client.models.calls == calls + 1, "expired entries are fetched again", failures)
+    server.cache.ttl_seconds = 60
+
+    # LRU bound
+    for i in range(args.max_entries + 10):
+        server.cache.set(f"1:filler {i}", "x")
+    check(len(server.cache._memory) == args.max_entries, f"memory tier bounded at {args.max_entries} entries", failures)
+
+    print(f"cache stats: {server.cache.stats()}")
+
+    # Persistence across restarts
+    path = os.path.join(tempfile.mkdtemp(prefix="grounding_cache_"), "cache.sqlite3")
+    server.cache = GroundingResultCache(ttl_seconds=60, max_entries=args.max_entries, persist_path=path)
+    await server._grounded_search({"query": "persisted"})
+    restarted = GroundingSearchServer(client=client)
+    restarted.cache = GroundingResultCache(ttl_seconds=60, max_entries=args.max_entries, persist_path=path)
+    calls = client.models.calls
+    result = await restarted._grounded_search({"query": "persisted"})
+    check(client.models.calls == calls and "Answer about" in result[0].text, "entries survive a restart via GROUNDING_CACHE_PATH", failures)
+
+    # The SQLite tier is trimmed on write: expired rows go, and rows are capped at max_entries
+    cache = restarted.cache
+    cache.ttl_seconds = 0.05
+    cache.set("1:short lived", "x")
+    await asyncio.sleep(0.1)
+    cache.ttl_seconds = 60
+    for i in range(args.max_entries * 3):
+        cache.set(f"1:persisted filler {i}", "x")
+    rows = cache._db.execute("SELECT COUNT(*) FROM grounding_cache").fetchone()[0]
+    expired = cache._db.execute("SELECT COUNT(*) FROM grounding_cache WHERE key = '1:short lived'").fetchone()[0]
+    newest = cache._db.execute(
+        "SELECT COUNT(*) FROM grounding_cache WHERE key = ?", (f"1:persisted filler {args.max_entries * 3 - 1}",)
+    ).fetchone()[0]
+    check(rows == args.max_entries and not expired and newest,
+          f"SQLite tier bounded at {args.max_entries} rows ({rows}) without expired entries", failures)
+
+    return failures
+
+
+def large_response(sentences: int, chunks: int = 12) -> tuple[str, SimpleNamespace, list[str]]:
+    """Mixed Chinese/English answer with one support per sentence and repeated sources."""
+    parts = []
+    supports = []
+    offset = 0
+    for i in range(sentences):
+        sentence = (f"第{i}句：台北今天的天氣晴朗，氣溫二十八度。" if i % 2 else f"Sentence {i} about the match score. ")
+        size = len(sentence.encode("utf-8"))
+        indices = [i % chunks, (i * 7) % chunks, i % chunks]  # includes a repeated index
+        supports.append(SimpleNamespace(
+            segment=SimpleNamespace(start_index=offset, end_index=offset + size),
+            grounding_chunk_indices=indices,
+        ))
+        parts.append(sentence)
+        offset += size
+    # Every third chunk reuses the URI of the chunk before it
+    grounding_chunks = [
+        SimpleNamespace(web=SimpleNamespace(uri=f"https://example.com/{i - (i % 3 == 2)}", title=f"source {i}"))
+        for i in range(chunks)
+    ]
+    metadata = SimpleNamespace(grounding_chunks=grounding_chunks, grounding_supports=supports)
+    return "".join(parts), metadata, parts
+
+
+def legacy_add_citations(text: str, metadata) -> str:
+    """The previous implementation: re-slices the whole string for every support."""
+    chunks = metadata.grounding_chunks
+    for support in sorted(metadata.grounding_supports, key=lambda s: s.segment.end_index, reverse=True):
+        end_index = support.segment.end_index
+        links = [f"[{i + 1}]({chunks[i].web.uri})" for i in support.grounding_chunk_indices if i < len(chunks)]
+        text = text[:end_index] + " " + ", ".join(links) + text[end_index:]
+    return text
+
+
+async def bench_citations(args) -> list:
+    """Single-pass citation builder: byte offsets, dedupe and speed on large responses."""
+    failures = []
+    text, metadata, sentences = large_response(args.sentences)
+
+    started = time.perf_counter()
+    for _ in range(args.rounds):
+        annotated, citations, sources = build_citations(text, metadata)
+    new_time = (time.perf_counter() - started) / args.rounds
+    started = time.perf_counter()
+    for _ in range(args.rounds):
+        legacy_add_citations(text, metadata)
+    legacy_time = (time.perf_counter() - started) / args.rounds
+    print(f"{args.sentences} supports over {len(text)} chars ({len(text.encode('utf-8'))} bytes): "
+          f"{new_time * 1000:.2f}ms single pass vs {legacy_time * 1000:.2f}ms legacy ({legacy_time / new_time:.1f}x)")
+
+    check([c["text"] for c in citations] == sentences, "every citation span matches its sentence, Chinese included", failures)
+    check(all(text[c["start"]:c["end"]] == c["text"] for c in citations), "spans are character offsets into the answer", failures)
+    check(all(len(c["sources"]) == len(set(c["sources"])) for c in citations), "no source is repeated within a citation", failures)
+    check(len(sources) == len({s["uri"] for s in sources}), f"{len(sources)} deduplicated sources for 12 chunks", failures)
+    check(all(annotated.count(sentence) >= 1 for sentence in sentences[:50]), "sentences are not split by markers", failures)
+    check(new_time < legacy_time, "single pass is faster than the legacy builder", failures)
+
+    # An offset inside a multi-byte character snaps to the end of that character
+    chinese = "氣溫二十八度"
+    mid = SimpleNamespace(
+        grounding_chunks=[SimpleNamespace(web=SimpleNamespace(uri="https://example.com/w", title="w"))],
+        grounding_supports=[SimpleNamespace(segment=SimpleNamespace(start_index=0, end_index=4), grounding_chunk_indices=[0])],
+    )
+    check(build_citations(chinese, mid)[0] == "氣溫 [1](https://example.com/w)二十八度", "mid-character offsets snap to a boundary", failures)
+
+    # Structured output through the tool
+    server = GroundingSearchServer(client=FakeClient(latency=0))
+    result = await server._grounded_search({"query": "天氣", "structured_citations": True})
+    payload = json.loads(result[0].text)
+    check(payload["citations"][0]["text"] == "Answer about 天氣." and payload["sources"][1]["uri"] == "https://example.com/b",
+          "structured_citations returns spans and sources as JSON", failures)
+    return failures
+
+
+class FakeSession:
+    """Records the progress notifications a streamed tool call sends."""
+
+    def __init__(self):
+        self.notifications = []
+
+    async def send_progress_notification(self, progress_token, progress, total=None, message=None, related_request_id=None):
+        self.notifications.append((time.perf_counter(), progress_token, progress, message))
+
+
+async def bench_stream(args) -> list:
+    """Streaming delivers the first text long before the whole answer is generated."""
+    from mcp.server.lowlevel.server import request_ctx
+    from mcp.shared.context import RequestContext
+    from mcp.types import RequestParams
+
+    failures = []
+    client = FakeClient(latency=args.latency, chunks=args.chunks)
+    server = GroundingSearchServer(client=client)
+
+    # Cache off, so both calls reach the fake upstream
+    server.cache.ttl_seconds = 0
+
+    started = time.perf_counter()
+    blocking = await server._grounded_search({"query": "final score"})
+    blocking_time = time.perf_counter() - started
+
+    # Run the tool the way the MCP server does, inside a request context with a progressToken
+    session = FakeSession()
+    token = request_ctx.set(RequestContext(
+        request_id=1, meta=RequestParams.Meta(progressToken="search-1"), session=session, lifespan_context=None,
+    ))
+    try:
+        started = time.perf_counter()
+        streamed = await server._grounded_search({"query": "final score", "stream": True})
+        stream_time = time.perf_counter() - started
+    finally:
+        request_ctx.reset(token)
+
+    ttft = session.notifications[0][0] - started if session.notifications else float("inf")
+    print(f"upstream {args.latency:.2f}s in {args.chunks} chunks: blocking answer {blocking_time:.2f}s, "
+          f"streamed first text {ttft:.3f}s (complete {stream_time:.2f}s), server-side ttft {server.stream_ttft[-1]:.3f}s")
+    chunks = client.models.last_stream_chunks
+    check(len(session.notifications) == chunks, f"{len(session.notifications)} progress notifications for {chunks} chunks", failures)
+    check(ttft < blocking_time / 2, "first text arrives well before the blocking answer", failures)
+    check("".join(n[3] for n in session.notifications) == fake_response("final score").text, "notifications add up to the answer", failures)
+    check("[1](https://example.com/a)" in streamed[0].text, "citations are attached after the stream ends", failures)
+    check(streamed[0].text == blocking[0].text, "streamed and blocking answers match", failures)
+    check([n[2] for n in session.notifications] == sorted(n[2] for n in session.notifications), "progress is increasing", failures)
+
+    # Without a progressToken the call still works and returns the full answer
+    result = await server._grounded_search({"query": "no token", "stream": True})
+    check("Answer about no token." in result[0].text, "stream without a progressToken returns the answer", failures)
+    return failures
+
+
+async def bench_batch(args) -> list:
+    """A batch costs about one upstream call's time; failures stay per query."""
+    failures = []
+    client = FakeClient(latency=args.latency)
+    server = GroundingSearchServer(client=client)
+    queries = [f"fact {i}" for i in range(args.queries)]
+
+    started = time.perf_counter()
+    result = await server._grounded_search_batch({"queries": queries})
+    elapsed = time.perf_counter() - started
+    print(f"{args.queries} queries, {args.latency:.2f}s upstream latency: batch {elapsed:.2f}s "
+          f"(sequential grounded_search calls would be {args.queries * args.latency:.2f}s)")
+    text = result[0].text
+    check(all(f"### {q}\nAnswer about {q}." in text for q in queries), "every query has its own answer section", failures)
+    check(elapsed < args.latency * 1.5, f"batch wall time {elapsed:.2f}s ~ one call", failures)
+    # All fake answers cite the same two URIs
+    check(text.count("https://example.com/a") == args.queries * 2 + 1 and "[3]" not in text,
+          "sources are merged and deduplicated across queries", failures)
+
+    # One failing and one slow query do not sink the others
+    server.timeout = args.latency * 3
+    started = time.perf_counter()
+    result = await server._grounded_search_batch({
+        "queries": ["good one", "bad [fail]", "late [slow]", "good two"], "structured_citations": True,
+    })
+    elapsed = time.perf_counter() - started
+    server.timeout = 30
+    payload = json.loads(result[0].text)
+    by_query = {r["query"]: r for r in payload["results"]}
+    check("upstream error" in by_query["bad [fail]"].get("error", ""), "a failed query reports its own error", failures)
+    check("timed out" in by_query["late [slow]"].get("error", ""), "a slow query times out on its own", failures)
+    check(all("text" in by_query[q] for q in ("good one", "good two")), "the other queries still answer", failures)
+    check([s["index"] for s in payload["sources"]] == [1, 2], "structured output has one renumbered source list", failures)
+    check(elapsed < args.latency * 4, f"batch returns at the slow query's timeout ({elapsed:.2f}s)", failures)
+
+    # The shared concurrency limit applies across the batch
+    client = FakeClient(latency=args.latency / 5)
+    server = GroundingSearchServer(client=client)
+    server._semaphore = asyncio.Semaphore(2)
+    await server._grounded_search_batch({"queries": [f"limited {i}" for i in range(args.queries)]})
+    check(client.models.max_in_flight <= 2, f"at most 2 upstream calls in flight ({client.models.max_in_flight})", failures)
+
+    try:
+        await server._grounded_search_batch({"queries": ["q"] * (args.max_queries + 1)})
+        rejected = False
+    except ValueError:
+        rejected = True
+    check(rejected, "batches over GROUNDING_BATCH_MAX_QUERIES are rejected", failures)
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for grounding-mcp")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    concurrency = sub.add_parser("concurrency", help="concurrent searches finish in about one call's time")
+    concurrency.add_argument("--searches", type=int, default=8)
+    concurrency.add_argument("--latency", type=float, default=0.5, help="fake upstream latency in seconds")
+    concurrency.add_argument("--max-concurrency", type=int, default=None, help="override GROUNDING_MAX_CONCURRENCY")
+    concurrency.set_defaults(run=bench_concurrency)
+
+    cache = sub.add_parser("cache", help="repeated and concurrent identical queries hit the cache")
+    cache.add_argument("--repeats", type=int, default=20)
+    cache.add_argument("--concurrent", type=int, default=10)
+    cache.add_argument("--max-entries", type=int, default=64)
+    cache.add_argument("--latency", type=float, default=0.5, help="fake upstream latency in seconds")
+    cache.set_defaults(run=bench_cache)
+
+    citations = sub.add_parser("citations", help="citation builder on a large multi-citation response")
+    citations.add_argument("--sentences", type=int, default=2000)
+    citations.add_argument("--rounds", type=int, default=5)
+    citations.set_defaults(run=bench_citations)
+
+    stream = sub.add_parser("stream", help="streamed answers reach the client before generation finishes")
+    stream.add_argument("--latency", type=float, default=2.0, help="fake upstream generation time in seconds")
+    stream.add_argument("--chunks", type=int, default=20)
+    stream.set_defaults(run=bench_stream)
+
+    batch = sub.add_parser("batch", help="grounded_search_batch runs queries concurrently with per-query errors")
+    batch.add_argument("--queries", type=int, default=6)
+    batch.add_argument("--latency", type=float, default=0.5, help="fake upstream latency in seconds")
+    batch.set_defaults(run=bench_batch, max_queries=GROUNDING_BATCH_MAX_QUERIES)
+
+    args = parser.parse_args()
+    failures = asyncio.run(args.run(args))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
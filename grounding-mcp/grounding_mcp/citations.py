@@ -0,0 +1,145 @@
+"""
+Citation markers for grounded responses.
+
+Grounding supports give segment offsets in UTF-8 bytes, while Python slices
+`str` by code point, so the two only agree for ASCII text. The builder maps
+every byte offset to a character index in one pass over the encoded text
+(snapping offsets that land inside a multi-byte character to its end), then
+assembles the annotated text in a single join instead of re-slicing the whole
+string once per support.
+"""
+
+from typing import Any
+
+
+def byte_to_char_offsets(text: str, byte_offsets) -> dict[int, int]:
+    """Map UTF-8 byte offsets into `text` to character indices."""
+    encoded = text.encode("utf-8")
+    size = len(encoded)
+    mapping: dict[int, int] = {}
+    prev_byte = 0
+    char_pos = 0
+    for offset in sorted(set(byte_offsets)):
+        snapped = min(max(offset, 0), size)
+        # Continuation bytes look like 0b10xxxxxx; move to the next character boundary
+        while snapped < size and encoded[snapped] & 0xC0 == 0x80:
+            snapped += 1
+        if snapped > prev_byte:
+            char_pos += len(encoded[prev_byte:snapped].decode("utf-8"))
+            prev_byte = snapped
+        mapping[offset] = char_pos
+    return mapping
+
+
+def grounding_metadata_of(response) -> Any:
+    """The first candidate's grounding metadata, or None."""
+    candidates = getattr(response, "candidates", None)
+    if not candidates:
+        return None
+    return getattr(candidates[0], "grounding_metadata", None)
+
+
+def source_numbers(chunks) -> tuple[list[int | None], list[dict]]:
+    """Number each chunk's source, reusing the first number when a URI repeats.
+
+    Returns the number for every chunk index (None for chunks without a web
+    source) and the deduplicated source list.
+    """
+    numbers: list[int | None] = []
+    sources: list[dict] = []
+    by_uri: dict[str, int] = {}
+    for chunk in chunks:
+        web = getattr(chunk, "web", None)
+        uri = getattr(web, "uri", None)
+        if not uri:
+            numbers.append(None)
+            continue
+        number = by_uri.get(uri)
+        if number is None:
+            number = len(sources) + 1
+            by_uri[uri] = number
+            sources.append({"index": number, "uri": uri, "title": getattr(web, "title", None)})
+        numbers.append(number)
+    return numbers, sources
+
+
+def build_citations(text: str, grounding_metadata) -> tuple[str, list[dict], list[dict]]:
+    """Insert `[n](uri)` markers after each grounded segment.
+
+    Returns the annotated text, the citation spans (`start`/`end` are
+    character indices into the original `text`, `sources` are source numbers)
+    and the deduplicated source list.
+    """
+    text = text or ""
+    if not grounding_metadata:
+        return text, [], []
+    supports = grounding_metadata.grounding_supports or []
+    chunks = grounding_metadata.grounding_chunks or []
+    if not supports or not chunks:
+        return text, [], []
+
+    numbers, sources = source_numbers(chunks)
+
+    spans = []
+    for support in supports:
+        segment = support.segment
+        cited = []
+        for i in support.grounding_chunk_indices or []:
+            number = numbers[i] if 0 <= i < len(numbers) else None
+            if number is not None and number not in cited:
+                cited.append(number)
+        if cited:
+            spans.append((segment.start_index or 0, segment.end_index or 0, cited))
+    if not spans:
+        return text, [], sources
+
+    to_char = byte_to_char_offsets(text, [offset for start, end, _ in spans for offset in (start, end)])
+
+    citations = []
+    for start, end, cited in spans:
+        start_char, end_char = to_char[start], to_char[end]
+        citations.append({"start": start_char, "end": end_char, "text": text[start_char:end_char], "sources": cited})
+    return insert_markers(text, citations, sources), citations, sources
+
+
+def insert_markers(text: str, citations: list[dict], sources: list[dict]) -> str:
+    """Insert `[n](uri)` after each citation span in one join; spans ending together share a marker."""
+    uris = {source["index"]: source["uri"] for source in sources}
+    markers: dict[int, list[int]] = {}
+    for citation in citations:
+        at = markers.setdefault(citation["end"], [])
+        at.extend(number for number in citation["sources"] if number not in at)
+
+    pieces = []
+    prev = 0
+    for position in sorted(markers):
+        pieces.append(text[prev:position])
+        pieces.append(" " + ", ".join(f"[{number}]({uris[number]})" for number in markers[position]))
+        prev = position
+    pieces.append(text[prev:])
+    return "".join(pieces)
+
+
+def merge_sources(results: list[tuple[list[dict], list[dict]]]) -> tuple[list[list[dict]], list[dict]]:
+    """Merge the (citations, sources) of several answers into one numbered source list.
+
+    Sources are deduplicated by URI across answers and renumbered in order of
+    first appearance; each answer's citations are rewritten to the new numbers.
+    """
+    merged: list[dict] = []
+    by_uri: dict[str, int] = {}
+    renumbered = []
+    for citations, sources in results:
+        mapping = {}
+        for source in sources:
+            number = by_uri.get(source["uri"])
+            if number is None:
+                number = len(merged) + 1
+                by_uri[source["uri"]] = number
+                merged.append(dict(source, index=number))
+            mapping[source["index"]] = number
+        renumbered.append([
+            dict(citation, sources=list(dict.fromkeys(mapping[n] for n in citation["sources"])))
+            for citation in citations
+        ])
+    return renumbered, merged
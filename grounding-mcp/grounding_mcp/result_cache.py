@@ -0,0 +1,128 @@
+"""
+TTL + LRU cache for grounded_search results.
+
+Keys are the normalized query plus the output options. Entries expire after
+`ttl_seconds` so time-sensitive answers stay fresh, the in-memory tier is
+bounded with LRU eviction, and an optional SQLite file keeps entries across
+restarts (expiry uses wall-clock time for that reason). Every write to the
+SQLite tier also drops expired rows and the oldest-written rows beyond
+`max_entries`, so the file stays as bounded as the memory tier.
+"""
+
+import re
+import sqlite3
+import sys
+import time
+import unicodedata
+from collections import OrderedDict
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_TRAILING_PUNCTUATION = " ?？!！.。"
+
+
+def normalize_query(query: str) -> str:
+    """Normalize so trivially different spellings of a question share an entry."""
+    query = unicodedata.normalize("NFKC", query)
+    return _WHITESPACE_RE.sub(" ", query).strip().rstrip(_TRAILING_PUNCTUATION).lower()
+
+
+def cache_key(query: str, include_citations: bool, structured: bool = False) -> str:
+    return f"{int(bool(include_citations))}{'s' if structured else ''}:{normalize_query(query)}"
+
+
+class GroundingResultCache:
+    def __init__(self, ttl_seconds: float = 300.0, max_entries: int = 256, persist_path: str | None = None):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.persist_path = persist_path
+        self._memory: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._db: sqlite3.Connection | None = None
+
+        self.hits = 0
+        self.misses = 0
+
+        if persist_path:
+            try:
+                self._db = sqlite3.connect(persist_path)
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS grounding_cache ("
+                    " key TEXT PRIMARY KEY,"
+                    " expires_at REAL NOT NULL,"
+                    " value TEXT NOT NULL)"
+                )
+                self._db.execute("CREATE INDEX IF NOT EXISTS grounding_cache_expires ON grounding_cache (expires_at)")
+                self._trim_db(time.time())
+                self._db.commit()
+            except sqlite3.Error as e:
+                print(f"Could not open grounding cache {persist_path}: {e}", file=sys.stderr)
+                self._db = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0 and self.max_entries > 0
+
+    def get(self, key: str) -> str | None:
+        if not self.enabled:
+            return None
+        now = time.time()
+        entry = self._memory.get(key)
+        if entry is None and self._db is not None:
+            row = self._db.execute(
+                "SELECT expires_at, value FROM grounding_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                entry = (row[0], row[1])
+                self._remember(key, entry)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > now:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return value
+            self._memory.pop(key, None)
+        self.misses += 1
+        return None
+
+    def _trim_db(self, now: float) -> None:
+        self._db.execute("DELETE FROM grounding_cache WHERE expires_at <= ?", (now,))
+        # Every entry lives ttl_seconds, so the latest expiry is the most recently written
+        self._db.execute(
+            "DELETE FROM grounding_cache WHERE key NOT IN ("
+            " SELECT key FROM grounding_cache ORDER BY expires_at DESC LIMIT ?)",
+            (self.max_entries,),
+        )
+
+    def _remember(self, key: str, entry: tuple[float, str]) -> None:
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def set(self, key: str, value: str) -> None:
+        if not self.enabled:
+            return
+        now = time.time()
+        entry = (now + self.ttl_seconds, value)
+        self._remember(key, entry)
+        if self._db is not None:
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO grounding_cache (key, expires_at, value) VALUES (?, ?, ?)",
+                    (key, entry[0], value),
+                )
+                self._trim_db(now)
+                self._db.commit()
+            except sqlite3.Error as e:
+                print(f"Could not write grounding cache: {e}", file=sys.stderr)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._memory),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "persist_path": self.persist_path if self._db is not None else None,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+        }
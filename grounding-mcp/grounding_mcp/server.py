@@ -7,6 +7,9 @@ using Google's GenAI API with grounding support.
 """
 
 import os
+import sys
+import json
+import time
 import asyncio
 from typing import Any, Sequence
 from dotenv import load_dotenv
@@ -26,19 +29,53 @@ from mcp.types import (
     ToolsCapability,
 )
 
+try:
+    from grounding_mcp.citations import build_citations, grounding_metadata_of, insert_markers, merge_sources
+    from grounding_mcp.result_cache import GroundingResultCache, cache_key
+except ImportError:  # run as a script without the package installed
+    from citations import build_citations, grounding_metadata_of, insert_markers, merge_sources
+    from result_cache import GroundingResultCache, cache_key
+
 # Load environment variables
 load_dotenv()
 
+GROUNDING_MODEL = os.getenv("GROUNDING_MODEL", "gemini-3-flash-preview")
+# Max grounded searches in flight at once; further calls wait for a slot
+GROUNDING_MAX_CONCURRENCY = int(os.getenv("GROUNDING_MAX_CONCURRENCY", "8"))
+# Per-request timeout for the upstream generate_content call
+GROUNDING_TIMEOUT_SECONDS = float(os.getenv("GROUNDING_TIMEOUT_SECONDS", "30"))
+# Result cache: answers are reused for this long (0 disables the cache)
+GROUNDING_CACHE_TTL_SECONDS = float(os.getenv("GROUNDING_CACHE_TTL_SECONDS", "300"))
+GROUNDING_CACHE_MAX_ENTRIES = int(os.getenv("GROUNDING_CACHE_MAX_ENTRIES", "256"))
+# Optional SQLite file so cached answers survive restarts
+GROUNDING_CACHE_PATH = os.getenv("GROUNDING_CACHE_PATH") or None
+# Max queries in one grounded_search_batch call
+GROUNDING_BATCH_MAX_QUERIES = int(os.getenv("GROUNDING_BATCH_MAX_QUERIES", "10"))
+
 class GroundingSearchServer:
-    def __init__(self):
+    def __init__(self, client=None):
         self.server = Server("grounding-search")
         self.api_key = os.getenv("GEMINI_API_KEY")
         
-        if not self.api_key:
+        if client is None and not self.api_key:
             raise ValueError("GEMINI_API_KEY environment variable is required")
         
-        # Configure the GenAI client
-        self.client = genai.Client(api_key=self.api_key)
+        # Configure the GenAI client (a prebuilt client can be injected, e.g. for benchmarks)
+        self.client = client or genai.Client(api_key=self.api_key)
+        self.model = GROUNDING_MODEL
+        self.timeout = GROUNDING_TIMEOUT_SECONDS
+        self._semaphore = asyncio.Semaphore(GROUNDING_MAX_CONCURRENCY)
+        self.cache = GroundingResultCache(
+            ttl_seconds=GROUNDING_CACHE_TTL_SECONDS,
+            max_entries=GROUNDING_CACHE_MAX_ENTRIES,
+            persist_path=GROUNDING_CACHE_PATH,
+        )
+        # Upstream requests in flight, by cache key; identical concurrent queries share one
+        self._inflight: dict[str, asyncio.Task] = {}
+        self._waiters: dict[asyncio.Task, int] = {}
+        self.coalesced = 0
+        # Time to first token of recent streamed searches, in seconds
+        self.stream_ttft: list[float] = []
         
         # Define the grounding tool
         self.grounding_tool = types.Tool(
@@ -71,11 +108,48 @@ class GroundingSearchServer:
                                 "type": "boolean",
                                 "description": "Whether to include citations in the response",
                                 "default": True
+                            },
+                            "structured_citations": {
+                                "type": "boolean",
+                                "description": "Return JSON with the answer text, cited spans and a deduplicated source list",
+                                "default": False
+                            },
+                            "stream": {
+                                "type": "boolean",
+                                "description": "Send answer text as progress notifications while it is generated (needs a progressToken)",
+                                "default": False
                             }
                         },
                         "required": ["query"],
                     },
-                )
+                ),
+                Tool(
+                    name="grounded_search_batch",
+                    description="Run several grounded searches concurrently and return each answer with one merged citation list",
+                    inputSchema={
+                        "type": "object",
+                        "properties": {
+                            "queries": {
+                                "type": "array",
+                                "items": {"type": "string"},
+                                "minItems": 1,
+                                "maxItems": GROUNDING_BATCH_MAX_QUERIES,
+                                "description": "The search queries, e.g. one per fact needed"
+                            },
+                            "include_citations": {
+                                "type": "boolean",
+                                "description": "Whether to include citations in the answers",
+                                "default": True
+                            },
+                            "structured_citations": {
+                                "type": "boolean",
+                                "description": "Return JSON with per-query results and the merged source list",
+                                "default": False
+                            }
+                        },
+                        "required": ["queries"],
+                    },
+                ),
             ]
         
         @self.server.call_tool()
@@ -83,6 +157,8 @@ class GroundingSearchServer:
             """Handle tool calls."""
             if name == "grounded_search":
                 return await self._grounded_search(arguments)
+            elif name == "grounded_search_batch":
+                return await self._grounded_search_batch(arguments)
             else:
                 raise ValueError(f"Unknown tool: {name}")
     
@@ -90,59 +166,206 @@ class GroundingSearchServer:
         """Perform a grounded search using Google GenAI."""
         query = arguments["query"]
         include_citations = arguments.get("include_citations", True)
+        structured = arguments.get("structured_citations", False)
+        key = cache_key(query, include_citations, structured)
+        
+        cached = self.cache.get(key)
+        if cached is not None:
+            return [TextContent(type="text", text=cached)]
+        
+        if arguments.get("stream", False):
+            return await self._grounded_search_stream(key, query, include_citations, structured)
         
         try:
-            # Make the request to GenAI with grounding
-            response = self.client.models.generate_content(
-                model="gemini-3-flash-preview",
-                contents=query,
-                config=self.config,
-            )
-            
-            if include_citations:
-                # Add citations to the response
-                text_with_citations = self._add_citations(response)
-                return [TextContent(type="text", text=text_with_citations)]
-            else:
-                return [TextContent(type="text", text=response.text)]
-                
+            text = await self._search_shared(key, query, include_citations, structured)
         except Exception as e:
-            error_msg = f"Error performing grounded search: {str(e)}"
-            return [TextContent(type="text", text=error_msg)]
+            # CancelledError is not an Exception, so a cancelled call still propagates
+            return [TextContent(type="text", text=self._error_text(e))]
+        return [TextContent(type="text", text=text)]
     
-    def _add_citations(self, response) -> str:
-        """Add citations to the response text."""
-        text = response.text
+    async def _grounded_search_batch(self, arguments: dict[str, Any]) -> list[TextContent]:
+        """Run several grounded searches concurrently; each query succeeds or fails on its own."""
+        queries = arguments["queries"]
+        include_citations = arguments.get("include_citations", True)
+        structured = arguments.get("structured_citations", False)
+        if not isinstance(queries, list) or not queries or not all(isinstance(q, str) and q.strip() for q in queries):
+            raise ValueError("queries must be a non-empty list of non-empty strings")
+        if len(queries) > GROUNDING_BATCH_MAX_QUERIES:
+            raise ValueError(f"At most {GROUNDING_BATCH_MAX_QUERIES} queries per batch")
         
-        # Check if grounding metadata exists
-        if not hasattr(response, 'candidates') or not response.candidates:
-            return text
-            
-        candidate = response.candidates[0]
-        if not hasattr(candidate, 'grounding_metadata') or not candidate.grounding_metadata:
-            return text
+        # Same path as single searches: shared cache, in-flight requests and concurrency limit.
+        # Answers are fetched in structured form so their sources can be merged and renumbered.
+        outcomes = await asyncio.gather(
+            *(self._search_shared(cache_key(q, False, True), q, False, True) for q in queries),
+            return_exceptions=True,
+        )
+        answers = []
+        for outcome in outcomes:
+            if isinstance(outcome, asyncio.CancelledError):
+                raise outcome
+            answers.append(json.loads(outcome) if isinstance(outcome, str) else outcome)
+        
+        ok = [a for a in answers if isinstance(a, dict)]
+        renumbered, sources = merge_sources([(a["citations"], a["sources"]) for a in ok])
+        citations_for = {id(a): c for a, c in zip(ok, renumbered)}
+        
+        results = []
+        for query, answer in zip(queries, answers):
+            if not isinstance(answer, dict):
+                results.append({"query": query, "error": self._error_text(answer)})
+                continue
+            citations = citations_for[id(answer)]
+            text = insert_markers(answer["text"], citations, sources) if include_citations else answer["text"]
+            results.append({"query": query, "text": text, "citations": citations})
+        
+        if structured:
+            return [TextContent(type="text", text=json.dumps({"results": results, "sources": sources}, ensure_ascii=False))]
+        
+        sections = [f"### {r['query']}\n{r.get('text', r.get('error'))}" for r in results]
+        if include_citations and sources:
+            sections.append("Sources:\n" + "\n".join(
+                f"[{s['index']}] {s['title'] or s['uri']}: {s['uri']}" for s in sources
+            ))
+        return [TextContent(type="text", text="\n\n".join(sections))]
+    
+    def _error_text(self, error: Exception) -> str:
+        if isinstance(error, asyncio.TimeoutError):
+            return f"Error performing grounded search: timed out after {self.timeout:g}s"
+        return f"Error performing grounded search: {str(error)}"
+    
+    async def _search_shared(self, key: str, query: str, include_citations: bool, structured: bool) -> str:
+        """Fetch an answer, joining an identical request that is already in flight; raises on failure."""
+        while True:
+            task = self._inflight.get(key)
+            if task is None:
+                task = asyncio.create_task(self._fetch_and_cache(key, query, include_citations, structured))
+                self._inflight[key] = task
+                task.add_done_callback(lambda done: self._inflight.pop(key) if self._inflight.get(key) is done else None)
+            else:
+                self.coalesced += 1
             
-        supports = candidate.grounding_metadata.grounding_supports or []
-        chunks = candidate.grounding_metadata.grounding_chunks or []
-        
-        # Sort supports by end_index in descending order to avoid shifting issues when inserting
-        sorted_supports = sorted(supports, key=lambda s: s.segment.end_index, reverse=True)
-        
-        for support in sorted_supports:
-            end_index = support.segment.end_index
-            if support.grounding_chunk_indices:
-                # Create citation string like [1](link1), [2](link2)
-                citation_links = []
-                for i in support.grounding_chunk_indices:
-                    if i < len(chunks):
-                        uri = chunks[i].web.uri
-                        citation_links.append(f"[{i + 1}]({uri})")
-                
-                citation_string = " " + ", ".join(citation_links)
-                text = text[:end_index] + citation_string + text[end_index:]
+            self._waiters[task] = self._waiters.get(task, 0) + 1
+            try:
+                # Shielded so one caller going away does not cancel the request for the others
+                return await asyncio.shield(task)
+            except asyncio.CancelledError:
+                # The shared request was cancelled while this caller still wanted it: start over
+                if task.cancelled() and not asyncio.current_task().cancelling():
+                    continue
+                raise
+            finally:
+                self._waiters[task] -= 1
+                if not self._waiters[task]:
+                    del self._waiters[task]
+                    if not task.done():
+                        # Nobody is waiting for the upstream request any more; later callers start a new one
+                        task.cancel()
+                        if self._inflight.get(key) is task:
+                            del self._inflight[key]
+    
+    async def _grounded_search_stream(self, key: str, query: str, include_citations: bool, structured: bool) -> list[TextContent]:
+        """Streamed search: text chunks go out as progress notifications, the full answer is the result.
         
+        Streamed calls are not coalesced with identical in-flight queries, since each caller
+        needs its own notifications; the finished answer is still cached.
+        """
+        notify = self._progress_notifier()
+        try:
+            text = await self._stream_grounded(query, include_citations, structured, notify)
+        except Exception as e:
+            return [TextContent(type="text", text=self._error_text(e))]
+        self.cache.set(key, text)
+        return [TextContent(type="text", text=text)]
+    
+    def _progress_notifier(self):
+        """Send a text chunk as an MCP progress notification, if the client asked for progress."""
+        try:
+            ctx = self.server.request_context
+        except LookupError:
+            return None
+        token = ctx.meta.progressToken if ctx.meta else None
+        if token is None:
+            return None
+        
+        async def notify(received_chars: int, chunk: str) -> None:
+            await ctx.session.send_progress_notification(
+                token,
+                progress=received_chars,
+                message=chunk,
+                related_request_id=str(ctx.request_id),
+            )
+        return notify
+    
+    async def _stream_grounded(self, query: str, include_citations: bool, structured: bool, notify=None) -> str:
+        """One upstream generate_content_stream call; citations are added once the stream has ended."""
+        parts = []
+        received_chars = 0
+        grounding_metadata = None
+        ttft = None
+        async with self._semaphore:
+            started = time.perf_counter()
+            async with asyncio.timeout(self.timeout):
+                stream = await self.client.aio.models.generate_content_stream(
+                    model=self.model,
+                    contents=query,
+                    config=self.config,
+                )
+                async for chunk in stream:
+                    # Grounding metadata is only complete on the last chunks; keep the latest
+                    grounding_metadata = grounding_metadata_of(chunk) or grounding_metadata
+                    chunk_text = chunk.text
+                    if not chunk_text:
+                        continue
+                    if ttft is None:
+                        ttft = time.perf_counter() - started
+                    parts.append(chunk_text)
+                    received_chars += len(chunk_text)
+                    if notify is not None:
+                        await notify(received_chars, chunk_text)
+        total = time.perf_counter() - started
+        
+        if ttft is not None:
+            self.stream_ttft = (self.stream_ttft + [ttft])[-100:]
+        ttft_text = f"{ttft:.2f}s" if ttft is not None else "n/a"
+        print(f"grounded_search stream: first token {ttft_text}, complete {total:.2f}s", file=sys.stderr)
+        
+        return self._format_response("".join(parts), grounding_metadata, include_citations, structured)
+    
+    async def _fetch_and_cache(self, key: str, query: str, include_citations: bool, structured: bool) -> str:
+        text = await self._fetch_grounded(query, include_citations, structured)
+        # Only successful answers are cached; errors raise and are retried next time
+        self.cache.set(key, text)
         return text
     
+    async def _fetch_grounded(self, query: str, include_citations: bool, structured: bool = False) -> str:
+        """One upstream generate_content call with grounding; raises on failure or timeout."""
+        # Async client, so other calls keep running
+        async with self._semaphore:
+            response = await asyncio.wait_for(
+                self.client.aio.models.generate_content(
+                    model=self.model,
+                    contents=query,
+                    config=self.config,
+                ),
+                timeout=self.timeout,
+            )
+        
+        return self._format_response(response.text, grounding_metadata_of(response), include_citations, structured)
+    
+    def _format_response(self, text: str, grounding_metadata, include_citations: bool, structured: bool) -> str:
+        """Tool output for a finished answer: plain, with citation markers, or structured JSON."""
+        if not include_citations and not structured:
+            return text
+        annotated, citations, sources = build_citations(text, grounding_metadata)
+        if structured:
+            return json.dumps({
+                "text": annotated if include_citations else (text or ""),
+                # start/end are character offsets into the answer without citation markers
+                "citations": citations,
+                "sources": sources,
+            }, ensure_ascii=False)
+        return annotated if include_citations else text
+    
     async def run(self):
         """Run the MCP server."""
         from mcp.server.stdio import stdio_server
@@ -0,0 +1,101 @@
+"""
+Semantic answer cache for ask_m365_question.
+
+A full agent run (LLM planning, tool calls and a final synthesis) takes seconds.
+FAQ-style traffic asks the same question in slightly different words, so answers
+are cached by question embedding and reused when a new question is similar
+enough to a cached one.
+"""
+
+import threading
+import time
+
+import numpy as np
+
+
+class SemanticAnswerCache:
+    """Answers keyed on question embeddings, matched by cosine similarity.
+
+    Entries expire after `ttl_seconds` and are tagged with the collection
+    generation they were produced from; call `invalidate()` when the collection
+    changes so stale answers are never served.
+    """
+
+    def __init__(self, similarity_threshold: float = 0.95, ttl_seconds: float = 3600, max_entries: int = 512):
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self._vectors: np.ndarray | None = None  # (n, dim) unit vectors
+        self._entries: list[dict] = []
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _unit(vector) -> np.ndarray:
+        v = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(v))
+        return v / norm if norm else v
+
+    def _drop_expired(self, now: float) -> None:
+        # caller must hold self._lock
+        keep = [i for i, e in enumerate(self._entries) if now - e["created_at"] < self.ttl_seconds]
+        if len(keep) == len(self._entries):
+            return
+        self._entries = [self._entries[i] for i in keep]
+        self._vectors = self._vectors[keep] if keep else None
+
+    def lookup(self, vector) -> dict | None:
+        """Return the closest cached entry above the similarity threshold, if any."""
+        query = self._unit(vector)
+        with self._lock:
+            self._drop_expired(time.time())
+            if self._vectors is None or self._vectors.shape[1] != query.shape[0]:
+                self.misses += 1
+                return None
+            similarities = self._vectors @ query
+            best = int(np.argmax(similarities))
+            score = float(similarities[best])
+            if score < self.similarity_threshold:
+                self.misses += 1
+                return None
+            self.hits += 1
+            entry = self._entries[best]
+            return {"question": entry["question"], "answer": entry["answer"], "similarity": score}
+
+    def store(self, vector, question: str, answer: str) -> None:
+        unit = self._unit(vector)
+        with self._lock:
+            now = time.time()
+            self._drop_expired(now)
+            if self._vectors is not None and self._vectors.shape[1] != unit.shape[0]:
+                # 向量維度改變（例如更換 embedding model），舊資料無法比較
+                self._vectors, self._entries = None, []
+            self._entries.append({"question": question, "answer": answer, "created_at": now})
+            row = unit[np.newaxis, :]
+            self._vectors = row if self._vectors is None else np.vstack([self._vectors, row])
+            if len(self._entries) > self.max_entries:
+                overflow = len(self._entries) - self.max_entries
+                self._entries = self._entries[overflow:]
+                self._vectors = self._vectors[overflow:]
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._vectors, self._entries = None, []
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "similarity_threshold": self.similarity_threshold,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+        }
@@ -0,0 +1,474 @@
+#!/usr/bin/env python3
+"""
+Offline retrieval benchmark for the M365 RAG Agent MCP Server.
+
+Builds a synthetic Chroma collection with a deterministic local embedding
+function (no API key or network needed), then replays a labeled query set
+through the same `handle_call_tool` code paths used by `search_knowledge_base`
+and `get_page_context`. Reports p50/p95/p99 latency, throughput under N
+concurrent callers and recall@k, and exits non-zero when a gate fails so it can
+be used to check changes to k, chunking or caching before merging.
+
+    python benchmark.py
+    python benchmark.py --mode hybrid --concurrency 1,8,32 --min-recall 0.9 --max-p95-ms 50
+    python benchmark.py --checks    # also run the concurrency regression checks
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+# server.py 以相對路徑讀取 config.yaml
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+os.chdir(BASE_DIR)
+sys.path.insert(0, BASE_DIR)
+os.environ.setdefault("GOOGLE_API_KEY", "offline-benchmark")
+
+from langchain_community.vectorstores import Chroma
+from langchain_core.embeddings import Embeddings
+
+import server
+from chat_sessions import ChatSessionStore
+from lexical_index import BM25Index, tokenize
+from page_index import PageIndex
+from query_cache import CachedQueryEmbeddings
+from vector_resources import VectorStoreResources
+
+COLLECTION_NAME = "benchmark_collection"
+EMBEDDING_MODEL = "benchmark-hashing-256"
+
+PRODUCTS = ["Teams", "SharePoint", "OneDrive", "Outlook", "Planner", "Forms", "Excel", "Word", "Loop", "Viva"]
+ACTIONS = ["分享檔案", "設定權限", "建立投票", "自動回覆", "同步資料夾", "還原版本", "外部共用", "申請空間",
+           "建立頻道", "匯出報表", "設定提醒", "管理成員", "調整通知", "封存網站", "移轉擁有者"]
+FILLER = ["點選右上角的設定圖示", "請參考下列步驟", "若無法完成請聯繫資訊單位", "此功能僅限公司帳號使用",
+          "操作前請先確認權限", "畫面可能因版本略有不同", "完成後系統會寄送通知", "可於說明中心查詢更多資訊"]
+_SOURCE_RE = re.compile(r"Source: ([^,\n]*), Page: ([^,\n]*)")
+_CONTEXT_RE = re.compile(r"\[METADATA: source=([^,]*), page=([^\]]*)\]")
+
+
+class HashingEmbeddings(Embeddings):
+    """Deterministic local embedding: signed feature hashing of BM25 tokens."""
+
+    def __init__(self, dimensions: int = 256):
+        self.dimensions = dimensions
+
+    def _embed(self, text: str) -> list[float]:
+        vector = [0.0] * self.dimensions
+        for token in tokenize(text):
+            digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+            value = int.from_bytes(digest, "little")
+            vector[value % self.dimensions] += 1.0 if (value >> 63) & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._embed(text)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self._embed(text) for text in texts]
+
+
+def build_corpus(sources: int, pages: int, queries: int, seed: int):
+    """Generate pages with a distinctive topic each, plus labeled queries for them."""
+    rng = random.Random(seed)
+    texts, metadatas, topics = [], [], {}
+    for s in range(sources):
+        source = f"{rng.choice(PRODUCTS)}_教學手冊_{s:02d}.pdf"
+        for page in range(1, pages + 1):
+            product, action = rng.choice(PRODUCTS), rng.choice(ACTIONS)
+            code = f"KB{s:02d}{page:03d}"
+            topic = f"{product} {action} {code}"
+            body = "，".join(rng.sample(FILLER, 3))
+            texts.append(f"{topic}：如何在 {product} 中{action}。{body}。")
+            metadatas.append({"source": source, "page": page, "type": "pdf"})
+            topics[(source, page)] = (product, action, code)
+
+    labeled = []
+    for source, page in rng.sample(sorted(topics), min(queries, len(topics))):
+        product, action, code = topics[(source, page)]
+        labeled.append({"query": f"請問 {code} {product} 要怎麼{action}", "source": source, "page": page})
+    return texts, metadatas, labeled
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    if not sorted_values:
+        return float("nan")
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def install_fixture(persist_directory: str, use_query_cache: bool) -> None:
+    """Point the server's shared resources at the fixture collection."""
+    def embeddings_factory():
+        embeddings = HashingEmbeddings()
+        return CachedQueryEmbeddings(embeddings, EMBEDDING_MODEL) if use_query_cache else embeddings
+
+    server.vector_resources = VectorStoreResources(
+        persist_directory=persist_directory,
+        collection_name=COLLECTION_NAME,
+        embedding_model=EMBEDDING_MODEL,
+        embeddings_factory=embeddings_factory,
+    )
+    server.page_index = PageIndex(
+        cache_pages=server.page_index.cache_pages,
+        prefetch_radius=server.page_index.prefetch_radius,
+        refresh_interval_seconds=server.page_index.refresh_interval_seconds,
+    )
+    server.lexical_index = BM25Index(persist_path=None)
+    server.vector_resources.warm_up()
+
+
+async def replay(calls: list[tuple[str, dict]], concurrency: int) -> tuple[list[float], list[str], float]:
+    """Run the calls with at most `concurrency` in flight; return latencies, outputs and wall time."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = [0.0] * len(calls)
+    outputs = [""] * len(calls)
+
+    async def run(i: int, name: str, arguments: dict):
+        async with semaphore:
+            started = time.perf_counter()
+            result = await server.handle_call_tool(name, arguments)
+            latencies[i] = (time.perf_counter() - started) * 1000
+            outputs[i] = result[0]["text"]
+
+    started = time.perf_counter()
+    await asyncio.gather(*(run(i, name, arguments) for i, (name, arguments) in enumerate(calls)))
+    return latencies, outputs, time.perf_counter() - started
+
+
+def summarize(label: str, concurrency: int, latencies: list[float], wall: float) -> dict:
+    ordered = sorted(latencies)
+    return {
+        "path": label,
+        "concurrency": concurrency,
+        "calls": len(latencies),
+        "p50_ms": round(percentile(ordered, 50), 3),
+        "p95_ms": round(percentile(ordered, 95), 3),
+        "p99_ms": round(percentile(ordered, 99), 3),
+        "throughput_per_s": round(len(latencies) / wall, 1) if wall else None,
+    }
+
+
+async def run_benchmark(args) -> dict:
+    search_calls = [
+        ("search_knowledge_base", {"query": item["query"], "k": args.k, "mode": args.mode})
+        for item in args.labeled
+    ]
+    context_calls = [
+        ("get_page_context", {"source": item["source"], "page": item["page"]})
+        for item in args.labeled
+    ]
+
+    # 先跑一次暖機（建立頁面索引、BM25 索引），再計算 recall
+    _, outputs, _ = await replay(search_calls, concurrency=1)
+    hits = 0
+    for item, text in zip(args.labeled, outputs):
+        found = {(source.strip(), page.strip()) for source, page in _SOURCE_RE.findall(text)}
+        hits += (item["source"], str(item["page"])) in found
+    recall = hits / len(args.labeled) if args.labeled else 0.0
+
+    _, outputs, _ = await replay(context_calls, concurrency=1)
+    context_ok = 0
+    for item, text in zip(args.labeled, outputs):
+        pages = {int(page) for source, page in _CONTEXT_RE.findall(text) if source == item["source"]}
+        expected = {p for p in (item["page"] - 1, item["page"] + 1) if 1 <= p <= args.pages}
+        context_ok += pages == expected
+
+    rows = []
+    for concurrency in args.concurrency:
+        for label, calls in (("search_knowledge_base", search_calls), ("get_page_context", context_calls)):
+            latencies = []
+            wall = 0.0
+            for _ in range(args.rounds):
+                round_latencies, _, round_wall = await replay(calls, concurrency)
+                latencies.extend(round_latencies)
+                wall += round_wall
+            rows.append(summarize(label, concurrency, latencies, wall))
+
+    return {
+        "collection": {"sources": args.sources, "pages_per_source": args.pages, "documents": args.sources * args.pages},
+        "mode": args.mode,
+        "k": args.k,
+        "query_cache": not args.no_query_cache,
+        "queries": len(args.labeled),
+        f"recall@{args.k}": round(recall, 4),
+        "page_context_accuracy": round(context_ok / len(args.labeled), 4) if args.labeled else None,
+        "latency": rows,
+    }
+
+
+def check(condition: bool, message: str, failures: list) -> None:
+    print(f"[check] {'ok' if condition else 'FAIL'}: {message}", file=sys.stderr)
+    if not condition:
+        failures.append(message)
+
+
+def check_reload_race(persist_directory: str, failures: list) -> None:
+    """get_embeddings/get_vectorstore never return None while reload() runs concurrently."""
+    class SlowWarmUp(VectorStoreResources):
+        def warm_up(self):
+            opened = super().warm_up()
+            # Widen the window between warm_up() returning and the caller using the result
+            time.sleep(0.001)
+            return opened
+
+    resources = SlowWarmUp(
+        persist_directory=persist_directory,
+        collection_name=COLLECTION_NAME,
+        embedding_model=EMBEDDING_MODEL,
+        embeddings_factory=HashingEmbeddings,
+    )
+    resources.warm_up()
+    stop = threading.Event()
+    missing = []
+
+    def reader():
+        while not stop.is_set():
+            if resources.get_embeddings() is None or resources.get_vectorstore() is None:
+                missing.append(1)
+
+    readers = [threading.Thread(target=reader) for _ in range(4)]
+    for thread in readers:
+        thread.start()
+    try:
+        for _ in range(20):
+            resources.reload()
+            time.sleep(0.002)
+    finally:
+        stop.set()
+        for thread in readers:
+            thread.join()
+    check(not missing, f"reload() concurrent with get_*: {len(missing)} None results", failures)
+
+
+async def check_session_eviction(failures: list) -> None:
+    """A session waiting for its turn is not evicted, so turns stay serialized."""
+    store = ChatSessionStore(max_sessions=1)
+    running = 0
+    overlapped = False
+    sessions = []
+
+    async def turn():
+        nonlocal running, overlapped
+        async with store.turn("busy") as session:
+            sessions.append(session)
+            running += 1
+            overlapped |= running > 1
+            await asyncio.sleep(0.05)
+            running -= 1
+
+    first = asyncio.create_task(turn())
+    await asyncio.sleep(0.01)
+    second = asyncio.create_task(turn())
+    await asyncio.sleep(0.01)
+    # max_sessions=1: new sessions push the store over its ceiling while "busy" is in use
+    for i in range(5):
+        store.get(f"other-{i}")
+    await asyncio.gather(first, second)
+    await asyncio.gather(*(turn() for _ in range(3)))
+    check(not overlapped and len({id(s) for s in sessions}) == 1,
+          "turns of one session stay serialized on one session object under eviction pressure", failures)
+
+
+async def check_hybrid_hang(failures: list) -> None:
+    """Hybrid search still answers from BM25 when hung vector searches fill the blocking executor."""
+    release = threading.Event()
+    original_search, original_timeout = server.search_documents, server.VECTOR_SEARCH_TIMEOUT_SECONDS
+
+    def hung_search(query, k=4):
+        release.wait()  # the embedding API never answers
+        return []
+
+    server.search_documents = hung_search
+    server.VECTOR_SEARCH_TIMEOUT_SECONDS = 0.2
+    queries = server.BLOCKING_EXECUTOR_WORKERS * 2 + 1
+    try:
+        results = await asyncio.wait_for(asyncio.gather(*(
+            server.retrieve_documents(f"Teams 分享檔案 {i}", k=4, mode="hybrid") for i in range(queries)
+        )), timeout=10)
+        answered = sum(1 for docs in results if docs)
+    except asyncio.TimeoutError:
+        answered = 0
+    finally:
+        server.search_documents, server.VECTOR_SEARCH_TIMEOUT_SECONDS = original_search, original_timeout
+        release.set()
+    check(answered == queries, f"hybrid search with a hung vector call: {answered}/{queries} queries answered from BM25 "
+          f"({server.BLOCKING_EXECUTOR_WORKERS} blocking workers)", failures)
+
+
+async def check_status_while_pinned(failures: list) -> None:
+    """get_knowledge_base_status answers, with queue counts, while every blocking worker is stuck."""
+    for _ in range(100):
+        if not server.blocking_calls.running and not server.blocking_calls.queued:
+            break
+        await asyncio.sleep(0.05)
+    release = threading.Event()
+    original_timeout = server.VECTOR_SEARCH_TIMEOUT_SECONDS
+    server.VECTOR_SEARCH_TIMEOUT_SECONDS = 0.2
+    extra = 2
+    pinned = [asyncio.ensure_future(server.run_blocking(release.wait)) for _ in range(server.BLOCKING_EXECUTOR_WORKERS + extra)]
+    try:
+        await asyncio.sleep(0.1)
+        status = await asyncio.wait_for(server.collect_status(), timeout=5)
+        executor = status["blocking_executor"]
+    except asyncio.TimeoutError:
+        status, executor = None, {}
+    finally:
+        server.VECTOR_SEARCH_TIMEOUT_SECONDS = original_timeout
+        release.set()
+        await asyncio.gather(*pinned)
+    # 逾時的 document_count 呼叫尚未開始即被取消，不再計入排隊數
+    check(status is not None and executor.get("running") == server.BLOCKING_EXECUTOR_WORKERS
+          and executor.get("queued_calls") == extra and status["vector_store"]["document_count"] is None,
+          f"status answers while the blocking executor is pinned ({executor})", failures)
+
+
+class ListCollection:
+    """Just enough of a Chroma collection for BM25Index.build(); counts document reads."""
+
+    def __init__(self, documents: dict[str, str]):
+        self.documents = documents
+        self.document_reads = 0
+
+    def count(self) -> int:
+        return len(self.documents)
+
+    def get(self, include=None, limit=None, offset=0):
+        ids = list(self.documents)[offset:offset + limit if limit else None]
+        if not include:
+            return {"ids": ids}
+        self.document_reads += len(ids)
+        return {"ids": ids, "documents": [self.documents[i] for i in ids], "metadatas": [{"source": i} for i in ids]}
+
+
+def check_lexical_reingest(failures: list) -> None:
+    """A persisted BM25 index is rebuilt when chunks are re-ingested under the same ids,
+    and reused without reading any document when the collection is unchanged."""
+    index_path = os.path.join(tempfile.mkdtemp(prefix="rag_bm25_"), "index_bm25.json")
+    try:
+        original = {"a": "Teams 建立投票", "b": "Outlook 自動回覆"}
+        BM25Index(persist_path=index_path).build(ListCollection(original), stamp="v1")
+
+        unchanged = ListCollection(original)
+        restarted = BM25Index(persist_path=index_path)
+        restarted.build(unchanged, stamp="v1")
+        cheap_hits = [hit[0] for hit in restarted.search("Teams 投票")]
+
+        # Chroma 有寫入但內容相同：讀取內容比對後沿用已存檔的索引
+        touched = ListCollection(original)
+        BM25Index(persist_path=index_path).build(touched, stamp="v2")
+        again = ListCollection(original)
+        BM25Index(persist_path=index_path).build(again, stamp="v2")
+
+        reloaded = BM25Index(persist_path=index_path)
+        reloaded.build(ListCollection({"a": "Planner 設定提醒", "b": "Outlook 自動回覆"}), stamp="v3")
+        stale = [hit[0] for hit in reloaded.search("Teams 投票")]
+        fresh = [hit[0] for hit in reloaded.search("Planner 提醒")]
+    finally:
+        shutil.rmtree(os.path.dirname(index_path), ignore_errors=True)
+    check(unchanged.document_reads == 0 and cheap_hits == ["a"],
+          f"unchanged collection loads the persisted BM25 index without reading documents ({unchanged.document_reads} read)", failures)
+    check(touched.document_reads == 2 and again.document_reads == 0,
+          "a new storage stamp re-reads the corpus once, then the index is keyed on it", failures)
+    check(not stale and fresh == ["a"], "re-ingested text under the same ids invalidates the persisted BM25 index", failures)
+
+
+def check_query_cache_bound(failures: list) -> None:
+    """The SQLite tier of the query-embedding cache keeps at most max_entries rows."""
+    cache_path = os.path.join(tempfile.mkdtemp(prefix="rag_query_cache_"), "query_embeddings.sqlite3")
+    try:
+        cache = CachedQueryEmbeddings(HashingEmbeddings(), EMBEDDING_MODEL, max_entries=16, persist_path=cache_path)
+        for i in range(100):
+            cache.embed_query(f"Teams 問題 {i}")
+        rows = cache._db.execute("SELECT COUNT(*) FROM query_embeddings").fetchone()[0]
+        cache._db.close()
+        reopened = CachedQueryEmbeddings(HashingEmbeddings(), EMBEDDING_MODEL, max_entries=16, persist_path=cache_path)
+        reopened.embed_query("Teams 問題 99")
+        newest_kept = reopened.disk_hits == 1
+        reopened._db.close()
+    finally:
+        shutil.rmtree(os.path.dirname(cache_path), ignore_errors=True)
+    check(rows == 16 and newest_kept, f"query-embedding SQLite tier bounded at max_entries ({rows} rows for 100 queries)", failures)
+
+
+async def run_checks(args, persist_directory: str) -> list:
+    """Concurrency regression checks; returns the failed ones."""
+    failures = []
+    await asyncio.to_thread(check_reload_race, persist_directory, failures)
+    await check_session_eviction(failures)
+    await check_hybrid_hang(failures)
+    await check_status_while_pinned(failures)
+    check_lexical_reingest(failures)
+    check_query_cache_bound(failures)
+    return failures
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Offline retrieval benchmark for the M365 RAG MCP server")
+    parser.add_argument("--sources", type=int, default=10, help="number of synthetic source documents")
+    parser.add_argument("--pages", type=int, default=40, help="pages per source document")
+    parser.add_argument("--queries", type=int, default=100, help="number of labeled queries to replay")
+    parser.add_argument("--k", type=int, default=4, help="documents retrieved per query")
+    parser.add_argument("--mode", choices=server.RETRIEVAL_MODES, default="vector")
+    parser.add_argument("--concurrency", default="1,4,16", help="comma-separated concurrent caller counts")
+    parser.add_argument("--rounds", type=int, default=3, help="replays of the query set per concurrency level")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--no-query-cache", action="store_true", help="disable the query-embedding cache")
+    parser.add_argument("--min-recall", type=float, default=None, help="fail if recall@k is below this value")
+    parser.add_argument("--max-p95-ms", type=float, default=None, help="fail if any p95 latency exceeds this value")
+    parser.add_argument("--checks", action="store_true", help="also run the concurrency regression checks")
+    parser.add_argument("--json", dest="json_path", default=None, help="also write the report to this file")
+    args = parser.parse_args()
+    args.concurrency = [int(n) for n in args.concurrency.split(",") if n.strip()]
+    return args
+
+
+def main():
+    args = parse_args()
+    texts, metadatas, args.labeled = build_corpus(args.sources, args.pages, args.queries, args.seed)
+
+    persist_directory = tempfile.mkdtemp(prefix="rag_benchmark_")
+    try:
+        Chroma.from_texts(
+            texts,
+            HashingEmbeddings(),
+            metadatas=metadatas,
+            persist_directory=persist_directory,
+            collection_name=COLLECTION_NAME,
+        )
+        install_fixture(persist_directory, use_query_cache=not args.no_query_cache)
+        report = asyncio.run(run_benchmark(args))
+        check_failures = asyncio.run(run_checks(args, persist_directory)) if args.checks else []
+    finally:
+        shutil.rmtree(persist_directory, ignore_errors=True)
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    failures = list(check_failures)
+    recall = report[f"recall@{args.k}"]
+    if args.min_recall is not None and recall < args.min_recall:
+        failures.append(f"recall@{args.k} {recall} < {args.min_recall}")
+    if args.max_p95_ms is not None:
+        for row in report["latency"]:
+            if row["p95_ms"] > args.max_p95_ms:
+                failures.append(f"{row['path']} p95 {row['p95_ms']}ms > {args.max_p95_ms}ms (concurrency={row['concurrency']})")
+    for failure in failures:
+        print(f"[benchmark] FAIL: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
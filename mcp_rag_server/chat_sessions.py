@@ -0,0 +1,179 @@
+"""
+Per-session chat history store for the M365 RAG Agent MCP Server.
+
+Every stored turn is resent to the LLM on the next question, so each session's
+history is trimmed to a token budget, idle sessions are evicted, and the total
+size of all histories is capped. Per-turn cost stays flat however long the
+server runs, and concurrent clients no longer share one conversation.
+"""
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+
+DEFAULT_SESSION_ID = "default"
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count: one per CJK character, one per four other characters."""
+    cjk = sum(1 for ch in text if "\u2e80" <= ch <= "\u9fff" or "\uf900" <= ch <= "\ufaff")
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+class ChatSession:
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.messages: list[BaseMessage] = []
+        self.token_counts: list[int] = []
+        self.tokens = 0
+        self.last_access = time.time()
+        # 同一個 session 的問題依序處理，避免兩個回合交錯寫入歷史
+        self.turn_lock = asyncio.Lock()
+        # 正在等待或執行回合的請求數；大於 0 時不會被淘汰
+        self.in_use = 0
+
+
+class ChatSessionStore:
+    """Bounded, session-keyed chat histories.
+
+    - `max_history_tokens`: per-session budget; the oldest turns are dropped first
+      (the latest turn is always kept).
+    - `idle_ttl_seconds`: sessions untouched for longer are evicted.
+    - `max_sessions` / `max_total_tokens`: memory ceiling across all sessions;
+      least recently used sessions are evicted first.
+    """
+
+    def __init__(
+        self,
+        max_history_tokens: int = 4000,
+        idle_ttl_seconds: float = 1800,
+        max_sessions: int = 256,
+        max_total_tokens: int = 200_000,
+    ):
+        self.max_history_tokens = max_history_tokens
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.max_sessions = max_sessions
+        self.max_total_tokens = max_total_tokens
+
+        self._lock = threading.Lock()
+        self._sessions: OrderedDict[str, ChatSession] = OrderedDict()
+        self._total_tokens = 0
+
+        self.truncated_turns = 0
+        self.evicted_idle = 0
+        self.evicted_for_memory = 0
+
+    def get(self, session_id: str) -> ChatSession:
+        """Return the session, creating it if needed, and mark it recently used."""
+        with self._lock:
+            return self._get_locked(session_id)
+
+    def _get_locked(self, session_id: str) -> ChatSession:
+        # caller must hold self._lock
+        self._evict_idle(time.time())
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = ChatSession(session_id)
+            self._sessions[session_id] = session
+            self._enforce_ceiling(keep=session_id)
+        self._sessions.move_to_end(session_id)
+        session.last_access = time.time()
+        return session
+
+    @asynccontextmanager
+    async def turn(self, session_id: str):
+        """Run one turn of the session, serialized with its other turns.
+
+        The session is marked in use before its lock is awaited, so it cannot be
+        evicted (and replaced by a new object with a different lock) while a
+        request is waiting for or running its turn.
+        """
+        with self._lock:
+            session = self._get_locked(session_id)
+            session.in_use += 1
+        try:
+            async with session.turn_lock:
+                yield session
+        finally:
+            with self._lock:
+                session.in_use -= 1
+                session.last_access = time.time()
+
+    def history(self, session_id: str) -> list[BaseMessage]:
+        return list(self.get(session_id).messages)
+
+    def append_turn(self, session_id: str, question: str, answer: str) -> None:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = ChatSession(session_id)
+                self._sessions[session_id] = session
+            self._sessions.move_to_end(session_id)
+            session.last_access = time.time()
+
+            for message in (HumanMessage(content=question), AIMessage(content=answer)):
+                count = estimate_tokens(message.content)
+                session.messages.append(message)
+                session.token_counts.append(count)
+                session.tokens += count
+                self._total_tokens += count
+
+            # 超過 token 預算時從最舊的回合開始丟棄，最新一回合一定保留
+            while session.tokens > self.max_history_tokens and len(session.messages) > 2:
+                for _ in range(2):
+                    session.messages.pop(0)
+                    count = session.token_counts.pop(0)
+                    session.tokens -= count
+                    self._total_tokens -= count
+                self.truncated_turns += 1
+
+            self._enforce_ceiling(keep=session_id)
+
+    def reset(self, session_id: str) -> None:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                self._total_tokens -= session.tokens
+                session.messages.clear()
+                session.token_counts.clear()
+                session.tokens = 0
+
+    def _evict_idle(self, now: float) -> None:
+        # caller must hold self._lock
+        for session_id, session in list(self._sessions.items()):
+            if now - session.last_access <= self.idle_ttl_seconds:
+                break  # OrderedDict 依最近使用排序，後面的都更新
+            if session.in_use:
+                continue
+            del self._sessions[session_id]
+            self._total_tokens -= session.tokens
+            self.evicted_idle += 1
+
+    def _enforce_ceiling(self, keep: str) -> None:
+        # caller must hold self._lock
+        for session_id in list(self._sessions):
+            if len(self._sessions) <= self.max_sessions and self._total_tokens <= self.max_total_tokens:
+                break
+            session = self._sessions[session_id]
+            if session_id == keep or session.in_use:
+                continue
+            del self._sessions[session_id]
+            self._total_tokens -= session.tokens
+            self.evicted_for_memory += 1
+
+    def stats(self) -> dict:
+        return {
+            "sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "total_tokens": self._total_tokens,
+            "max_total_tokens": self.max_total_tokens,
+            "max_history_tokens": self.max_history_tokens,
+            "idle_ttl_seconds": self.idle_ttl_seconds,
+            "truncated_turns": self.truncated_turns,
+            "evicted_idle": self.evicted_idle,
+            "evicted_for_memory": self.evicted_for_memory,
+        }
@@ -0,0 +1,258 @@
+"""
+Local BM25 lexical index over the Chroma documents.
+
+Many M365 questions hinge on exact product terms or menu labels that dense
+retrieval alone misses. The index is built from the documents already stored in
+the collection, persisted next to the Chroma directory, and needs no remote
+call, so it also answers on its own when the embedding service is slow or down.
+
+Reading every document is the slow part of a build, so the persisted index is
+first matched against a cheap collection key (chunk count, ids and Chroma's
+write sequence numbers); the corpus is only read when that key changed.
+"""
+
+import hashlib
+import json
+import math
+import os
+import re
+import sys
+import threading
+import time
+import unicodedata
+from collections import Counter
+
+_BATCH_SIZE = 5000
+_INDEX_VERSION = 3
+
+_LATIN_RE = re.compile(r"[a-z0-9]+(?:[._\-'][a-z0-9]+)*")
+_CJK_RUN_RE = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+")
+
+
+def tokenize(text: str) -> list[str]:
+    """Tokenize mixed Traditional Chinese / English text.
+
+    Latin words are kept whole; CJK runs become overlapping character bigrams
+    (single characters for one-character runs), which works well for Chinese
+    without a dictionary-based segmenter.
+    """
+    text = unicodedata.normalize("NFKC", text).lower()
+    tokens = _LATIN_RE.findall(text)
+    for run in _CJK_RUN_RE.findall(text):
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def default_index_path(persist_directory: str) -> str:
+    return os.path.normpath(persist_directory) + "_bm25.json"
+
+
+def _fingerprint(ids: list[str], documents: list[str], metadatas: list[dict]) -> str:
+    """Hash every chunk's id, text and metadata, so re-ingesting under the same ids is detected."""
+    digest = hashlib.sha1()
+    for chunk_id, document, metadata in sorted(zip(ids, documents, metadatas), key=lambda chunk: chunk[0]):
+        digest.update(chunk_id.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(hashlib.sha1((document or "").encode("utf-8")).digest())
+        digest.update(json.dumps(metadata, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def _collection_key(collection, stamp: str) -> str:
+    """Cheap identity of the collection contents: count, ids and the caller's storage stamp, no documents."""
+    digest = hashlib.sha1(f"{collection.count()}\0{stamp}\0".encode("utf-8"))
+    ids = []
+    offset = 0
+    while True:
+        batch_ids = collection.get(include=[], limit=_BATCH_SIZE, offset=offset).get("ids", [])
+        if not batch_ids:
+            break
+        ids.extend(batch_ids)
+        offset += len(batch_ids)
+    for chunk_id in sorted(ids):
+        digest.update(chunk_id.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def reciprocal_rank_fusion(ranked_lists: list[list], key, k: int = 60) -> list:
+    """Fuse several ranked result lists with reciprocal rank fusion.
+
+    `key(item)` identifies the same document across lists; the first occurrence
+    of each document is kept.
+    """
+    scores: dict = {}
+    items: dict = {}
+    for ranked in ranked_lists:
+        for rank, item in enumerate(ranked):
+            item_key = key(item)
+            scores[item_key] = scores.get(item_key, 0.0) + 1.0 / (k + rank + 1)
+            items.setdefault(item_key, item)
+    ordered = sorted(scores, key=scores.get, reverse=True)
+    return [items[item_key] for item_key in ordered]
+
+
+class BM25Index:
+    """Okapi BM25 over all documents of a Chroma collection."""
+
+    def __init__(self, persist_path: str | None = None, k1: float = 1.5, b: float = 0.75):
+        self.persist_path = persist_path
+        self.k1 = k1
+        self.b = b
+
+        self._lock = threading.Lock()
+        self._built = False
+        self._fingerprint = None
+        self._collection_key = None
+        self._ids: list[str] = []
+        self._documents: list[str] = []
+        self._metadatas: list[dict] = []
+        self._doc_lengths: list[int] = []
+        self._avg_length = 0.0
+        self._postings: dict[str, dict[int, int]] = {}
+
+        self.searches = 0
+
+    @property
+    def is_built(self) -> bool:
+        return self._built
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._built = False
+
+    def _index(self) -> None:
+        # caller must hold self._lock
+        self._doc_lengths = []
+        self._postings = {}
+        for doc_idx, text in enumerate(self._documents):
+            counts = Counter(tokenize(text or ""))
+            self._doc_lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self._postings.setdefault(term, {})[doc_idx] = tf
+        self._avg_length = (sum(self._doc_lengths) / len(self._doc_lengths)) if self._doc_lengths else 0.0
+
+    def _load(self, field: str, value: str) -> bool:
+        """Load the persisted index if its `field` ("collection_key" or "fingerprint") equals `value`."""
+        # caller must hold self._lock
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return False
+        try:
+            with open(self.persist_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"[詞彙索引]: 無法讀取 {self.persist_path} - {e}", file=sys.stderr)
+            return False
+        if data.get("version") != _INDEX_VERSION or data.get(field) != value:
+            return False
+        self._fingerprint = data["fingerprint"]
+        self._ids = data["ids"]
+        self._documents = data["documents"]
+        self._metadatas = data["metadatas"]
+        self._doc_lengths = data["doc_lengths"]
+        self._avg_length = data["avg_length"]
+        self._postings = {
+            term: {int(doc_idx): tf for doc_idx, tf in postings.items()}
+            for term, postings in data["postings"].items()
+        }
+        return True
+
+    def _save(self) -> None:
+        # caller must hold self._lock
+        if not self.persist_path:
+            return
+        data = {
+            "version": _INDEX_VERSION,
+            "fingerprint": self._fingerprint,
+            "collection_key": self._collection_key,
+            "ids": self._ids,
+            "documents": self._documents,
+            "metadatas": self._metadatas,
+            "doc_lengths": self._doc_lengths,
+            "avg_length": self._avg_length,
+            "postings": self._postings,
+        }
+        tmp_path = self.persist_path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.persist_path)
+        except OSError as e:
+            print(f"[詞彙索引]: 無法寫入 {self.persist_path} - {e}", file=sys.stderr)
+
+    def build(self, collection, stamp: str | None = None) -> None:
+        """Load the persisted index if it matches the collection, else rebuild it.
+
+        `stamp` must change whenever the collection is written to (see
+        `VectorStoreResources.storage_stamp`); with an unchanged count, ids and
+        stamp no document is read. Without a stamp the corpus is always read
+        and compared by content.
+        """
+        with self._lock:
+            started = time.perf_counter()
+            collection_key = _collection_key(collection, stamp) if stamp is not None else None
+            if self._built and collection_key is not None and collection_key == self._collection_key:
+                return
+            source = "載入"
+            if collection_key is None or not self._load("collection_key", collection_key):
+                ids, documents, metadatas = [], [], []
+                offset = 0
+                while True:
+                    batch = collection.get(include=["documents", "metadatas"], limit=_BATCH_SIZE, offset=offset)
+                    batch_ids = batch.get("ids", [])
+                    if not batch_ids:
+                        break
+                    ids.extend(batch_ids)
+                    documents.extend(batch.get("documents") or [])
+                    metadatas.extend(meta or {} for meta in (batch.get("metadatas") or []))
+                    offset += len(batch_ids)
+                fingerprint = _fingerprint(ids, documents, metadatas)
+                # Chroma 有寫入但內容相同時沿用記憶體中或已存檔的索引，只更新 collection key
+                if fingerprint != self._fingerprint and not self._load("fingerprint", fingerprint):
+                    self._ids, self._documents, self._metadatas = ids, documents, metadatas
+                    self._fingerprint = fingerprint
+                    self._index()
+                    source = "建立"
+                if source == "建立" or collection_key is not None:
+                    self._collection_key = collection_key
+                    self._save()
+            else:
+                self._collection_key = collection_key
+            self._built = True
+            print(
+                f"[詞彙索引]: BM25 索引已{source} "
+                f"({len(self._ids)} 個 chunk, {len(self._postings)} 個詞, {time.perf_counter() - started:.2f}s)",
+                file=sys.stderr,
+            )
+
+    def search(self, query: str, k: int = 4) -> list[tuple[str, str, dict, float]]:
+        """Return up to k (id, document, metadata, score) tuples, best first."""
+        with self._lock:
+            self.searches += 1
+            n_docs = len(self._ids)
+            if not n_docs:
+                return []
+            scores: dict[int, float] = {}
+            for term in set(tokenize(query)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_idx, tf in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self._doc_lengths[doc_idx] / (self._avg_length or 1))
+                    scores[doc_idx] = scores.get(doc_idx, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+            best = sorted(scores, key=scores.get, reverse=True)[:k]
+            return [(self._ids[i], self._documents[i], self._metadatas[i], scores[i]) for i in best]
+
+    def stats(self) -> dict:
+        return {
+            "built": self._built,
+            "documents": len(self._ids),
+            "terms": len(self._postings),
+            "persist_path": self.persist_path,
+            "searches": self.searches,
+        }
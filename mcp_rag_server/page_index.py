@@ -0,0 +1,167 @@
+"""
+In-memory page index and neighbor-page cache for get_page_context.
+
+The agent typically asks for the context of page N and then N+1, and each call
+used to run a metadata `where` scan over the collection. The index maps
+(source, page) to chunk ids once at startup, and every lookup also warms the
+surrounding pages into a bounded cache so follow-up lookups are memory hits.
+"""
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+_BATCH_SIZE = 5000
+
+
+def _page_key(value) -> int | None:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class PageIndex:
+    """(source, page) -> chunk ids index with a bounded LRU of page contents."""
+
+    def __init__(self, cache_pages: int = 256, prefetch_radius: int = 2, refresh_interval_seconds: float = 30):
+        self.cache_pages = cache_pages
+        self.prefetch_radius = prefetch_radius
+        self.refresh_interval_seconds = refresh_interval_seconds
+
+        self._lock = threading.RLock()
+        self._ids_by_page: dict[tuple[str, int], list[str]] = {}
+        self._known_ids: set[str] = set()
+        self._pages: OrderedDict[tuple[str, int], list[tuple[dict, str]]] = OrderedDict()
+        self._built = False
+        self._last_refresh = 0.0
+
+        self.hits = 0
+        self.misses = 0
+        self.prefetched = 0
+
+    def invalidate(self) -> None:
+        """Forget everything; the next lookup rebuilds from the collection."""
+        with self._lock:
+            self._ids_by_page.clear()
+            self._known_ids.clear()
+            self._pages.clear()
+            self._built = False
+
+    def _add(self, ids: list[str], metadatas: list[dict]) -> None:
+        # caller must hold self._lock
+        for chunk_id, meta in zip(ids, metadatas):
+            self._known_ids.add(chunk_id)
+            meta = meta or {}
+            page = _page_key(meta.get("page"))
+            source = meta.get("source")
+            if source is None or page is None:
+                continue
+            self._ids_by_page.setdefault((source, page), []).append(chunk_id)
+            # 該頁若已在快取中，內容已過期
+            self._pages.pop((source, page), None)
+
+    def rebuild(self, collection) -> None:
+        with self._lock:
+            started = time.perf_counter()
+            self.invalidate()
+            offset = 0
+            while True:
+                batch = collection.get(include=["metadatas"], limit=_BATCH_SIZE, offset=offset)
+                ids = batch.get("ids", [])
+                if not ids:
+                    break
+                self._add(ids, batch.get("metadatas") or [])
+                offset += len(ids)
+            self._built = True
+            self._last_refresh = time.time()
+            print(
+                f"[頁面索引]: 已建立 {len(self._ids_by_page)} 頁 / {len(self._known_ids)} 個 chunk 的索引 "
+                f"({time.perf_counter() - started:.2f}s)",
+                file=sys.stderr,
+            )
+
+    def refresh(self, collection) -> None:
+        """Incrementally add chunks that appeared since the last build/refresh."""
+        with self._lock:
+            if not self._built:
+                self.rebuild(collection)
+                return
+            self._last_refresh = time.time()
+            current_ids = collection.get(include=[]).get("ids", [])
+            if len(current_ids) < len(self._known_ids) or not self._known_ids.issubset(current_ids):
+                # 有 chunk 被刪除，增量更新無法處理，直接重建
+                self.rebuild(collection)
+                return
+            new_ids = [chunk_id for chunk_id in current_ids if chunk_id not in self._known_ids]
+            if new_ids:
+                batch = collection.get(ids=new_ids, include=["metadatas"])
+                self._add(batch.get("ids", []), batch.get("metadatas") or [])
+                print(f"[頁面索引]: 增量加入 {len(new_ids)} 個 chunk", file=sys.stderr)
+
+    def get_pages(self, collection, source: str, pages: list[int]) -> tuple[list, list]:
+        """Return (documents, metadatas) for the requested pages, sorted by page.
+
+        Pages within `prefetch_radius` of the requested ones are fetched in the
+        same collection call and kept in the cache.
+        """
+        with self._lock:
+            if not self._built:
+                self.rebuild(collection)
+
+            wanted = [(source, p) for p in pages]
+            if any(key not in self._ids_by_page for key in wanted) and (
+                time.time() - self._last_refresh >= self.refresh_interval_seconds
+            ):
+                self.refresh(collection)
+
+            indexed = [key for key in wanted if key in self._ids_by_page]
+            missing = [key for key in indexed if key not in self._pages]
+            self.hits += len(indexed) - len(missing)
+            self.misses += len(missing)
+
+            if missing:
+                to_fetch = set(missing)
+                for _, page in wanted:
+                    for neighbor in range(page - self.prefetch_radius, page + self.prefetch_radius + 1):
+                        key = (source, neighbor)
+                        if key in self._ids_by_page and key not in self._pages:
+                            to_fetch.add(key)
+                self.prefetched += len(to_fetch) - len(missing)
+
+                ids = [chunk_id for key in to_fetch for chunk_id in self._ids_by_page[key]]
+                results = collection.get(ids=ids, include=["documents", "metadatas"])
+                fetched = {key: [] for key in to_fetch}
+                for meta, doc in zip(results.get("metadatas") or [], results.get("documents") or []):
+                    key = (meta.get("source"), _page_key(meta.get("page")))
+                    if key in fetched:
+                        fetched[key].append((meta, doc))
+                for key, chunks in fetched.items():
+                    self._pages[key] = chunks
+                while len(self._pages) > self.cache_pages:
+                    self._pages.popitem(last=False)
+
+            chunks = []
+            for key in wanted:
+                if key in self._pages:
+                    self._pages.move_to_end(key)
+                    chunks.extend(self._pages[key])
+
+        chunks.sort(key=lambda item: item[0].get("page", 0))
+        return [doc for _, doc in chunks], [meta for meta, _ in chunks]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "built": self._built,
+            "indexed_pages": len(self._ids_by_page),
+            "indexed_chunks": len(self._known_ids),
+            "cached_pages": len(self._pages),
+            "max_cached_pages": self.cache_pages,
+            "prefetch_radius": self.prefetch_radius,
+            "hits": self.hits,
+            "misses": self.misses,
+            "prefetched_pages": self.prefetched,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+        }
@@ -0,0 +1,207 @@
+"""
+Query-embedding cache for the M365 RAG Agent MCP Server.
+
+Users ask the same questions repeatedly, and every retrieval otherwise pays for a
+remote embedding round-trip before Chroma even runs. Query vectors are kept in
+an in-memory LRU and, optionally, in an SQLite file next to the Chroma directory
+so they survive restarts; that file is capped at the same `max_entries`, oldest
+writes first. Entries are keyed on the embedding model name, so a
+model change never returns vectors from the old model.
+"""
+
+import inspect
+import os
+import re
+import sqlite3
+import sys
+import threading
+import unicodedata
+from array import array
+from collections import OrderedDict
+
+from langchain_core.embeddings import Embeddings
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    """Normalize a query so trivially different spellings share a cache entry."""
+    text = unicodedata.normalize("NFKC", text)
+    return _WHITESPACE_RE.sub(" ", text).strip().lower()
+
+
+def default_cache_path(persist_directory: str) -> str:
+    """Place the persistent tier next to (not inside) the Chroma directory."""
+    return os.path.normpath(persist_directory) + "_query_embeddings.sqlite3"
+
+
+def _accepts_task_type(embeddings: Embeddings) -> bool:
+    """Whether `embeddings.embed_documents` takes a `task_type` keyword (e.g. GoogleGenerativeAIEmbeddings)."""
+    try:
+        parameters = inspect.signature(embeddings.embed_documents).parameters
+    except (TypeError, ValueError):
+        return False
+    return "task_type" in parameters
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """`Embeddings` wrapper that caches `embed_query` results.
+
+    Document embeddings are passed through untouched; only query vectors are
+    cached since those are what repeat.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        model_name: str,
+        max_entries: int = 1024,
+        persist_path: str | None = None,
+    ):
+        self._embeddings = embeddings
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.persist_path = persist_path
+
+        self._lock = threading.Lock()
+        self._memory: OrderedDict[str, list[float]] = OrderedDict()
+        self._db: sqlite3.Connection | None = None
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        # 能否以一次 embed_documents(task_type="RETRIEVAL_QUERY") 批次產生查詢向量
+        self.supports_batch_queries = _accepts_task_type(embeddings)
+        if not self.supports_batch_queries:
+            print(
+                f"[快取]: {type(embeddings).__name__}.embed_documents 不支援 task_type，"
+                "批次查詢將逐筆呼叫 embed_query",
+                file=sys.stderr,
+            )
+
+        if persist_path:
+            try:
+                self._db = sqlite3.connect(persist_path, check_same_thread=False)
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS query_embeddings ("
+                    " model TEXT NOT NULL,"
+                    " query TEXT NOT NULL,"
+                    " vector BLOB NOT NULL,"
+                    " PRIMARY KEY (model, query))"
+                )
+                self._trim_db()
+                self._db.commit()
+            except sqlite3.Error as e:
+                print(f"[快取]: 無法開啟查詢向量快取檔案 {persist_path} - {e}", file=sys.stderr)
+                self._db = None
+
+    def _lookup(self, key: str) -> list[float] | None:
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return vector
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT vector FROM query_embeddings WHERE model = ? AND query = ?",
+                    (self.model_name, key),
+                ).fetchone()
+                if row is not None:
+                    vector = array("f", row[0]).tolist()
+                    self._remember(key, vector)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return vector
+
+            self.misses += 1
+            return None
+
+    def _remember(self, key: str, vector: list[float]) -> None:
+        # caller must hold self._lock
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _trim_db(self) -> None:
+        # caller must hold self._lock (or be __init__)
+        # INSERT OR REPLACE 會給新 rowid，因此 rowid 順序即寫入順序；超過上限時刪除最舊的資料列
+        self._db.execute(
+            "DELETE FROM query_embeddings WHERE rowid <= ("
+            " SELECT rowid FROM query_embeddings ORDER BY rowid DESC LIMIT 1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def _store(self, key: str, vector: list[float]) -> None:
+        with self._lock:
+            self._remember(key, vector)
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO query_embeddings (model, query, vector) VALUES (?, ?, ?)",
+                        (self.model_name, key, array("f", vector).tobytes()),
+                    )
+                    self._trim_db()
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    print(f"[快取]: 寫入查詢向量快取失敗 - {e}", file=sys.stderr)
+
+    def embed_query(self, text: str) -> list[float]:
+        key = normalize_query(text)
+        vector = self._lookup(key)
+        if vector is None:
+            vector = list(self._embeddings.embed_query(text))
+            self._store(key, vector)
+        return vector
+
+    def embed_queries(self, texts: list[str]) -> list[list[float]]:
+        """Embed several queries, sending all cache misses in one batched request."""
+        keys = [normalize_query(text) for text in texts]
+        vectors: dict[str, list[float]] = {}
+        misses: dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key in vectors or key in misses:
+                continue
+            vector = self._lookup(key)
+            if vector is None:
+                misses[key] = text
+            else:
+                vectors[key] = vector
+
+        if misses:
+            miss_texts = list(misses.values())
+            if self.supports_batch_queries:
+                fresh = self._embeddings.embed_documents(miss_texts, task_type="RETRIEVAL_QUERY")
+            else:
+                # embedding client 不支援指定 task_type 時，逐筆以 query 模式 embedding
+                fresh = [self._embeddings.embed_query(text) for text in miss_texts]
+            for key, vector in zip(misses, fresh):
+                vector = list(vector)
+                self._store(key, vector)
+                vectors[key] = vector
+
+        return [vectors[key] for key in keys]
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self._embeddings.embed_documents(texts)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "model": self.model_name,
+            "entries": len(self._memory),
+            "max_entries": self.max_entries,
+            "persist_path": self.persist_path if self._db is not None else None,
+            "batch_queries": self.supports_batch_queries,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+        }
@@ -9,16 +9,19 @@ using Retrieval Augmented Generation (RAG) capabilities.
 import asyncio
 import json
 import os
+import re
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from typing import Any, Sequence
 
 import yaml
 from dotenv import load_dotenv
 from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
-from langchain_community.vectorstores import Chroma
+from langchain_core.documents import Document
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain.agents import create_tool_calling_agent, AgentExecutor
-from langchain_core.messages import AIMessage, HumanMessage
 from langchain_core.tools import tool
 from pydantic import BaseModel, Field
 
@@ -38,6 +41,13 @@ from mcp.types import (
     LoggingLevel
 )
 
+from answer_cache import SemanticAnswerCache
+from chat_sessions import DEFAULT_SESSION_ID, ChatSessionStore
+from lexical_index import BM25Index, default_index_path, reciprocal_rank_fusion
+from page_index import PageIndex
+from query_cache import CachedQueryEmbeddings, default_cache_path
+from vector_resources import VectorStoreResources
+
 # Load environment variables
 load_dotenv()
 
@@ -50,10 +60,367 @@ LLM_MODEL = "gemini-2.5-flash"
 EMBEDDING_MODEL = yaml_data['model_config']['EMBEDDING_MODEL']
 CHROMA_DIRECTORY = yaml_data['chroma_config']['CHROMA_DIRECTORY']
 CHROMA_COLLECTION_NAME = yaml_data['chroma_config']['CHROMA_COLLECTION_NAME']
+CACHE_CONFIG = yaml_data.get('cache_config') or {}
+QUERY_EMBEDDING_CACHE_SIZE = CACHE_CONFIG.get('QUERY_EMBEDDING_CACHE_SIZE', 1024)
+QUERY_EMBEDDING_CACHE_PERSIST = CACHE_CONFIG.get('QUERY_EMBEDDING_CACHE_PERSIST', True)
+ANSWER_CACHE_ENABLED = CACHE_CONFIG.get('ANSWER_CACHE_ENABLED', True)
+ANSWER_CACHE_SIMILARITY_THRESHOLD = CACHE_CONFIG.get('ANSWER_CACHE_SIMILARITY_THRESHOLD', 0.95)
+ANSWER_CACHE_TTL_SECONDS = CACHE_CONFIG.get('ANSWER_CACHE_TTL_SECONDS', 3600)
+ANSWER_CACHE_MAX_ENTRIES = CACHE_CONFIG.get('ANSWER_CACHE_MAX_ENTRIES', 512)
+CONCURRENCY_CONFIG = yaml_data.get('concurrency_config') or {}
+BLOCKING_EXECUTOR_WORKERS = CONCURRENCY_CONFIG.get('BLOCKING_EXECUTOR_WORKERS', 8)
+LEXICAL_EXECUTOR_WORKERS = CONCURRENCY_CONFIG.get('LEXICAL_EXECUTOR_WORKERS', 2)
+AGENT_MAX_CONCURRENCY = CONCURRENCY_CONFIG.get('AGENT_MAX_CONCURRENCY', 4)
+CHAT_CONFIG = yaml_data.get('chat_history_config') or {}
+PAGE_INDEX_CONFIG = yaml_data.get('page_index_config') or {}
+RETRIEVAL_CONFIG = yaml_data.get('retrieval_config') or {}
+DEFAULT_RETRIEVAL_MODE = RETRIEVAL_CONFIG.get('DEFAULT_MODE', 'vector')
+HYBRID_CANDIDATES = RETRIEVAL_CONFIG.get('HYBRID_CANDIDATES', 10)
+RRF_K = RETRIEVAL_CONFIG.get('RRF_K', 60)
+VECTOR_SEARCH_TIMEOUT_SECONDS = RETRIEVAL_CONFIG.get('VECTOR_SEARCH_TIMEOUT_SECONDS', 5)
+LEXICAL_INDEX_PERSIST = RETRIEVAL_CONFIG.get('LEXICAL_INDEX_PERSIST', True)
+RETRIEVAL_MODES = ("vector", "hybrid", "lexical")
+BATCH_MAX_QUERIES = RETRIEVAL_CONFIG.get('BATCH_MAX_QUERIES', 64)
+MAX_K = RETRIEVAL_CONFIG.get('MAX_K', 50)
+STREAMING_CONFIG = yaml_data.get('streaming_config') or {}
+STREAM_FLUSH_CHARS = STREAMING_CONFIG.get('FLUSH_CHARS', 48)
 
 # Global agent executor
 agent_executor = None
-chat_history = []
+
+# Session-keyed chat histories with a per-session token budget and a global memory ceiling
+chat_sessions = ChatSessionStore(
+    max_history_tokens=CHAT_CONFIG.get('MAX_HISTORY_TOKENS', 4000),
+    idle_ttl_seconds=CHAT_CONFIG.get('SESSION_IDLE_TTL_SECONDS', 1800),
+    max_sessions=CHAT_CONFIG.get('MAX_SESSIONS', 256),
+    max_total_tokens=CHAT_CONFIG.get('MAX_TOTAL_TOKENS', 200000),
+)
+
+# Query-embedding cache, created together with the embedding client
+query_embedding_cache = None
+
+def build_cached_embeddings():
+    """Build the embedding client wrapped with the query-embedding cache (once)."""
+    global query_embedding_cache
+    if query_embedding_cache is None:
+        query_embedding_cache = CachedQueryEmbeddings(
+            GoogleGenerativeAIEmbeddings(model=EMBEDDING_MODEL),
+            model_name=EMBEDDING_MODEL,
+            max_entries=QUERY_EMBEDDING_CACHE_SIZE,
+            persist_path=default_cache_path(CHROMA_DIRECTORY) if QUERY_EMBEDDING_CACHE_PERSIST else None,
+        )
+    return query_embedding_cache
+
+# Process-wide embedding client and Chroma collection, shared by every tool
+vector_resources = VectorStoreResources(
+    persist_directory=CHROMA_DIRECTORY,
+    collection_name=CHROMA_COLLECTION_NAME,
+    embedding_model=EMBEDDING_MODEL,
+    embeddings_factory=build_cached_embeddings,
+)
+
+# Semantic answer cache for ask_m365_question, cleared whenever the collection is reloaded
+answer_cache = SemanticAnswerCache(
+    similarity_threshold=ANSWER_CACHE_SIMILARITY_THRESHOLD,
+    ttl_seconds=ANSWER_CACHE_TTL_SECONDS,
+    max_entries=ANSWER_CACHE_MAX_ENTRIES,
+) if ANSWER_CACHE_ENABLED else None
+if answer_cache:
+    vector_resources.add_reload_listener(answer_cache.invalidate)
+
+# (source, page) -> chunk ids index with neighbor-page prefetch, rebuilt after a reload
+page_index = PageIndex(
+    cache_pages=PAGE_INDEX_CONFIG.get('CACHE_PAGES', 256),
+    prefetch_radius=PAGE_INDEX_CONFIG.get('PREFETCH_RADIUS', 2),
+    refresh_interval_seconds=PAGE_INDEX_CONFIG.get('REFRESH_INTERVAL_SECONDS', 30),
+)
+vector_resources.add_reload_listener(page_index.invalidate)
+
+# Local BM25 index for hybrid / lexical retrieval, persisted next to CHROMA_DIRECTORY
+lexical_index = BM25Index(
+    persist_path=default_index_path(CHROMA_DIRECTORY) if LEXICAL_INDEX_PERSIST else None,
+)
+vector_resources.add_reload_listener(lexical_index.invalidate)
+
+# Bounded pool for the synchronous Chroma / embedding calls, so they never block the event loop
+blocking_executor = ThreadPoolExecutor(
+    max_workers=BLOCKING_EXECUTOR_WORKERS,
+    thread_name_prefix="rag-blocking",
+)
+
+# Separate pool for BM25 search: a hung embedding call can pin every blocking_executor
+# thread, and the hybrid fallback must not queue behind those threads
+lexical_executor = ThreadPoolExecutor(
+    max_workers=LEXICAL_EXECUTOR_WORKERS,
+    thread_name_prefix="rag-lexical",
+)
+
+class ExecutorCalls:
+    """Runs calls on a ThreadPoolExecutor and tracks how many are queued and running."""
+
+    def __init__(self, executor: ThreadPoolExecutor, max_workers: int):
+        self.executor = executor
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.max_queued = 0
+        self.completed = 0
+
+    def _call(self, func):
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+        try:
+            return func()
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+
+    def _done(self, future) -> None:
+        # 呼叫端取消時尚未開始執行的工作不會經過 _call
+        if future.cancelled():
+            with self._lock:
+                self.queued -= 1
+
+    async def run(self, func, *args, **kwargs):
+        with self._lock:
+            self.queued += 1
+            self.max_queued = max(self.max_queued, self.queued)
+        future = self.executor.submit(self._call, partial(func, *args, **kwargs))
+        future.add_done_callback(self._done)
+        return await asyncio.wrap_future(future)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "running": self.running,
+                "queued_calls": self.queued,
+                "max_queued_calls": self.max_queued,
+                "completed": self.completed,
+            }
+
+blocking_calls = ExecutorCalls(blocking_executor, BLOCKING_EXECUTOR_WORKERS)
+lexical_calls = ExecutorCalls(lexical_executor, LEXICAL_EXECUTOR_WORKERS)
+
+async def run_blocking(func, *args, **kwargs):
+    """Run a blocking call on the bounded executor and await its result."""
+    return await blocking_calls.run(func, *args, **kwargs)
+
+async def run_lexical(func, *args, **kwargs):
+    """Run a BM25 call on the lexical executor and await its result."""
+    return await lexical_calls.run(func, *args, **kwargs)
+
+class AgentRunLimiter:
+    """Caps the number of in-flight agent runs and tracks how many are queued."""
+
+    def __init__(self, max_concurrency: int):
+        self.max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.running = 0
+        self.waiting = 0
+        self.max_waiting = 0
+        self.completed = 0
+
+    async def __aenter__(self):
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.running += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.running -= 1
+        self.completed += 1
+        self._semaphore.release()
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "running": self.running,
+            "queue_depth": self.waiting,
+            "max_queue_depth": self.max_waiting,
+            "completed": self.completed,
+        }
+
+agent_limiter = AgentRunLimiter(AGENT_MAX_CONCURRENCY)
+
+def search_documents(query: str, k: int = 4) -> list:
+    """Vector search against the shared collection (blocking)."""
+    retriever = vector_resources.get_retriever(k=k)
+    return retriever.get_relevant_documents(query)
+
+def lexical_search_documents(query: str, k: int = 4) -> list:
+    """BM25 search over the local lexical index (blocking, no remote calls once built)."""
+    if not lexical_index.is_built:
+        lexical_index.build(vector_resources.get_collection(), vector_resources.storage_stamp())
+    return [
+        Document(page_content=content, metadata=metadata)
+        for _, content, metadata, _ in lexical_index.search(query, k=k)
+    ]
+
+def parse_k(arguments: dict, default: int = 4) -> int:
+    """Validate the `k` tool argument and clamp it to MAX_K."""
+    k = arguments.get("k")
+    if k is None:
+        return default
+    if isinstance(k, bool) or not isinstance(k, int) or k < 1:
+        raise ValueError(f"錯誤：k 必須是 1 到 {MAX_K} 之間的整數")
+    return min(k, MAX_K)
+
+def _document_key(doc) -> tuple:
+    return (doc.metadata.get('source'), doc.metadata.get('page'), doc.page_content)
+
+async def retrieve_documents(query: str, k: int = 4, mode: str = "vector") -> list:
+    """Retrieve documents with the given mode: vector, lexical, or hybrid (RRF fusion).
+
+    In hybrid mode a slow or failing vector search falls back to the lexical results.
+    BM25 runs on its own executor, so the fallback still answers when hung vector
+    searches occupy every blocking_executor thread.
+    """
+    if mode == "vector":
+        return await run_blocking(search_documents, query, k)
+    if mode == "lexical":
+        return await run_lexical(lexical_search_documents, query, k)
+
+    candidates = max(k, HYBRID_CANDIDATES)
+    lexical_task = asyncio.ensure_future(run_lexical(lexical_search_documents, query, candidates))
+    try:
+        vector_docs = await asyncio.wait_for(
+            run_blocking(search_documents, query, candidates),
+            timeout=VECTOR_SEARCH_TIMEOUT_SECONDS,
+        )
+    except Exception as e:
+        reason = "逾時" if isinstance(e, asyncio.TimeoutError) else str(e)
+        print(f"[混合檢索]: 向量檢索失敗（{reason}），改用詞彙檢索結果", file=sys.stderr)
+        vector_docs = []
+    lexical_docs = await lexical_task
+    fused = reciprocal_rank_fusion([vector_docs, lexical_docs], key=_document_key, k=RRF_K)
+    return fused[:k]
+
+def batch_search_documents(queries: list[str], k: int = 4) -> dict:
+    """Search many queries with one batched embedding call and one multi-query Chroma search (blocking).
+
+    Documents shared between queries are returned once, keyed by chunk id.
+    """
+    embeddings = vector_resources.get_embeddings()
+    if hasattr(embeddings, "embed_queries"):
+        vectors = embeddings.embed_queries(queries)
+    else:
+        vectors = [embeddings.embed_query(query) for query in queries]
+
+    results = vector_resources.get_collection().query(
+        query_embeddings=vectors,
+        n_results=k,
+        include=["documents", "metadatas", "distances"],
+    )
+
+    documents = {}
+    per_query = []
+    for i, query in enumerate(queries):
+        ids = results["ids"][i]
+        for chunk_id, content, metadata in zip(ids, results["documents"][i], results["metadatas"][i]):
+            if chunk_id not in documents:
+                documents[chunk_id] = {"metadata": metadata or {}, "content": content}
+        per_query.append({
+            "query": query,
+            "document_ids": ids,
+            "distances": results["distances"][i],
+        })
+    return {"results": per_query, "documents": documents}
+
+def fetch_page_documents(source: str, pages: list[int]) -> tuple[list, list]:
+    """Fetch the chunks of the given pages of one source (blocking).
+
+    Served from the page index, which also prefetches the neighboring pages.
+    Returns (documents, metadatas) sorted by page number.
+    """
+    return page_index.get_pages(vector_resources.get_collection(), source, pages)
+
+_SOURCE_RE = re.compile(r"Source: ([^,\n]*), Page: ([^,\n]*)")
+_SENTENCE_END = ("。", "！", "？", "；", ".", "!", "?", "\n")
+
+def _chunk_text(chunk) -> str:
+    """Extract the text of a streamed chat model chunk (str or list of content parts)."""
+    content = getattr(chunk, "content", "")
+    if isinstance(content, str):
+        return content
+    return "".join(
+        part.get("text", "") if isinstance(part, dict) else str(part)
+        for part in content
+    )
+
+async def run_agent_streaming(inputs: dict, progress_token) -> str:
+    """Run the agent and report its progress as MCP progress notifications.
+
+    Each notification message is a JSON object:
+    - {"type": "tool_start", "tool": ..., "input": ...}
+    - {"type": "documents", "tool": ..., "sources": [{"source": ..., "page": ...}]}
+    - {"type": "answer_delta", "text": ...}: answer text, flushed per sentence
+    - {"type": "answer_reset"}: text streamed so far was planning, not the answer
+    Returns the final answer.
+    """
+    ctx = server.request_context
+    progress = 0
+
+    async def notify(payload: dict):
+        nonlocal progress
+        progress += 1
+        await ctx.session.send_progress_notification(
+            progress_token,
+            progress,
+            message=json.dumps(payload, ensure_ascii=False),
+            related_request_id=ctx.request_id,
+        )
+
+    answer = None
+    streamed = []
+    buffer = ""
+    flushed = False
+    async for event in agent_executor.astream_events(inputs, version="v2"):
+        kind = event["event"]
+        if kind == "on_tool_start":
+            await notify({"type": "tool_start", "tool": event["name"], "input": event["data"].get("input")})
+        elif kind == "on_tool_end":
+            output = event["data"].get("output")
+            text = getattr(output, "content", output)
+            sources = [
+                {"source": source, "page": page}
+                for source, page in dict.fromkeys(_SOURCE_RE.findall(str(text)))
+            ]
+            await notify({"type": "documents", "tool": event["name"], "sources": sources})
+        elif kind == "on_chat_model_stream":
+            delta = _chunk_text(event["data"]["chunk"])
+            if not delta:
+                continue
+            buffer += delta
+            streamed.append(delta)
+            if len(buffer) >= STREAM_FLUSH_CHARS or buffer.endswith(_SENTENCE_END):
+                await notify({"type": "answer_delta", "text": buffer})
+                buffer = ""
+                flushed = True
+        elif kind == "on_chat_model_end":
+            message = event["data"].get("output")
+            if getattr(message, "tool_calls", None) and streamed:
+                # 這次 LLM 呼叫是規劃步驟（接著要呼叫工具），先前送出的文字不是最終答案
+                buffer = ""
+                streamed = []
+                if flushed:
+                    await notify({"type": "answer_reset"})
+                    flushed = False
+        elif kind == "on_chain_end" and not event.get("parent_ids"):
+            output = event["data"].get("output")
+            if isinstance(output, dict):
+                answer = output.get("output")
+
+    if buffer:
+        await notify({"type": "answer_delta", "text": buffer})
+    return answer if answer is not None else "".join(streamed)
 
 class PageContextArgs(BaseModel):
     source: str = Field(description="The source file name from the metadata")
@@ -71,19 +438,8 @@ def initialize_agent():
         """
         print(f"\n[工具執行]: internal_software_knowledge_retriever(query='{query}')", file=sys.stderr)
         
-        # 建立 embedding model
-        embeddings = GoogleGenerativeAIEmbeddings(model=EMBEDDING_MODEL)
-
-        # 連接到指定的 ChromaDB 資料庫和集合
-        vectorstore = Chroma(
-            persist_directory=CHROMA_DIRECTORY,
-            embedding_function=embeddings,
-            collection_name=CHROMA_COLLECTION_NAME
-        )
-        retriever = vectorstore.as_retriever(search_kwargs={"k": 4})
-
-        # 使用 retriever 取得相關文件
-        docs = retriever.get_relevant_documents(query)
+        # 使用共用的 ChromaDB collection 與 embedding model 取得相關文件
+        docs = search_documents(query, k=4)
 
         # 將文件列表格式化為包含 metadata 的單一字串
         formatted_docs = []
@@ -111,42 +467,19 @@ def initialize_agent():
         print(f"\n[工具執行]: get_specific_page_content(source='{source}', page={page})", file=sys.stderr)
 
         try:
-            # 從 LangChain 的 vectorstore 物件中，獲取底層的原生 collection
-            embeddings = GoogleGenerativeAIEmbeddings(model=EMBEDDING_MODEL)
-            vectorstore = Chroma(
-                persist_directory=CHROMA_DIRECTORY,
-                embedding_function=embeddings,
-                collection_name=CHROMA_COLLECTION_NAME
-            )
-            collection = vectorstore._collection
-
             # 定義要獲取的頁面範圍
             pages_to_fetch = [page - 1, page + 1]
             
             if not pages_to_fetch:
                 return f"錯誤：提供的頁碼 '{page}' 無效。"
 
-            # 建立 metadata 過濾條件
-            where_filter = {
-                "$and": [
-                    {"source": {"$eq": source}},
-                    {"page": {"$in": pages_to_fetch}}
-                ]
-            }
-
-            # 使用原生 collection 的 .get() 方法執行查詢
-            results = collection.get(where=where_filter)
-            
-            documents = results.get('documents', [])
-            metadatas = results.get('metadatas', [])
+            documents, metadatas = fetch_page_documents(source, pages_to_fetch)
 
             if not documents:
                 return f"錯誤：在 Chroma DB 的 '{source}' 中找不到頁碼為 {page} 及其相鄰頁面的內容。"
 
-            sorted_docs = sorted(zip(metadatas, documents), key=lambda item: item[0].get('page', 0))
-
             formatted_output = [f"[CONTEXT FOR source='{source}', page={page}]"]
-            for meta, content in sorted_docs:
+            for meta, content in zip(metadatas, documents):
                 source_val = meta.get('source', 'N/A')
                 page_val = meta.get('page', 'N/A')
                 header = f"--- [METADATA: source={source_val}, page={page_val}] ---"
@@ -179,6 +512,32 @@ def initialize_agent():
 
     return agent_executor
 
+async def collect_status() -> dict:
+    """Collect the state of the shared resources and caches for status reporting."""
+    vector_store = vector_resources.status()
+    # count() 會碰 Chroma，放到執行緒池；執行緒被卡住時仍回報其餘狀態
+    try:
+        vector_store["document_count"] = await asyncio.wait_for(
+            run_blocking(vector_resources.document_count), timeout=VECTOR_SEARCH_TIMEOUT_SECONDS
+        )
+    except asyncio.TimeoutError:
+        vector_store["document_count"] = None
+        vector_store["document_count_error"] = f"逾時（{VECTOR_SEARCH_TIMEOUT_SECONDS}s）"
+    except Exception as e:
+        vector_store["document_count"] = None
+        vector_store["last_error"] = str(e)
+    return {
+        "vector_store": vector_store,
+        "query_embedding_cache": query_embedding_cache.stats() if query_embedding_cache else None,
+        "answer_cache": answer_cache.stats() if answer_cache else None,
+        "agent_runs": agent_limiter.stats(),
+        "chat_sessions": chat_sessions.stats(),
+        "page_index": page_index.stats(),
+        "lexical_index": lexical_index.stats(),
+        "blocking_executor": blocking_calls.stats(),
+        "lexical_executor": lexical_calls.stats(),
+    }
+
 # Create the server instance
 server = Server("m365-rag-agent")
 
@@ -200,6 +559,15 @@ async def handle_list_tools() -> list:
                     "type": "boolean",
                     "description": "Whether to reset chat history before asking (default: False)",
                     "default": False
+                },
+                "session_id": {
+                    "type": "string",
+                    "description": "Conversation id; questions with the same session_id share chat history (default: a single shared session)"
+                },
+                "stream": {
+                    "type": "boolean",
+                    "description": "Stream tool activity, retrieved sources and answer text as progress notifications while the agent runs (requires a progress token; default: False)",
+                    "default": False
                 }
             },
             "required": ["question"]
@@ -215,6 +583,19 @@ async def handle_list_tools() -> list:
                 "query": {
                     "type": "string",
                     "description": "Search query for the knowledge base"
+                },
+                "mode": {
+                    "type": "string",
+                    "enum": list(RETRIEVAL_MODES),
+                    "description": "Retrieval mode: 'vector' (dense), 'lexical' (BM25, exact terms), or 'hybrid' (both, fused with reciprocal rank fusion)",
+                    "default": DEFAULT_RETRIEVAL_MODE
+                },
+                "k": {
+                    "type": "integer",
+                    "description": f"Number of documents to return (default: 4, at most {MAX_K})",
+                    "default": 4,
+                    "minimum": 1,
+                    "maximum": MAX_K
                 }
             },
             "required": ["query"]
@@ -240,8 +621,49 @@ async def handle_list_tools() -> list:
         }
     )
     
+    tool_batch = Tool(
+        name="batch_search_knowledge_base",
+        description="Search the internal knowledge base for many queries at once. Returns per-query document ids and distances plus the shared, deduplicated documents as JSON.",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "queries": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": f"Search queries for the knowledge base (at most {BATCH_MAX_QUERIES})"
+                },
+                "k": {
+                    "type": "integer",
+                    "description": f"Number of documents per query (default: 4, at most {MAX_K})",
+                    "default": 4,
+                    "minimum": 1,
+                    "maximum": MAX_K
+                }
+            },
+            "required": ["queries"]
+        }
+    )
+    
+    tool4 = Tool(
+        name="get_knowledge_base_status",
+        description="Report whether the knowledge base collection and embedding client are loaded (warm) or not yet opened (cold).",
+        inputSchema={
+            "type": "object",
+            "properties": {}
+        }
+    )
+    
+    tool5 = Tool(
+        name="reload_knowledge_base",
+        description="Reopen the knowledge base collection from disk. Use after the Chroma collection has been rebuilt.",
+        inputSchema={
+            "type": "object",
+            "properties": {}
+        }
+    )
+    
     # Create the tools list and return result
-    tools_list = [tool1, tool2, tool3]
+    tools_list = [tool1, tool2, tool_batch, tool3, tool4, tool5]
     try:
         tools_dict_list = [tool.model_dump() for tool in tools_list]
     except AttributeError:
@@ -251,7 +673,7 @@ async def handle_list_tools() -> list:
 @server.call_tool()
 async def handle_call_tool(name: str, arguments: dict | None) -> list:
     """Handle tool calls."""
-    global agent_executor, chat_history
+    global agent_executor
     
     if not agent_executor:
         agent_executor = initialize_agent()
@@ -259,39 +681,63 @@ async def handle_call_tool(name: str, arguments: dict | None) -> list:
     if name == "ask_m365_question":
         question = arguments.get("question", "")
         reset_chat = arguments.get("reset_chat", False)
-        
-        if reset_chat:
-            chat_history = []
+        session_id = arguments.get("session_id") or DEFAULT_SESSION_ID
+        meta = server.request_context.meta
+        progress_token = meta.progressToken if meta else None
+        stream = bool(arguments.get("stream", False)) and progress_token is not None
         
         if not question:
             raise ValueError("錯誤：請提供問題內容")
         
-        # Use the agent executor to get the answer
-        response = agent_executor.invoke(
-            {"input": question, "chat_history": chat_history}
-        )
-        answer = response.get('output', 'N/A')
-        
-        # Update chat history
-        chat_history.append(HumanMessage(content=question))
-        chat_history.append(AIMessage(content=answer))
+        async with chat_sessions.turn(session_id):
+            if reset_chat:
+                chat_sessions.reset(session_id)
+            chat_history = chat_sessions.history(session_id)
+            
+            # 沒有對話歷史時，相似問題可直接使用快取答案
+            question_vector = None
+            cached = None
+            if answer_cache and not chat_history:
+                question_vector = await run_blocking(lambda: vector_resources.get_embeddings().embed_query(question))
+                cached = answer_cache.lookup(question_vector)
+            
+            if cached:
+                print(f"[答案快取]: 命中 (similarity={cached['similarity']:.4f}) '{cached['question']}'", file=sys.stderr)
+                answer = cached["answer"]
+                if stream:
+                    await server.request_context.session.send_progress_notification(
+                        progress_token, 1,
+                        message=json.dumps({"type": "answer_delta", "text": answer}, ensure_ascii=False),
+                        related_request_id=server.request_context.request_id,
+                    )
+            else:
+                # Use the agent executor to get the answer; runs are capped by agent_limiter
+                inputs = {"input": question, "chat_history": chat_history}
+                async with agent_limiter:
+                    if stream:
+                        answer = await run_agent_streaming(inputs, progress_token) or 'N/A'
+                    else:
+                        response = await agent_executor.ainvoke(inputs)
+                        answer = response.get('output', 'N/A')
+                if question_vector is not None:
+                    answer_cache.store(question_vector, question, answer)
+            
+            # Update chat history (trimmed to the session's token budget)
+            chat_sessions.append_turn(session_id, question, answer)
         
         return [{"type": "text", "text": answer}]
         
     elif name == "search_knowledge_base":
         query = arguments.get("query", "")
+        mode = arguments.get("mode") or DEFAULT_RETRIEVAL_MODE
+        k = parse_k(arguments)
         if not query:
             raise ValueError("錯誤：請提供查詢內容")
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"錯誤：不支援的檢索模式 '{mode}'，可用模式: {', '.join(RETRIEVAL_MODES)}")
         
         # Direct search in knowledge base
-        embeddings = GoogleGenerativeAIEmbeddings(model=EMBEDDING_MODEL)
-        vectorstore = Chroma(
-            persist_directory=CHROMA_DIRECTORY,
-            embedding_function=embeddings,
-            collection_name=CHROMA_COLLECTION_NAME
-        )
-        retriever = vectorstore.as_retriever(search_kwargs={"k": 4})
-        docs = retriever.get_relevant_documents(query)
+        docs = await retrieve_documents(query, k, mode)
         
         # Format results
         formatted_docs = []
@@ -309,6 +755,17 @@ async def handle_call_tool(name: str, arguments: dict | None) -> list:
         result = "\n".join(formatted_docs)
         return [{"type": "text", "text": result}]
         
+    elif name == "batch_search_knowledge_base":
+        queries = [query for query in (arguments.get("queries") or []) if isinstance(query, str) and query.strip()]
+        k = parse_k(arguments)
+        if not queries:
+            raise ValueError("錯誤：請提供查詢內容")
+        if len(queries) > BATCH_MAX_QUERIES:
+            raise ValueError(f"錯誤：一次最多 {BATCH_MAX_QUERIES} 個查詢")
+        
+        result = await run_blocking(batch_search_documents, queries, k)
+        return [{"type": "text", "text": json.dumps(result, ensure_ascii=False)}]
+        
     elif name == "get_page_context":
         source = arguments.get("source", "")
         page = arguments.get("page", 0)
@@ -316,33 +773,14 @@ async def handle_call_tool(name: str, arguments: dict | None) -> list:
         if not source or not page:
             raise ValueError("錯誤：請提供來源檔案名稱和頁碼")
         
-        embeddings = GoogleGenerativeAIEmbeddings(model=EMBEDDING_MODEL)
-        vectorstore = Chroma(
-            persist_directory=CHROMA_DIRECTORY,
-            embedding_function=embeddings,
-            collection_name=CHROMA_COLLECTION_NAME
-        )
-        collection = vectorstore._collection
-        
         pages_to_fetch = [page - 1, page + 1]
-        where_filter = {
-            "$and": [
-                {"source": {"$eq": source}},
-                {"page": {"$in": pages_to_fetch}}
-            ]
-        }
-        
-        results = collection.get(where=where_filter)
-        documents = results.get('documents', [])
-        metadatas = results.get('metadatas', [])
+        documents, metadatas = await run_blocking(fetch_page_documents, source, pages_to_fetch)
         
         if not documents:
             raise ValueError(f"找不到 {source} 頁碼 {page} 的相關內容")
         
-        sorted_docs = sorted(zip(metadatas, documents), key=lambda item: item[0].get('page', 0))
-        
         formatted_output = [f"[CONTEXT FOR source='{source}', page={page}]"]
-        for meta, content in sorted_docs:
+        for meta, content in zip(metadatas, documents):
             source_val = meta.get('source', 'N/A')
             page_val = meta.get('page', 'N/A')
             header = f"--- [METADATA: source={source_val}, page={page_val}] ---"
@@ -351,6 +789,13 @@ async def handle_call_tool(name: str, arguments: dict | None) -> list:
         result = "\n".join(formatted_output)
         return [{"type": "text", "text": result}]
     
+    elif name == "get_knowledge_base_status":
+        return [{"type": "text", "text": json.dumps(await collect_status(), ensure_ascii=False, indent=2)}]
+    
+    elif name == "reload_knowledge_base":
+        await run_blocking(vector_resources.reload)
+        return [{"type": "text", "text": json.dumps(await collect_status(), ensure_ascii=False, indent=2)}]
+    
     else:
         raise ValueError(f"未知工具: {name}")
 
@@ -361,6 +806,17 @@ async def main():
     # Initialize the agent on startup
     initialize_agent()
     
+    # LangChain runs synchronous tools on the loop's default executor; keep those bounded too
+    asyncio.get_running_loop().set_default_executor(blocking_executor)
+    
+    # Open the Chroma collection and embedding client once, before the first request
+    try:
+        await run_blocking(vector_resources.warm_up)
+        await run_blocking(lambda: page_index.rebuild(vector_resources.get_collection()))
+        await run_blocking(lambda: lexical_index.build(vector_resources.get_collection(), vector_resources.storage_stamp()))
+    except Exception as e:
+        print(f"[資源載入]: 啟動時無法開啟知識庫，將於第一次查詢時重試 - {e}", file=sys.stderr)
+    
     async with stdio_server() as (read_stream, write_stream):
         await server.run(
             read_stream,
@@ -0,0 +1,169 @@
+"""
+Process-wide vector store resources for the M365 RAG Agent MCP Server.
+
+Opening the persistent Chroma collection (SQLite + HNSW index) and building the
+embedding client are the most expensive parts of a knowledge base lookup, so
+they are created once and shared by every tool instead of per request.
+"""
+
+import os
+import sqlite3
+import sys
+import threading
+import time
+from typing import Any, Callable
+
+from langchain_community.vectorstores import Chroma
+from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+
+class VectorStoreResources:
+    """Long-lived embedding client and Chroma collection shared across tool calls.
+
+    All accessors are safe to call from concurrent MCP requests (and from worker
+    threads); the first caller opens the resources and everyone else reuses them.
+    Call `reload()` after the collection has been rebuilt on disk.
+    """
+
+    def __init__(
+        self,
+        persist_directory: str,
+        collection_name: str,
+        embedding_model: str,
+        embeddings_factory: Callable[[], Any] | None = None,
+    ):
+        self.persist_directory = persist_directory
+        self.collection_name = collection_name
+        self.embedding_model = embedding_model
+        self._embeddings_factory = embeddings_factory or (
+            lambda: GoogleGenerativeAIEmbeddings(model=embedding_model)
+        )
+
+        self._lock = threading.RLock()
+        self._embeddings = None
+        self._vectorstore = None
+        self._reload_listeners: list[Callable[[], None]] = []
+
+        # generation 每次 reload 加一，供快取判斷 collection 是否已更換
+        self.generation = 0
+        self.loaded_at: float | None = None
+        self.load_seconds: float | None = None
+        self.last_error: str | None = None
+
+    @property
+    def is_warm(self) -> bool:
+        return self._vectorstore is not None
+
+    def warm_up(self) -> tuple[Any, Chroma]:
+        """Open the embedding client and the collection if they are not open yet.
+
+        Returns the (embeddings, vectorstore) pair read under the lock, so a
+        concurrent `reload()` cannot hand the caller a half-cleared state.
+        """
+        with self._lock:
+            if self._vectorstore is not None:
+                return self._embeddings, self._vectorstore
+            started = time.perf_counter()
+            try:
+                embeddings = self._embeddings_factory()
+                vectorstore = Chroma(
+                    persist_directory=self.persist_directory,
+                    embedding_function=embeddings,
+                    collection_name=self.collection_name,
+                )
+                # 觸發實際開啟 SQLite / HNSW index，避免第一個請求承擔延遲
+                vectorstore._collection.count()
+            except Exception as e:
+                self.last_error = str(e)
+                raise
+            self._embeddings = embeddings
+            self._vectorstore = vectorstore
+            self.loaded_at = time.time()
+            self.load_seconds = time.perf_counter() - started
+            self.last_error = None
+            print(
+                f"[資源載入]: Chroma collection '{self.collection_name}' 已開啟 "
+                f"({self.load_seconds:.2f}s, generation={self.generation})",
+                file=sys.stderr,
+            )
+            return embeddings, vectorstore
+
+    def get_embeddings(self):
+        return self.warm_up()[0]
+
+    def get_vectorstore(self) -> Chroma:
+        return self.warm_up()[1]
+
+    def get_collection(self):
+        return self.get_vectorstore()._collection
+
+    def get_retriever(self, k: int = 4):
+        return self.get_vectorstore().as_retriever(search_kwargs={"k": k})
+
+    def storage_stamp(self) -> str | None:
+        """Chroma's per-segment write sequence numbers, which advance on every add/update/delete.
+
+        Read straight from chroma.sqlite3 (read-only); returns None when the
+        file or table is not available, e.g. with another Chroma version.
+        """
+        path = os.path.join(self.persist_directory, "chroma.sqlite3")
+        if not os.path.exists(path):
+            return None
+        try:
+            db = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+            try:
+                rows = db.execute("SELECT segment_id, seq_id FROM max_seq_id ORDER BY segment_id").fetchall()
+            finally:
+                db.close()
+        except sqlite3.Error as e:
+            print(f"[資源載入]: 無法讀取 Chroma 寫入序號 - {e}", file=sys.stderr)
+            return None
+        return ",".join(f"{segment_id}:{seq_id}" for segment_id, seq_id in rows)
+
+    def add_reload_listener(self, listener: Callable[[], None]) -> None:
+        """Register a callback invoked after every successful `reload()`."""
+        self._reload_listeners.append(listener)
+
+    def reload(self) -> None:
+        """Drop the open collection and reopen it from `persist_directory`.
+
+        Requests already holding the old vectorstore finish against it; new
+        requests see the rebuilt collection.
+        """
+        with self._lock:
+            self._vectorstore = None
+            self._embeddings = None
+            self.generation += 1
+            try:
+                # Chroma 以路徑快取 client，重建後必須清除才會讀到新的檔案
+                from chromadb.api.client import SharedSystemClient
+                SharedSystemClient.clear_system_cache()
+            except Exception as e:
+                print(f"[資源載入]: 無法清除 Chroma client 快取 - {e}", file=sys.stderr)
+            self.warm_up()
+
+        for listener in self._reload_listeners:
+            try:
+                listener()
+            except Exception as e:
+                print(f"[資源載入]: reload listener 執行失敗 - {e}", file=sys.stderr)
+
+    def document_count(self) -> int | None:
+        """Chunk count of the open collection (blocking; run it off the event loop), None while cold."""
+        vectorstore = self._vectorstore
+        if vectorstore is None:
+            return None
+        return vectorstore._collection.count()
+
+    def status(self) -> dict:
+        """Return a JSON-serialisable summary of the resource state (no Chroma call; see `document_count`)."""
+        return {
+            "state": "warm" if self.is_warm else "cold",
+            "collection_name": self.collection_name,
+            "persist_directory": self.persist_directory,
+            "embedding_model": self.embedding_model,
+            "generation": self.generation,
+            "loaded_at": self.loaded_at,
+            "load_seconds": self.load_seconds,
+            "last_error": self.last_error,
+        }